@@ -18,8 +18,17 @@ export default function ExploreScreen() {
 
   const fetchBooks = async () => {
     try {
-      const response = await api.get("/books");
-      setGroupedBooks(response.data);
+      // O catálogo é paginado: segue o header x-next-cursor até à última página
+      const merged: Record<string, any[]> = {};
+      let after: string | undefined;
+      do {
+        const response = await api.get("/books", { params: { after } });
+        for (const [municipality, books] of Object.entries<any[]>(response.data)) {
+          merged[municipality] = [...(merged[municipality] || []), ...books];
+        }
+        after = response.headers["x-next-cursor"];
+      } while (after);
+      setGroupedBooks(merged);
     } catch (error) {
       console.error("Error fetching books:", error);
     } finally {
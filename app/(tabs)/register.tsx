@@ -1,3 +1,4 @@
+import { fetchAllPages } from "@/hooks/fetch-all-pages";
 import api from "@/hooks/use-api";
 import { useUser } from "@/hooks/use-user";
 import { useEffect, useState } from "react";
@@ -11,7 +12,7 @@ export default function RegisterScreen() {
   const [country, setCountry] = useState("");
   const [genres, setGenres] = useState("");
   const [isLoginMode, setIsLoginMode] = useState(true); // Start with login mode
-  const [myBooks, setMyBooks] = useState([]);
+  const [myBooks, setMyBooks] = useState<any[]>([]);
   const [booksLoading, setBooksLoading] = useState(false);
   const { login, user, logout } = useUser();
 
@@ -27,9 +28,9 @@ export default function RegisterScreen() {
     setBooksLoading(true);
     try {
       console.log("Fetching books for user ID:", user.id);
-      const response = await api.get(`/users/${user.id}/books`);
-      console.log("Books fetched:", response.data);
-      setMyBooks(response.data);
+      const books = await fetchAllPages(`/users/${user.id}/books`);
+      console.log("Books fetched:", books);
+      setMyBooks(books);
     } catch (error: any) {
       console.error("Error fetching user books:", error);
       if (error.response) {
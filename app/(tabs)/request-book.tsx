@@ -1,3 +1,4 @@
+import { fetchAllPages } from "@/hooks/fetch-all-pages";
 import api from "@/hooks/use-api";
 import { useUser } from "@/hooks/use-user";
 import { router } from "expo-router";
@@ -100,9 +101,9 @@ export default function RequestBookScreen() {
 
   const fetchMyRequests = async () => {
     try {
-      const response = await api.get(`/users/${user?.id}/outgoing-requests`);
-      console.log("Outgoing requests for user", user?.id, ":", response.data);
-      setRequests(response.data);
+      const requests = await fetchAllPages(`/users/${user?.id}/outgoing-requests`);
+      console.log("Outgoing requests for user", user?.id, ":", requests);
+      setRequests(requests);
     } catch (error) {
       console.error("Error fetching requests:", error);
     } finally {
@@ -112,9 +113,9 @@ export default function RequestBookScreen() {
 
   const fetchIncomingRequests = async () => {
     try {
-      const response = await api.get(`/users/${user?.id}/incoming-requests`);
-      setIncomingRequests(response.data);
-      console.log("Incoming requests:", response.data);
+      const requests = await fetchAllPages(`/users/${user?.id}/incoming-requests`);
+      setIncomingRequests(requests);
+      console.log("Incoming requests:", requests);
     } catch (error) {
       console.error("Error fetching incoming requests:", error);
     }
@@ -122,9 +123,9 @@ export default function RequestBookScreen() {
 
   const fetchMyBooks = async () => {
     try {
-      const response = await api.get(`/users/${user?.id}/books`);
-      setMyBooks(response.data);
-      console.log("My books:", response.data);
+      const books = await fetchAllPages(`/users/${user?.id}/books`);
+      setMyBooks(books);
+      console.log("My books:", books);
     } catch (error) {
       console.error("Error fetching my books:", error);
     }
@@ -132,9 +133,9 @@ export default function RequestBookScreen() {
 
   const fetchTransferredBooks = async () => {
     try {
-      const response = await api.get(`/users/${user?.id}/transferred-books`);
-      setTransferredBooks(response.data);
-      console.log("Transferred books:", response.data);
+      const books = await fetchAllPages(`/users/${user?.id}/transferred-books`);
+      setTransferredBooks(books);
+      console.log("Transferred books:", books);
     } catch (error) {
       console.error("Error fetching transferred books:", error);
     }
@@ -2,7 +2,7 @@ import { ThemedText } from "@/components/themed-text";
 import { ThemedView } from "@/components/themed-view";
 import api from "@/hooks/use-api";
 import { useLocalSearchParams } from "expo-router";
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { ScrollView, StyleSheet, TextInput, TouchableOpacity, View } from "react-native";
 
 export default function RequestChatScreen() {
@@ -10,20 +10,60 @@ export default function RequestChatScreen() {
   const [messages, setMessages] = useState<any[]>([]);
   const [newMessage, setNewMessage] = useState("");
   const [loading, setLoading] = useState(true);
+  // Último id lido pelo GET: os pedidos seguintes só trazem mensagens mais
+  // recentes. As do WebSocket não o avançam, porque o fan-out é por worker e
+  // pode faltar uma mensagem anterior criada noutro worker.
+  const lastFetchedId = useRef<number | undefined>(undefined);
+
+  const mergeMessages = (incoming: any[]) => {
+    if (incoming.length === 0) return;
+    setMessages((current) => {
+      const known = new Set(current.map((m) => m.id));
+      return [...current, ...incoming.filter((m) => !known.has(m.id))].sort((a, b) => a.id - b.id);
+    });
+  };
 
   useEffect(() => {
-    fetchMessages();
+    lastFetchedId.current = undefined;
+    setMessages([]);
 
-    // Polling: atualiza mensagens a cada 5 segundos
-    const interval = setInterval(fetchMessages, 5000);
+    // Mensagens novas chegam pelo WebSocket; o histórico é lido depois de o
+    // socket abrir e, enquanto está aberto, a cada 30 segundos (mensagens
+    // criadas noutro worker). Se a ligação falhar, o polling passa a 5 segundos.
+    let interval: ReturnType<typeof setInterval> | undefined;
+    const poll = (ms: number) => {
+      if (interval) clearInterval(interval);
+      interval = setInterval(fetchMessages, ms);
+    };
+    const wsUrl = `${String(api.defaults.baseURL).replace(/^http/, "ws")}/requests/${requestId}/ws`;
+    const socket = new WebSocket(wsUrl);
 
-    return () => clearInterval(interval);
+    socket.onopen = () => {
+      fetchMessages();
+      poll(30000);
+    };
+    socket.onmessage = (event) => mergeMessages([JSON.parse(event.data)]);
+    socket.onclose = () => {
+      fetchMessages();
+      poll(5000);
+    };
+
+    return () => {
+      socket.onclose = null;
+      socket.close();
+      if (interval) clearInterval(interval);
+    };
   }, [requestId]);
 
   const fetchMessages = async () => {
     try {
-      const response = await api.get(`/requests/${requestId}/messages`);
-      setMessages(response.data);
+      const response = await api.get(`/requests/${requestId}/messages`, {
+        params: { since_id: lastFetchedId.current },
+      });
+      if (response.data.length > 0) {
+        lastFetchedId.current = Math.max(lastFetchedId.current ?? 0, ...response.data.map((m: any) => m.id));
+      }
+      mergeMessages(response.data);
     } catch (error) {
       console.error("Error fetching messages:", error);
     } finally {
@@ -43,7 +83,8 @@ export default function RequestChatScreen() {
       });
 
       setNewMessage("");
-      fetchMessages(); // Atualiza as mensagens
+      // Traz a mensagem enviada e as que faltem de outros workers
+      fetchMessages();
     } catch (error) {
       console.error("Error sending message:", error);
     }
@@ -0,0 +1,9 @@
+-- Migration to add full-text search over books (GET /books/search)
+-- The expression must match crud._book_tsvector() exactly for the planner to use
+-- the GIN index
+
+CREATE INDEX IF NOT EXISTS ix_books_search ON books USING GIN ((
+    setweight(to_tsvector('simple'::regconfig, coalesce(title, '')), 'A'::"char") ||
+    setweight(to_tsvector('simple'::regconfig, coalesce(author, '')), 'B'::"char") ||
+    setweight(to_tsvector('simple'::regconfig, replace(coalesce(isbn, ''), '-', '')), 'A'::"char")
+));
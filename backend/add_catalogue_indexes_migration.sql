@@ -0,0 +1,6 @@
+-- Migration to speed up the /books catalogue query
+-- The catalogue is fetched in a single join of copies and books, filtered and
+-- ordered by the copy location (municipio)
+
+CREATE INDEX IF NOT EXISTS ix_copies_location ON copies (location);
+CREATE INDEX IF NOT EXISTS ix_copies_book_id ON copies (book_id);
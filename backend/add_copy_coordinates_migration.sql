@@ -0,0 +1,14 @@
+-- Migration to add coordinates to copies for /books/nearby
+-- geohash is computed by the backend from latitude/longitude; the btree index on
+-- it answers the nearby search as a handful of prefix range scans
+
+ALTER TABLE copies ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION;
+ALTER TABLE copies ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION;
+ALTER TABLE copies ADD COLUMN IF NOT EXISTS geohash VARCHAR(12);
+
+CREATE INDEX IF NOT EXISTS ix_copies_geohash ON copies (geohash);
+
+-- Optional: PostGIS (run only if the extension is available, then set USE_POSTGIS=1)
+-- CREATE EXTENSION IF NOT EXISTS postgis;
+-- CREATE INDEX IF NOT EXISTS ix_copies_geography
+--     ON copies USING GIST (geography(ST_MakePoint(longitude, latitude)));
@@ -0,0 +1,34 @@
+-- Migration to add the ownership-transfer ledger
+-- confirm_delivery appends one row per transfer; history is read by copy
+-- (provenance) and by user (given/received), both through the indexes below
+
+CREATE TABLE IF NOT EXISTS copy_transfers (
+    id SERIAL PRIMARY KEY,
+    copy_id INTEGER NOT NULL REFERENCES copies(id),
+    request_id INTEGER REFERENCES requests(id),
+    from_user_id INTEGER REFERENCES users(id),
+    to_user_id INTEGER NOT NULL REFERENCES users(id),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ix_copy_transfers_id ON copy_transfers (id);
+CREATE INDEX IF NOT EXISTS ix_copy_transfers_copy_id_id ON copy_transfers (copy_id, id);
+CREATE INDEX IF NOT EXISTS ix_copy_transfers_from_user_id_id ON copy_transfers (from_user_id, id);
+CREATE INDEX IF NOT EXISTS ix_copy_transfers_to_user_id_id ON copy_transfers (to_user_id, id);
+
+-- Backfill from completed requests: each hop goes from the previous receiver
+-- (or the original owner, for the first hop) to the requester
+INSERT INTO copy_transfers (copy_id, request_id, from_user_id, to_user_id, created_at)
+SELECT r.copy_id,
+       r.id,
+       COALESCE(
+           LAG(r.requester_id) OVER (PARTITION BY r.copy_id ORDER BY COALESCE(r.updated_at, r.created_at), r.id),
+           c.original_owner_id
+       ),
+       r.requester_id,
+       COALESCE(r.updated_at, r.created_at)
+FROM requests r
+JOIN copies c ON c.id = r.copy_id
+WHERE r.status = 'COMPLETED'
+  AND NOT EXISTS (SELECT 1 FROM copy_transfers t WHERE t.request_id = r.id)
+ORDER BY COALESCE(r.updated_at, r.created_at), r.id;
@@ -0,0 +1,6 @@
+-- Migration to speed up /users/{user_id}/incoming-requests
+-- Incoming requests are fetched in a single join copies -> requests -> users -> books,
+-- filtered by the copy owner and optionally by the request status
+
+CREATE INDEX IF NOT EXISTS ix_copies_owner_id ON copies (owner_id);
+CREATE INDEX IF NOT EXISTS ix_requests_copy_id_status ON requests (copy_id, status);
@@ -0,0 +1,5 @@
+-- Migration to speed up chat message reads
+-- Messages are fetched per request ordered by id, and polling clients only ask
+-- for the ones after the last id they have (since_id)
+
+CREATE INDEX IF NOT EXISTS ix_messages_request_id_id ON messages (request_id, id);
@@ -0,0 +1,30 @@
+-- Migration to add the email outbox (background notification queue)
+-- Jobs are written in the same transaction as the mutation that triggers them
+-- and sent by the in-process worker (app/outbox.py)
+
+DO $$
+BEGIN
+    CREATE TYPE outboxstatus AS ENUM ('PENDING', 'SENT', 'FAILED');
+EXCEPTION
+    WHEN duplicate_object THEN
+        RAISE NOTICE 'Type outboxstatus already exists';
+END $$;
+
+CREATE TABLE IF NOT EXISTS outbox_jobs (
+    id SERIAL PRIMARY KEY,
+    kind VARCHAR NOT NULL DEFAULT 'email',
+    recipient VARCHAR NOT NULL,
+    subject VARCHAR NOT NULL,
+    body VARCHAR NOT NULL,
+    status outboxstatus NOT NULL DEFAULT 'PENDING',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    last_error VARCHAR,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    sent_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS ix_outbox_jobs_id ON outbox_jobs (id);
+CREATE INDEX IF NOT EXISTS ix_outbox_jobs_recipient ON outbox_jobs (recipient);
+-- The worker claims due jobs with: WHERE status = 'PENDING' AND next_attempt_at <= now()
+CREATE INDEX IF NOT EXISTS ix_outbox_jobs_status_next_attempt_at ON outbox_jobs (status, next_attempt_at);
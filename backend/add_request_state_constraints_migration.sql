@@ -0,0 +1,11 @@
+-- Migration for the concurrency-safe request lifecycle
+-- Accept/confirm are conditional UPDATEs (WHERE status = ...); this index makes the
+-- database reject a second active request from the same user for the same copy
+
+-- Existing duplicates must be resolved first; list them with:
+-- SELECT copy_id, requester_id, count(*) FROM requests
+--  WHERE status IN ('PENDING', 'ACCEPTED') GROUP BY copy_id, requester_id HAVING count(*) > 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ix_requests_one_active_per_requester
+    ON requests (copy_id, requester_id)
+    WHERE status IN ('PENDING', 'ACCEPTED');
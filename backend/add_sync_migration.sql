@@ -0,0 +1,30 @@
+-- Migration for the incremental sync endpoint (GET /sync?since=<token>)
+-- books/copies/requests get an indexed updated_at (set on insert and on every
+-- update) and deletions are recorded as tombstones
+
+ALTER TABLE books ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT now();
+ALTER TABLE copies ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT now();
+
+-- requests.updated_at already exists but was only set on update
+ALTER TABLE requests ALTER COLUMN updated_at SET DEFAULT now();
+UPDATE requests SET updated_at = COALESCE(created_at, now()) WHERE updated_at IS NULL;
+
+CREATE INDEX IF NOT EXISTS ix_books_updated_at ON books (updated_at);
+CREATE INDEX IF NOT EXISTS ix_copies_updated_at ON copies (updated_at);
+CREATE INDEX IF NOT EXISTS ix_requests_updated_at ON requests (updated_at);
+
+CREATE TABLE IF NOT EXISTS tombstones (
+    id SERIAL PRIMARY KEY,
+    entity VARCHAR NOT NULL,
+    entity_id INTEGER NOT NULL,
+    requester_id INTEGER REFERENCES users(id),
+    owner_id INTEGER REFERENCES users(id),
+    deleted_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+-- Users que devem receber a remoção (bases onde a tabela já existia)
+ALTER TABLE tombstones ADD COLUMN IF NOT EXISTS requester_id INTEGER REFERENCES users(id);
+ALTER TABLE tombstones ADD COLUMN IF NOT EXISTS owner_id INTEGER REFERENCES users(id);
+
+CREATE INDEX IF NOT EXISTS ix_tombstones_id ON tombstones (id);
+CREATE INDEX IF NOT EXISTS ix_tombstones_entity_deleted_at ON tombstones (entity, deleted_at);
@@ -0,0 +1,33 @@
+-- Migration to add the per-user dashboard read model
+-- Rows are maintained incrementally by the crud mutations; a missing row is
+-- rebuilt from copies/requests/messages on the first read
+
+CREATE TABLE IF NOT EXISTS user_dashboards (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id),
+    available_copies INTEGER NOT NULL DEFAULT 0,
+    requested_copies INTEGER NOT NULL DEFAULT 0,
+    reserved_copies INTEGER NOT NULL DEFAULT 0,
+    borrowed_copies INTEGER NOT NULL DEFAULT 0,
+    pending_incoming INTEGER NOT NULL DEFAULT 0,
+    unread_messages INTEGER NOT NULL DEFAULT 0,
+    last_read_message_id INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+);
+
+-- Backfill: counters computed from the current data; existing users start
+-- with every current message marked as read instead of the whole history
+-- showing up as unread
+INSERT INTO user_dashboards (
+    user_id, available_copies, requested_copies, reserved_copies, borrowed_copies,
+    pending_incoming, last_read_message_id
+)
+SELECT u.id,
+       (SELECT COUNT(*) FROM copies c WHERE c.owner_id = u.id AND c.status = 'AVAILABLE'),
+       (SELECT COUNT(*) FROM copies c WHERE c.owner_id = u.id AND c.status = 'REQUESTED'),
+       (SELECT COUNT(*) FROM copies c WHERE c.owner_id = u.id AND c.status = 'RESERVED'),
+       (SELECT COUNT(*) FROM copies c WHERE c.owner_id = u.id AND c.status = 'BORROWED'),
+       (SELECT COUNT(*) FROM requests r JOIN copies c ON c.id = r.copy_id
+        WHERE c.owner_id = u.id AND r.status = 'PENDING'),
+       COALESCE((SELECT MAX(id) FROM messages), 0)
+FROM users u
+ON CONFLICT (user_id) DO NOTHING;
@@ -0,0 +1,15 @@
+-- Migration to add the precomputed recommendations table
+-- Filled by the batch job (python -m app.recommendations), which replaces the
+-- whole table; /users/{id}/recommendations reads one user's rows by score
+
+CREATE TABLE IF NOT EXISTS user_recommendations (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    book_id INTEGER NOT NULL REFERENCES books(id),
+    score DOUBLE PRECISION NOT NULL,
+    genre_score DOUBLE PRECISION NOT NULL DEFAULT 0,
+    cotransfer_score DOUBLE PRECISION NOT NULL DEFAULT 0,
+    computed_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+    PRIMARY KEY (user_id, book_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_user_recommendations_user_id_score ON user_recommendations (user_id, score);
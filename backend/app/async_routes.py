@@ -0,0 +1,120 @@
+"""Endpoints de leitura em versão async (ativos com USE_ASYNC_DB=1).
+
+Usam AsyncSession em vez da SessionLocal bloqueante, para que um único worker
+uvicorn consiga atender muitos pedidos concorrentes enquanto espera pelo
+Postgres. O corpo de cada rota é o mesmo das rotas sync (app/read_views.py),
+executado com AsyncSession.run_sync. Estas rotas são registadas antes das rotas
+sync de main.py e por isso têm prioridade sobre elas.
+
+Nas rotas em cache só a query (read_views.load_*) corre no run_sync; o lookup e
+o store da cache são feitos aqui, numa thread quando o backend é bloqueante
+(redis), para não parar o event loop.
+
+As mutações (requests, accept, confirm-delivery, mensagens, ...) continuam só
+nas rotas sync, que o FastAPI corre no threadpool. Cada uma faz na mesma
+transação os UPDATEs condicionais, os deltas do dashboard, a outbox, a
+invalidação da cache e o publish do chat; corrê-las com run_sync poria essas
+chamadas bloqueantes (redis) no event loop. O ganho do async está nas
+leituras, que são a maioria dos pedidos.
+"""
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import cache, schemas, read_views, replicas
+from app.database import async_read_session_factory, is_replica
+from app.pagination import PageLimit
+
+router = APIRouter()
+
+# Dependency para o DB async (rotas só de leitura: usa as réplicas, se houver)
+async def get_async_db(request: Request):
+    async with async_read_session_factory(replicas.wants_primary(request))() as db:
+        yield db
+
+async def _cache_call(fn, *args, **kwargs):
+    if cache.backend.blocking:
+        return await run_in_threadpool(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
+
+async def _cached(db: AsyncSession, request: Request, tags: list, load, **params):
+    """read_views.cached para AsyncSession."""
+    entry = await _cache_call(cache.lookup, request, tags)
+    if entry is None:
+        content, headers = await db.run_sync(load, **params)
+        entry = await _cache_call(
+            cache.store, request, tags, content, headers, cacheable=not is_replica(db),
+        )
+    return cache.respond(request, entry)
+
+@router.get("/books", response_model=dict)
+async def list_books_grouped_by_municipio(
+    request: Request,
+    municipio: Optional[str] = None,
+    status: Optional[schemas.CopyStatus] = None,
+    author: Optional[str] = None,
+    owner_id: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = PageLimit,
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await _cached(
+        db, request, ["catalogue"], read_views.load_catalogue, municipio=municipio, status=status,
+        author=author, owner_id=owner_id, after=after, limit=limit,
+    )
+
+@router.get("/users/{user_id}/books")
+async def get_user_books(
+    user_id: int,
+    request: Request,
+    status: Optional[schemas.CopyStatus] = None,
+    after: Optional[int] = None,
+    limit: int = PageLimit,
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await _cached(
+        db, request, [cache.owner_tag(user_id)], read_views.load_owner_books,
+        user_id=user_id, status=status, after=after, limit=limit,
+    )
+
+@router.get("/copies", response_model=list[schemas.Copy])
+async def list_copies(
+    request: Request,
+    status: Optional[schemas.CopyStatus] = None,
+    location: Optional[str] = None,
+    owner_id: Optional[int] = None,
+    author: Optional[str] = None,
+    after: Optional[int] = None,
+    limit: int = PageLimit,
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await _cached(
+        db, request, ["copies"], read_views.load_copies, status=status, location=location,
+        owner_id=owner_id, author=author, after=after, limit=limit,
+    )
+
+@router.get("/requests", response_model=list[schemas.Request])
+async def list_requests(
+    status: Optional[schemas.RequestStatus] = None,
+    requester_id: Optional[int] = None,
+    copy_id: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = PageLimit,
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(
+        read_views.requests, status=status, requester_id=requester_id, copy_id=copy_id,
+        after=after, limit=limit,
+    )
+
+@router.get("/users/{user_id}/incoming-requests")
+async def get_incoming_requests(
+    user_id: int,
+    status: Optional[schemas.RequestStatus] = None,
+    after: Optional[int] = None,
+    limit: int = PageLimit,
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(read_views.incoming_requests, user_id, status=status, after=after, limit=limit)
@@ -0,0 +1,159 @@
+"""Tokens de acesso assinados (stateless) emitidos no /login.
+
+O token é um payload assinado com itsdangerous (id, email e nome do user) e
+com validade de ACCESS_TOKEN_TTL segundos. Validá-lo não precisa da base de
+dados: a dependência get_principal só verifica a assinatura e a idade.
+
+Para os endpoints que precisam do registo completo do user, get_current_user
+usa uma cache TTL pequena de principals (AUTH_USER_CACHE_TTL), por isso a
+tabela users só é lida quando a entrada expira. load_user é a mesma cache para
+as rotas que só validam um user_id do path (dashboard, recomendações, import).
+
+AUTH_SECRET_KEY é obrigatório (e igual em todos os workers): sem ele a app não
+arranca. Só em desenvolvimento/testes, com AUTH_ALLOW_RANDOM_SECRET=1, é gerada
+uma chave aleatória por processo (os tokens deixam de ser válidos noutro
+worker ou depois de um restart).
+
+AUTH_ADMIN_EMAILS (emails separados por vírgulas) são os admins: is_admin só
+olha para o email assinado no token, sem ler a base de dados.
+
+Uso num endpoint:
+    def endpoint(principal: auth.Principal = Depends(auth.get_principal)): ...
+"""
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import Depends, HTTPException
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+from app import crud, schemas
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+AUTH_SECRET_KEY = os.getenv("AUTH_SECRET_KEY")
+AUTH_ALLOW_RANDOM_SECRET = os.getenv("AUTH_ALLOW_RANDOM_SECRET", "0").lower() in ("1", "true", "yes")
+if not AUTH_SECRET_KEY:
+    if not AUTH_ALLOW_RANDOM_SECRET:
+        raise RuntimeError("AUTH_SECRET_KEY is not set (use AUTH_ALLOW_RANDOM_SECRET=1 only for development)")
+    AUTH_SECRET_KEY = secrets.token_urlsafe(32)
+    logger.warning("AUTH_SECRET_KEY not set, using a random per-process key (AUTH_ALLOW_RANDOM_SECRET)")
+ACCESS_TOKEN_TTL = int(os.getenv("ACCESS_TOKEN_TTL", str(7 * 24 * 3600)))
+AUTH_USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", "60"))
+AUTH_USER_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_USER_CACHE_MAX_ENTRIES", "10000"))
+AUTH_ADMIN_EMAILS = {
+    email.strip().lower() for email in os.getenv("AUTH_ADMIN_EMAILS", "").split(",") if email.strip()
+}
+
+_serializer = URLSafeTimedSerializer(AUTH_SECRET_KEY, salt="access-token")
+_bearer = HTTPBearer(auto_error=False)
+
+
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    email: str
+    name: str
+
+
+def issue_token(user) -> str:
+    return _serializer.dumps({"sub": user.id, "email": user.email, "name": user.name})
+
+
+def decode_token(token: str) -> Optional[Principal]:
+    try:
+        data = _serializer.loads(token, max_age=ACCESS_TOKEN_TTL)
+        return Principal(id=int(data["sub"]), email=data["email"], name=data.get("name"))
+    except (BadSignature, SignatureExpired, KeyError, TypeError, ValueError):
+        return None
+
+
+def _unauthorized(detail: str):
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+
+def get_optional_principal(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer),
+) -> Optional[Principal]:
+    if credentials is None:
+        return None
+    principal = decode_token(credentials.credentials)
+    if principal is None:
+        raise _unauthorized("Invalid or expired token")
+    return principal
+
+
+def get_principal(principal: Optional[Principal] = Depends(get_optional_principal)) -> Principal:
+    if principal is None:
+        raise _unauthorized("Not authenticated")
+    return principal
+
+
+def is_admin(principal: Principal) -> bool:
+    return principal.email.lower() in AUTH_ADMIN_EMAILS
+
+
+class _UserCache:
+    """LRU com TTL de schemas.User por id (os objetos são imutáveis para quem lê)."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id: int):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def set(self, user_id: int, user):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+user_cache = _UserCache(AUTH_USER_CACHE_TTL, AUTH_USER_CACHE_MAX_ENTRIES)
+
+
+def load_user(user_id: int) -> Optional[schemas.User]:
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    db = SessionLocal()
+    try:
+        db_user = crud.get_user(db, user_id)
+        if db_user is None:
+            return None
+        user = schemas.User.model_validate(db_user, from_attributes=True)
+    finally:
+        db.close()
+    user_cache.set(user_id, user)
+    return user
+
+
+def get_current_user(principal: Principal = Depends(get_principal)) -> schemas.User:
+    user = load_user(principal.id)
+    if user is None:
+        raise _unauthorized("User no longer exists")
+    return user
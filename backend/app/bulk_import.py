@@ -0,0 +1,91 @@
+"""Leitura do corpo da importação em massa (POST /books/import).
+
+Aceita um array JSON, NDJSON (um objeto por linha) ou CSV com cabeçalho. NDJSON
+e CSV são lidos em streaming, linha a linha, e entregues em blocos de
+BULK_IMPORT_CHUNK_SIZE linhas; cada bloco é gravado numa só transação por
+crud.import_books. No CSV os campos não podem conter quebras de linha.
+"""
+import codecs
+import csv
+import json
+import os
+
+from fastapi import Request
+
+BULK_IMPORT_CHUNK_SIZE = int(os.getenv("BULK_IMPORT_CHUNK_SIZE", "500"))
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+CSV_TYPES = ("text/csv", "application/csv")
+
+
+async def _iter_lines(request: Request):
+    # Decoder incremental: um carácter multi-byte (ex. "é") pode vir partido
+    # entre dois blocos do stream
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in request.stream():
+        buffer += decoder.decode(chunk)
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+async def _iter_ndjson(request: Request):
+    row_number = 0
+    async for line in _iter_lines(request):
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            yield row_number, json.loads(line)
+        except ValueError:
+            # Reportada como erro dessa linha por crud.import_books
+            yield row_number, line
+
+
+async def _iter_csv(request: Request):
+    header = None
+    row_number = 0
+    async for line in _iter_lines(request):
+        if not line.strip():
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row_number += 1
+        # Células vazias contam como campo ausente (ex.: cover_url, latitude)
+        yield row_number, {name: value for name, value in zip(header, values) if value != ""}
+
+
+async def _iter_json(request: Request):
+    data = await request.json()
+    if not isinstance(data, list):
+        raise ValueError("expected a JSON array of books")
+    for row_number, item in enumerate(data, start=1):
+        yield row_number, item
+
+
+def iter_rows(request: Request):
+    """(row_number, dict) para cada linha do corpo, conforme o Content-Type."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in NDJSON_TYPES:
+        return _iter_ndjson(request)
+    if content_type in CSV_TYPES:
+        return _iter_csv(request)
+    return _iter_json(request)
+
+
+async def iter_chunks(rows, size: int = BULK_IMPORT_CHUNK_SIZE):
+    chunk = []
+    async for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
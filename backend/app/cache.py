@@ -0,0 +1,275 @@
+"""Cache de respostas dos endpoints do catálogo, com invalidação por tags.
+
+Cada resposta é guardada já serializada (bytes JSON + ETag), com a chave
+``path?query`` e uma lista de tags ("catalogue", "copies", "owner:<id>"). As
+funções de escrita de crud.py chamam ``invalidate`` com as tags das linhas que
+alteram, por isso uma entrada só é descartada quando os seus dados mudam (o TTL
+é apenas uma rede de segurança).
+
+Backends (CACHE_BACKEND): "memory" (LRU com TTL, por processo, por omissão),
+"redis" (partilhado entre workers; CACHE_URL, requer o pacote redis) ou "none".
+
+ETags: com o redis cada tag tem um contador de versão partilhado, incrementado
+por ``invalidate``, e o ETag (fraco) é derivado das versões das tags; um
+pedido com If-None-Match igual à versão atual recebe 304 logo no ``lookup``,
+sem ler a cache nem a base de dados. Com os backends locais os contadores
+seriam por processo (um worker que não viu a escrita continuaria a responder
+304), por isso o ETag é o hash do corpo e o 304 só é decidido depois de o ter.
+
+Leituras concorrentes com uma escrita: um pedido que leu os dados antes do
+``invalidate`` não pode guardar a sua resposta depois dele. No redis isso é
+garantido pelo ETag de versão (a entrada fica com o ETag antigo e o lookup
+rejeita-a); no backend em memória cada tag tem um contador de geração, lido
+no ``lookup`` antes da query, e o ``set`` é descartado se alguma tag mudou.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+
+from fastapi import Request, Response
+
+from app import serialization
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+
+
+@dataclass
+class CacheEntry:
+    body: bytes  # None numa entrada "not modified" (ver lookup)
+    etag: str
+    headers: dict = field(default_factory=dict)
+
+
+class MemoryCache:
+    """LRU com TTL; um índice tag -> chaves permite invalidar só o necessário."""
+
+    shared_versions = False
+    blocking = False  # sem I/O: pode ser chamado no event loop
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, entry, tags)
+        self._tags = defaultdict(set)
+        self._generations = defaultdict(int)  # tag -> número de invalidações
+
+    def _drop(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return item[1]
+
+    def generation(self, tags) -> tuple:
+        with self._lock:
+            return tuple(self._generations[tag] for tag in tags)
+
+    def set(self, key: str, entry: CacheEntry, tags, generation: tuple = None):
+        with self._lock:
+            if generation is not None and generation != tuple(self._generations[tag] for tag in tags):
+                return  # uma escrita invalidou as tags depois da leitura
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, entry, tuple(tags))
+            for tag in tags:
+                self._tags[tag].add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] += 1
+                for key in list(self._tags.get(tag, ())):
+                    self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+
+class RedisCache:
+    """Backend partilhado (Redis ou compatível); cada tag é um set de chaves."""
+
+    prefix = "noshelf:cache:"
+    shared_versions = True  # versões das tags partilhadas por todos os workers
+    blocking = True  # I/O de rede síncrono: as rotas async chamam-no numa thread
+
+    def __init__(self, url: str = CACHE_URL, ttl: float = CACHE_TTL):
+        import redis  # dependência opcional, só com CACHE_BACKEND=redis
+
+        self.ttl = int(ttl)
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str):
+        data = self._client.get(self.prefix + key)
+        if data is None:
+            return None
+        payload = json.loads(data)
+        return CacheEntry(payload["body"].encode(), payload["etag"], payload["headers"])
+
+    def generation(self, tags):
+        return None  # o ETag de versão já descarta as entradas antigas
+
+    def set(self, key: str, entry: CacheEntry, tags, generation=None):
+        data = json.dumps({"body": entry.body.decode(), "etag": entry.etag, "headers": entry.headers})
+        pipe = self._client.pipeline()
+        pipe.set(self.prefix + key, data, ex=self.ttl)
+        for tag in tags:
+            pipe.sadd(self.prefix + "tag:" + tag, key)
+            pipe.expire(self.prefix + "tag:" + tag, self.ttl)
+        pipe.execute()
+
+    def versions(self, tags) -> list:
+        values = self._client.mget([self.prefix + "version:" + tag for tag in tags])
+        return [int(value) if value is not None else 0 for value in values]
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self._client.incr(self.prefix + "version:" + tag)
+            tag_key = self.prefix + "tag:" + tag
+            keys = self._client.smembers(tag_key)
+            pipe = self._client.pipeline()
+            for key in keys:
+                pipe.delete(self.prefix + key.decode())
+            pipe.delete(tag_key)
+            pipe.execute()
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + "*"):
+            self._client.delete(key)
+
+
+class NullCache:
+    shared_versions = False
+    blocking = False
+
+    def get(self, key):
+        return None
+
+    def generation(self, tags):
+        return None
+
+    def set(self, key, entry, tags, generation=None):
+        pass
+
+    def invalidate(self, *tags):
+        pass
+
+    def clear(self):
+        pass
+
+
+def _create_backend():
+    if CACHE_BACKEND == "redis":
+        return RedisCache()
+    if CACHE_BACKEND == "none":
+        return NullCache()
+    return MemoryCache()
+
+
+backend = _create_backend()
+
+
+def cache_key(request: Request) -> str:
+    params = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    return f"{request.url.path}?{params}"
+
+
+def version_etag(request: Request, tags) -> str:
+    """ETag fraco a partir das versões (redis) das tags, ex. W/"catalogue-v12-9f8e7d6c5b"."""
+    versions = "-".join(f"{tag}-v{version}" for tag, version in zip(tags, backend.versions(tags)))
+    key_hash = hashlib.sha1(cache_key(request).encode()).hexdigest()[:10]
+    return f'W/"{versions}-{key_hash}"'
+
+
+def content_etag(body: bytes) -> str:
+    return f'W/"{hashlib.sha1(body).hexdigest()}"'
+
+
+def _matches(request: Request, etag: str) -> bool:
+    # Comparação fraca (RFC 9110): ignora o prefixo W/
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    return any(
+        tag.strip() == "*" or tag.strip().removeprefix("W/") == opaque
+        for tag in if_none_match.split(",")
+    )
+
+
+def lookup(request: Request, tags):
+    """Entrada em cache para o pedido, ou None se for preciso gerar a resposta.
+
+    Com versões partilhadas, o ETag da versão atual é calculado antes da query
+    (e usado pelo store), por isso uma escrita concorrente nunca deixa conteúdo
+    antigo com um ETag novo. Com os backends locais não há 304 antecipado.
+    """
+    if not backend.shared_versions:
+        request.state.cache_generation = backend.generation(tags)
+        return backend.get(cache_key(request))
+    etag = version_etag(request, tags)
+    request.state.cache_etag = etag
+    if _matches(request, etag):
+        return CacheEntry(None, etag)
+    entry = backend.get(cache_key(request))
+    if entry is not None and entry.etag != etag:
+        return None
+    return entry
+
+
+def store(request: Request, tags, content, headers: dict = None, cacheable: bool = True) -> CacheEntry:
+    """Serializa content e guarda a entrada com as tags dadas.
+
+    Com cacheable=False (ex. leitura de uma réplica, que pode estar atrasada em
+    relação à versão atual) a entrada não é guardada e o ETag é o do conteúdo.
+    """
+    body = serialization.dumps(content)
+    if cacheable and backend.shared_versions:
+        etag = getattr(request.state, "cache_etag", None) or version_etag(request, tags)
+    else:
+        etag = content_etag(body)
+    entry = CacheEntry(body, etag, dict(headers or {}))
+    if cacheable:
+        backend.set(cache_key(request), entry, tags, getattr(request.state, "cache_generation", None))
+    return entry
+
+
+def respond(request: Request, entry: CacheEntry) -> Response:
+    """Resposta JSON da entrada, ou 304 se o cliente já tiver esta versão."""
+    headers = dict(entry.headers, ETag=entry.etag)
+    headers["Cache-Control"] = "no-cache"
+    if entry.body is None or _matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+def invalidate(*tags):
+    backend.invalidate(*tags)
+
+
+def owner_tag(owner_id) -> str:
+    return f"owner:{owner_id}"
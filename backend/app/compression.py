@@ -0,0 +1,68 @@
+"""Compressão das respostas (brotli se o pacote estiver instalado, senão gzip).
+
+Só são comprimidas respostas com pelo menos COMPRESSION_MIN_SIZE bytes; as
+pequenas (e os 304) seguem tal como estão. O brotli é opcional (pip install -r
+requirements-optional.txt): sem ele, ou se o cliente não o aceitar, usa-se o GZipMiddleware do
+Starlette.
+
+Configuração: COMPRESSION_ENABLED (true), COMPRESSION_MIN_SIZE (1024),
+COMPRESSION_GZIP_LEVEL (6), COMPRESSION_BROTLI_QUALITY (5).
+"""
+import os
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, IdentityResponder
+
+try:
+    import brotli  # dependência opcional
+except ImportError:
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size: int, quality: int):
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        data = self.compressor.process(body)
+        # Em streaming (exports) cada bloco é enviado logo, sem esperar pelo fim
+        return data + (self.compressor.flush() if more_body else self.compressor.finish())
+
+
+def _accepted_encodings(scope) -> set:
+    accepted = set()
+    for part in Headers(scope=scope).get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        gzip_level: int = COMPRESSION_GZIP_LEVEL,
+        brotli_quality: int = COMPRESSION_BROTLI_QUALITY,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.brotli_quality = brotli_quality
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and brotli is not None and "br" in _accepted_encodings(scope):
+            responder = BrotliResponder(self.app, self.minimum_size, self.brotli_quality)
+            await responder(scope, receive, send)
+            return
+        await self.gzip(scope, receive, send)
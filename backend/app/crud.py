@@ -1,29 +1,175 @@
 
-from sqlalchemy.orm import Session
-from app import models, schemas
+import os
+from datetime import datetime, timedelta, timezone
+
+from pydantic import ValidationError
+from sqlalchemy import and_, or_, func, literal_column, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload, aliased
+from app import models, schemas, pubsub, geo, search, cache, security, outbox
+from app.database import USE_POSTGIS
+
+# Paginação (keyset): as listas são ordenadas por id e o cliente pede a página
+# seguinte com `after=<último id recebido>`
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+def _keyset(query, column, after: int = None, limit: int = DEFAULT_PAGE_SIZE):
+    """Apply keyset pagination on a monotonically increasing column (the id)."""
+    if after is not None:
+        query = query.filter(column > after)
+    return query.order_by(column).limit(limit)
+
+def next_cursor(last_id, count: int, limit: int):
+    """Cursor for the next page, or None when this page was the last one."""
+    if count < limit or last_id is None:
+        return None
+    return last_id
 
 # Users
-def create_user(db: Session, user: schemas.UserCreate):
-    db_user = models.User(**user.dict())
+def create_user(db: Session, user: schemas.UserCreate, password_hash: str = None):
+    """Cria o user; a password é guardada com hash (password_hash se já vier calculado)."""
+    data = user.dict()
+    data["password"] = password_hash or security.hash_password(user.password)
+    db_user = models.User(**data)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
     return db_user
 
-def get_users(db: Session):
-    return db.query(models.User).all()
+def get_users(db: Session, city: str = None, after: int = None, limit: int = DEFAULT_PAGE_SIZE):
+    query = db.query(models.User)
+    if city:
+        query = query.filter(models.User.city == city)
+    return _keyset(query, models.User.id, after, limit).all()
+
+def get_user(db: Session, user_id: int):
+    return db.query(models.User).filter(models.User.id == user_id).first()
 
 def get_user_by_email(db: Session, email: str):
     return db.query(models.User).filter(models.User.email == email).first()
 
+def update_password(db: Session, user_id: int, password_hash: str):
+    db.query(models.User).filter(models.User.id == user_id) \
+        .update({models.User.password: password_hash}, synchronize_session=False)
+    db.commit()
+
 # Books
 def create_book(db: Session, book: schemas.BookCreate):
     db_book = models.Book(**book.dict())
     db.add(db_book)
     db.commit()
     db.refresh(db_book)
+    search.index.add(db_book)
+    cache.invalidate("catalogue")
     return db_book
 
+def get_book_by_isbn(db: Session, isbn: str):
+    return db.query(models.Book).filter(models.Book.isbn == isbn).first()
+
+def import_books(db: Session, rows: list, owner_id: int, location: str = None):
+    """Import one chunk of books with a copy each, in a single transaction.
+
+    rows is a list of (row_number, dict). Books are upserted by ISBN (existing
+    ones are reused), missing books and all copies are inserted in bulk, and a
+    BookImportResult is returned per row. If another import inserts the same
+    ISBN concurrently the chunk is retried once against the new state.
+    """
+    for attempt in range(2):
+        try:
+            return _import_books_chunk(db, rows, owner_id, location)
+        except IntegrityError:
+            db.rollback()
+            if attempt:
+                raise
+
+def _import_error(row_number: int, data, detail: str):
+    # O isbn vem da linha em bruto (pode ser um número, uma lista, ...)
+    isbn = data.get("isbn") if isinstance(data, dict) else None
+    return schemas.BookImportResult(
+        row=row_number, status="error", isbn=None if isbn is None else str(isbn), detail=detail,
+    )
+
+def _import_books_chunk(db: Session, rows: list, owner_id: int, location: str):
+    results = {}
+    valid = []
+    for row_number, data in rows:
+        if not isinstance(data, dict):
+            results[row_number] = _import_error(row_number, data, "expected a JSON object")
+            continue
+        try:
+            item = schemas.BookImportRow.model_validate(data)
+        except ValidationError as e:
+            results[row_number] = _import_error(
+                row_number, data,
+                "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()),
+            )
+            continue
+        if not (item.location or location):
+            results[row_number] = schemas.BookImportResult(
+                row=row_number, status="error", isbn=item.isbn, detail="location is required",
+            )
+            continue
+        valid.append((row_number, item))
+
+    if valid:
+        isbns = {item.isbn for _, item in valid}
+        book_ids = dict(db.execute(
+            select(models.Book.isbn, models.Book.id).where(models.Book.isbn.in_(isbns))
+        ).all())
+
+        new_books = {}
+        for _, item in valid:
+            if item.isbn not in book_ids and item.isbn not in new_books:
+                new_books[item.isbn] = {
+                    "title": item.title,
+                    "author": item.author,
+                    "isbn": item.isbn,
+                    "cover_url": item.cover_url,
+                }
+        if new_books:
+            inserted = db.execute(
+                insert(models.Book).returning(models.Book.isbn, models.Book.id, sort_by_parameter_order=True),
+                list(new_books.values()),
+            ).all()
+            book_ids.update(dict(inserted))
+
+        copies = []
+        for _, item in valid:
+            copy_location = item.location or location
+            copies.append({
+                "book_id": book_ids[item.isbn],
+                "owner_id": owner_id,
+                "original_owner_id": owner_id,
+                "condition": models.BookCondition(item.condition),
+                "status": models.CopyStatus.AVAILABLE,
+                "location": copy_location,
+                "latitude": item.latitude,
+                "longitude": item.longitude,
+                "geohash": geo.encode(item.latitude, item.longitude)
+                if item.latitude is not None and item.longitude is not None else None,
+            })
+        copy_ids = db.execute(
+            insert(models.Copy).returning(models.Copy.id, sort_by_parameter_order=True),
+            copies,
+        ).scalars().all()
+        _bump_copy_status(db, owner_id, models.CopyStatus.AVAILABLE, len(copies))
+        db.commit()
+
+        created = set()
+        for (row_number, item), copy_id in zip(valid, copy_ids):
+            book_created = item.isbn in new_books and item.isbn not in created
+            created.add(item.isbn)
+            results[row_number] = schemas.BookImportResult(
+                row=row_number, status="ok", isbn=item.isbn, book_id=book_ids[item.isbn],
+                book_created=book_created, copy_id=copy_id,
+            )
+        if new_books:
+            search.index.invalidate()
+        cache.invalidate("catalogue", "copies", cache.owner_tag(owner_id))
+
+    return [results[row_number] for row_number, _ in rows]
+
 def get_books(db: Session):
     return db.query(models.Book).all()
 
@@ -33,72 +179,493 @@ def create_copy(db: Session, copy: schemas.CopyCreate):
     # If original_owner_id not provided, set it to the initial owner_id
     if not data.get("original_owner_id"):
         data["original_owner_id"] = data.get("owner_id")
+    if data.get("latitude") is not None and data.get("longitude") is not None:
+        data["geohash"] = geo.encode(data["latitude"], data["longitude"])
     db_copy = models.Copy(**data)
     db.add(db_copy)
+    _bump_copy_status(db, db_copy.owner_id, db_copy.status or models.CopyStatus.AVAILABLE, 1)
     db.commit()
     db.refresh(db_copy)
+    cache.invalidate("catalogue", "copies", cache.owner_tag(db_copy.owner_id))
     return db_copy
 
-def get_copies(db: Session):
-    return db.query(models.Copy).all()
+def get_copies(
+    db: Session,
+    status: models.CopyStatus = None,
+    location: str = None,
+    owner_id: int = None,
+    author: str = None,
+    after: int = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    query = db.query(models.Copy).options(
+        joinedload(models.Copy.book),
+        joinedload(models.Copy.owner),
+    )
+    if status:
+        query = query.filter(models.Copy.status == models.CopyStatus(status))
+    if location:
+        query = query.filter(models.Copy.location == location)
+    if owner_id is not None:
+        query = query.filter(models.Copy.owner_id == owner_id)
+    if author:
+        query = query.join(models.Copy.book).filter(models.Book.author == author)
+    return _keyset(query, models.Copy.id, after, limit).all()
 
-def get_books(db: Session):
-    return db.query(models.Book).all()
+def _user_columns(user, prefix: str):
+    return [
+        user.id.label(f"{prefix}_id"),
+        user.name.label(f"{prefix}_name"),
+        user.email.label(f"{prefix}_email"),
+        user.city.label(f"{prefix}_city"),
+        user.country.label(f"{prefix}_country"),
+        user.genres.label(f"{prefix}_genres"),
+    ]
+
+def _copy_columns(owner):
+    """Colunas de uma cópia com o livro e o owner (ver serialization.copy_from_row)."""
+    return [
+        models.Copy.id.label("copy_id"),
+        models.Copy.condition.label("copy_condition"),
+        models.Copy.status.label("copy_status"),
+        models.Copy.location.label("copy_location"),
+        models.Copy.latitude.label("copy_latitude"),
+        models.Copy.longitude.label("copy_longitude"),
+        models.Copy.original_owner_id.label("copy_original_owner_id"),
+        models.Book.id.label("book_id"),
+        models.Book.title.label("book_title"),
+        models.Book.author.label("book_author"),
+        models.Book.isbn.label("book_isbn"),
+        models.Book.cover_url.label("book_cover_url"),
+        *_user_columns(owner, "owner"),
+    ]
+
+def get_copy_rows(
+    db: Session,
+    status: models.CopyStatus = None,
+    location: str = None,
+    owner_id: int = None,
+    author: str = None,
+    after: int = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    """Like get_copies, but as flat projected rows (no ORM objects) for fast serialization."""
+    query = _copy_rows_query(db)
+    if status:
+        query = query.filter(models.Copy.status == models.CopyStatus(status))
+    if location:
+        query = query.filter(models.Copy.location == location)
+    if owner_id is not None:
+        query = query.filter(models.Copy.owner_id == owner_id)
+    if author:
+        query = query.filter(models.Book.author == author)
+    return _keyset(query, models.Copy.id, after, limit).all()
+
+def _copy_rows_query(db: Session):
+    Owner = aliased(models.User)
+    return db.query(*_copy_columns(Owner)) \
+        .join(models.Book, models.Copy.book_id == models.Book.id) \
+        .join(Owner, models.Copy.owner_id == Owner.id)
+
+def get_catalogue(
+    db: Session,
+    municipio: str = None,
+    status: models.CopyStatus = None,
+    author: str = None,
+    owner_id: int = None,
+    after: int = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    """Return a page of the catalogue grouped by copy location (municipio).
+
+    Books and copies are fetched in a single joined query and grouped in one
+    pass without lazy loads. Pages are keyed on the copy id; returns
+    ``(grouped, next_cursor)``.
+    """
+    query = db.query(
+        models.Copy.location,
+        models.Copy.id.label("copy_id"),
+        models.Copy.condition,
+        models.Copy.status,
+        models.Copy.owner_id,
+        models.Book.id,
+        models.Book.title,
+        models.Book.author,
+        models.Book.isbn,
+        models.Book.cover_url,
+    ).join(models.Book, models.Copy.book_id == models.Book.id)
+    if municipio:
+        query = query.filter(models.Copy.location == municipio)
+    if status:
+        query = query.filter(models.Copy.status == models.CopyStatus(status))
+    if author:
+        query = query.filter(models.Book.author == author)
+    if owner_id is not None:
+        query = query.filter(models.Copy.owner_id == owner_id)
+    rows = _keyset(query, models.Copy.id, after, limit).all()
+
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row.location, []).append({
+            "id": row.id,
+            "title": row.title,
+            "author": row.author,
+            "isbn": row.isbn,
+            "cover_url": row.cover_url,
+            "condition": row.condition,
+            "status": row.status,
+            "owner_id": row.owner_id,
+            "copy_id": row.copy_id,
+        })
+    last_id = rows[-1].copy_id if rows else None
+    return grouped, next_cursor(last_id, len(rows), limit)
+
+def _book_tsvector():
+    # Tem de coincidir com a expressão do índice GIN (add_books_search_migration.sql)
+    def weighted(column, weight):
+        return func.setweight(
+            func.to_tsvector(literal_column("'simple'::regconfig"), column),
+            literal_column(f"'{weight}'::\"char\""),
+        )
+    return weighted(func.coalesce(models.Book.title, literal_column("''")), "A") \
+        .op("||")(weighted(func.coalesce(models.Book.author, literal_column("''")), "B")) \
+        .op("||")(weighted(func.replace(func.coalesce(models.Book.isbn, literal_column("''")), literal_column("'-'"), literal_column("''")), "A"))
+
+def search_books(db: Session, q: str, limit: int = 20):
+    """Ranked search over title, author and isbn; every term is a prefix match.
+
+    Uses the tsvector GIN index on Postgres and the in-process inverted index
+    (app/search.py) on other databases.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return search.index.search(db, q, limit)
+
+    terms = search.query_terms(q, fold_accents=False)
+    if not terms:
+        return []
+    vector = _book_tsvector()
+    tsquery = func.to_tsquery(literal_column("'simple'::regconfig"), " & ".join(f"{term}:*" for term in terms))
+    rank = func.ts_rank(vector, tsquery).label("rank")
+    rows = db.query(
+        models.Book.id,
+        models.Book.title,
+        models.Book.author,
+        models.Book.isbn,
+        models.Book.cover_url,
+        rank,
+    ).filter(vector.op("@@")(tsquery)).order_by(rank.desc(), models.Book.id).limit(limit).all()
+    return [dict(row._mapping) for row in rows]
 
 def get_book(db: Session, book_id: int):
     return db.query(models.Book).filter(models.Book.id == book_id).first()
 
+def _nearby_columns():
+    return (
+        models.Book.id,
+        models.Book.title,
+        models.Book.author,
+        models.Book.isbn,
+        models.Book.cover_url,
+        models.Copy.id.label("copy_id"),
+        models.Copy.owner_id,
+        models.Copy.condition,
+        models.Copy.status,
+        models.Copy.location,
+        models.Copy.latitude,
+        models.Copy.longitude,
+    )
+
+def get_copies_nearby(
+    db: Session,
+    lat: float,
+    lon: float,
+    radius_km: float,
+    status: models.CopyStatus = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    """Copies within radius_km of (lat, lon), nearest first, with distance_km.
+
+    Only the geohash cells covering the search circle are read from the index;
+    with USE_POSTGIS on Postgres the search is done by ST_DWithin instead.
+    """
+    if USE_POSTGIS and db.get_bind().dialect.name == "postgresql":
+        return _get_copies_nearby_postgis(db, lat, lon, radius_km, status, limit)
+
+    query = db.query(*_nearby_columns()) \
+        .join(models.Book, models.Copy.book_id == models.Book.id)
+    if status:
+        query = query.filter(models.Copy.status == models.CopyStatus(status))
+    query = _geohash_filter(query, lat, lon, radius_km)
+
+    results = []
+    for row in query.all():
+        distance = geo.haversine_km(lat, lon, row.latitude, row.longitude)
+        if distance <= radius_km:
+            results.append((distance, row))
+    results.sort(key=lambda item: item[0])
+    return [dict(row._mapping, distance_km=round(distance, 3)) for distance, row in results[:limit]]
+
+def _geohash_filter(query, lat: float, lon: float, radius_km: float):
+    """Restrict query to the geohash cells covering the circle (a superset of it)."""
+    query = query.filter(models.Copy.geohash.isnot(None))
+    cells = geo.covering_cells(lat, lon, radius_km)
+    if cells is None:
+        return query
+    ranges = []
+    for prefix in cells:
+        low, high = geo.prefix_range(prefix)
+        if high is None:
+            ranges.append(models.Copy.geohash >= low)
+        else:
+            ranges.append(and_(models.Copy.geohash >= low, models.Copy.geohash < high))
+    return query.filter(or_(*ranges))
+
+def _get_copies_nearby_postgis(db: Session, lat, lon, radius_km, status, limit):
+    # Tem de coincidir com a expressão do índice GiST (add_copy_coordinates_migration.sql)
+    copy_point = func.geography(func.ST_MakePoint(models.Copy.longitude, models.Copy.latitude))
+    origin = func.geography(func.ST_MakePoint(lon, lat))
+    distance = (func.ST_Distance(copy_point, origin) / 1000.0).label("distance_km")
+    query = db.query(*_nearby_columns(), distance) \
+        .join(models.Book, models.Copy.book_id == models.Book.id) \
+        .filter(models.Copy.latitude.isnot(None), models.Copy.longitude.isnot(None)) \
+        .filter(func.ST_DWithin(copy_point, origin, radius_km * 1000.0))
+    if status:
+        query = query.filter(models.Copy.status == models.CopyStatus(status))
+    rows = query.order_by(distance).limit(limit).all()
+    return [dict(row._mapping, distance_km=round(row.distance_km, 3)) for row in rows]
+
 def get_copies_by_owner(db: Session, owner_id: int):
     return db.query(models.Copy).filter(models.Copy.owner_id == owner_id).all()
 
-def get_transferred_copies(db: Session, original_owner_id: int):
+def get_owner_books(
+    db: Session,
+    owner_id: int,
+    status: models.CopyStatus = None,
+    after: int = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    """Return the copies owned by owner_id joined with their book, as flat rows."""
+    query = db.query(
+        models.Book.id,
+        models.Book.title,
+        models.Book.author,
+        models.Book.isbn,
+        models.Book.cover_url,
+        models.Copy.owner_id,
+        models.Copy.id.label("copy_id"),
+        models.Copy.condition,
+        models.Copy.status,
+    ).join(models.Book, models.Copy.book_id == models.Book.id).filter(models.Copy.owner_id == owner_id)
+    if status:
+        query = query.filter(models.Copy.status == models.CopyStatus(status))
+    return _keyset(query, models.Copy.id, after, limit).all()
+
+def get_transferred_copies(db: Session, original_owner_id: int, after: int = None, limit: int = DEFAULT_PAGE_SIZE):
     """Return copies that were originally owned by original_owner_id but are now owned by someone else."""
-    return db.query(models.Copy).filter(
+    query = db.query(models.Copy).options(
+        joinedload(models.Copy.book),
+        joinedload(models.Copy.owner),
+    ).filter(
         models.Copy.original_owner_id == original_owner_id,
         models.Copy.owner_id != original_owner_id
-    ).all()
+    )
+    return _keyset(query, models.Copy.id, after, limit).all()
+
+def _notify(db: Session, user_id: int, subject: str, body: str, db_copy, requester_id: int):
+    """Grava na outbox um email para user_id sobre a cópia (na transação em curso)."""
+    users = {
+        row.id: row for row in
+        db.query(models.User.id, models.User.name, models.User.email)
+        .filter(models.User.id.in_([user_id, requester_id])).all()
+    }
+    if user_id not in users:
+        return
+    title = db_copy.book.title if db_copy is not None and db_copy.book else "um livro"
+    requester = users.get(requester_id)
+    values = {"title": title, "requester": requester.name if requester else "Alguém"}
+    outbox.enqueue_email(db, users[user_id].email, subject.format(**values), body.format(**values))
 
 # Requests
+# O ciclo de vida (PENDING -> ACCEPTED -> COMPLETED) é feito com UPDATEs
+# condicionais (WHERE status = ...): se dois pedidos concorrentes tentarem a
+# mesma transição, só um altera a linha e o outro recebe ValueError. Assim não
+# é preciso serializar a tabela, apenas as linhas envolvidas.
+ACTIVE_REQUEST_STATUSES = (models.RequestStatus.PENDING, models.RequestStatus.ACCEPTED)
+
 def create_request(db: Session, request: schemas.RequestCreate):
-    # Verificar se a cópia está disponível
-    db_copy = db.query(models.Copy).filter(models.Copy.id == request.copy_id).first()
+    # Verificar se a cópia está disponível (FOR UPDATE bloqueia só esta cópia)
+    db_copy = db.query(models.Copy).filter(models.Copy.id == request.copy_id).with_for_update().first()
     if not db_copy:
         raise ValueError("Copy not found")
     
     if db_copy.status != models.CopyStatus.AVAILABLE:
+        db.rollback()
         raise ValueError(f"Book is not available. Current status: {db_copy.status}")
     
     # Verificar se o usuário não está tentando requisitar seu próprio livro
     if db_copy.owner_id == request.requester_id:
+        db.rollback()
         raise ValueError("Cannot request your own book")
     
-    db_request = models.Request(**request.dict())
+    db_request = models.Request(**request.dict(), status=models.RequestStatus.PENDING)
     db.add(db_request)
-    db.commit()
+    _bump_dashboard(db, db_copy.owner_id, pending_incoming=1)
+    _notify(
+        db, db_copy.owner_id, "Novo pedido para {title}",
+        "{requester} pediu o teu livro \"{title}\".", db_copy, request.requester_id,
+    )
+    try:
+        db.commit()
+    except IntegrityError:
+        # ix_requests_one_active_per_requester: já existe um pedido ativo
+        db.rollback()
+        raise ValueError("You already have an active request for this book")
+    outbox.wake()
     db.refresh(db_request)
     return db_request
 
-def get_requests(db: Session):
-    return db.query(models.Request).all()
+def get_requests(
+    db: Session,
+    status: models.RequestStatus = None,
+    requester_id: int = None,
+    copy_id: int = None,
+    after: int = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    query = db.query(models.Request).options(
+        joinedload(models.Request.requester),
+        joinedload(models.Request.copy).joinedload(models.Copy.book),
+        joinedload(models.Request.copy).joinedload(models.Copy.owner),
+    )
+    if status:
+        query = query.filter(models.Request.status == models.RequestStatus(status))
+    if requester_id is not None:
+        query = query.filter(models.Request.requester_id == requester_id)
+    if copy_id is not None:
+        query = query.filter(models.Request.copy_id == copy_id)
+    return _keyset(query, models.Request.id, after, limit).all()
+
+def get_request_rows(
+    db: Session,
+    status: models.RequestStatus = None,
+    requester_id: int = None,
+    copy_id: int = None,
+    after: int = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    """Like get_requests, but as flat projected rows (see serialization.request_from_row)."""
+    query = _request_rows_query(db)
+    if status:
+        query = query.filter(models.Request.status == models.RequestStatus(status))
+    if requester_id is not None:
+        query = query.filter(models.Request.requester_id == requester_id)
+    if copy_id is not None:
+        query = query.filter(models.Request.copy_id == copy_id)
+    return _keyset(query, models.Request.id, after, limit).all()
+
+def _request_rows_query(db: Session):
+    Owner = aliased(models.User)
+    Requester = aliased(models.User)
+    return db.query(
+        models.Request.id.label("request_id"),
+        models.Request.message.label("request_message"),
+        models.Request.status.label("request_status"),
+        *_copy_columns(Owner),
+        *_user_columns(Requester, "requester"),
+    ).join(models.Copy, models.Request.copy_id == models.Copy.id) \
+     .join(models.Book, models.Copy.book_id == models.Book.id) \
+     .join(Owner, models.Copy.owner_id == Owner.id) \
+     .join(Requester, models.Request.requester_id == Requester.id)
+
+def get_incoming_requests(
+    db: Session,
+    owner_id: int,
+    status: models.RequestStatus = None,
+    after: int = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    """Requests made for copies owned by owner_id, in a single joined query."""
+    query = db.query(
+        models.Request.id,
+        models.Request.copy_id,
+        models.Request.requester_id,
+        models.User.name.label("requester_name"),
+        models.User.email.label("requester_email"),
+        models.Request.message,
+        models.Request.status,
+        models.Request.created_at,
+        models.Book.title.label("book_title"),
+        models.Book.author.label("book_author"),
+        models.Book.isbn.label("book_isbn"),
+    ).join(models.Copy, models.Request.copy_id == models.Copy.id) \
+     .join(models.User, models.Request.requester_id == models.User.id) \
+     .join(models.Book, models.Copy.book_id == models.Book.id) \
+     .filter(models.Copy.owner_id == owner_id)
+    if status:
+        query = query.filter(models.Request.status == models.RequestStatus(status))
+    return _keyset(query, models.Request.id, after, limit).all()
+
+def get_outgoing_requests(
+    db: Session,
+    requester_id: int,
+    status: models.RequestStatus = None,
+    after: int = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    """Requests made by requester_id, with copy, book and owner loaded in the same query."""
+    query = db.query(models.Request).options(
+        joinedload(models.Request.copy).joinedload(models.Copy.book),
+        joinedload(models.Request.copy).joinedload(models.Copy.owner),
+    ).filter(models.Request.requester_id == requester_id)
+    if status:
+        query = query.filter(models.Request.status == models.RequestStatus(status))
+    return _keyset(query, models.Request.id, after, limit).all()
 
 def get_request(db: Session, request_id: int):
     return db.query(models.Request).filter(models.Request.id == request_id).first()
 
+def _transition_request(db: Session, request_id: int, from_status, to_status) -> bool:
+    updated = db.query(models.Request).filter(
+        models.Request.id == request_id,
+        models.Request.status == from_status,
+    ).update({models.Request.status: to_status}, synchronize_session=False)
+    return updated == 1
+
 def accept_request(db: Session, request_id: int):
-    """Aceita um request (owner aceita) - muda status para ACCEPTED e copy para RESERVED"""
+    """Aceita um request (owner aceita) - muda status para ACCEPTED e copy para RESERVED
+
+    Só um request por cópia pode ser aceite: a cópia passa de AVAILABLE para
+    RESERVED num UPDATE condicional e o segundo accept concorrente falha.
+    """
     db_request = db.query(models.Request).filter(models.Request.id == request_id).first()
     if not db_request:
         return None
+    current_status = db_request.status
     
-    # Atualiza o status do request
-    db_request.status = models.RequestStatus.ACCEPTED
+    # Atualiza o status do request (só se ainda estiver PENDING)
+    if not _transition_request(db, request_id, models.RequestStatus.PENDING, models.RequestStatus.ACCEPTED):
+        db.rollback()
+        raise ValueError(f"Request cannot be accepted. Current status: {current_status.value}")
     
-    # Atualiza o status da cópia para RESERVED
-    db_copy = db.query(models.Copy).filter(models.Copy.id == db_request.copy_id).first()
-    if db_copy:
-        db_copy.status = models.CopyStatus.RESERVED
+    # Atualiza o status da cópia para RESERVED (só se ainda estiver AVAILABLE)
+    reserved = db.query(models.Copy).filter(
+        models.Copy.id == db_request.copy_id,
+        models.Copy.status == models.CopyStatus.AVAILABLE,
+    ).update({models.Copy.status: models.CopyStatus.RESERVED}, synchronize_session=False)
+    if not reserved:
+        db.rollback()
+        raise ValueError("Book is no longer available")
     
+    owner_id = db.query(models.Copy.owner_id).filter(models.Copy.id == db_request.copy_id).scalar()
+    _bump_dashboard(db, owner_id, available_copies=-1, reserved_copies=1, pending_incoming=-1)
+    _notify(
+        db, db_request.requester_id, "Pedido aceite: {title}",
+        "O teu pedido de \"{title}\" foi aceite. Combina a entrega na conversa do pedido.",
+        db_request.copy, db_request.requester_id,
+    )
     db.commit()
+    outbox.wake()
+    cache.invalidate("catalogue", "copies", cache.owner_tag(owner_id))
     db.refresh(db_request)
     return db_request
 
@@ -107,41 +674,496 @@ def confirm_delivery(db: Session, request_id: int):
     db_request = db.query(models.Request).filter(models.Request.id == request_id).first()
     if not db_request:
         return None
+    current_status = db_request.status
     
-    # Atualiza o status do request
-    db_request.status = models.RequestStatus.COMPLETED
+    # Bloqueia a cópia para ler o owner atual antes de transferir
+    db_copy = db.query(models.Copy).filter(models.Copy.id == db_request.copy_id).with_for_update().first()
+    if not db_copy:
+        db.rollback()
+        raise ValueError("Copy not found")
+    previous_owner_id = db_copy.owner_id
     
-    # Transfere a propriedade da cópia para o requester
-    db_copy = db.query(models.Copy).filter(models.Copy.id == db_request.copy_id).first()
-    if db_copy:
-        # MUDANÇA IMPORTANTE: Transferir propriedade
-        db_copy.owner_id = db_request.requester_id  # Novo owner é o requester
-        db_copy.status = models.CopyStatus.AVAILABLE  # Volta a estar disponível para o novo owner
+    # Atualiza o status do request (só se estiver ACCEPTED)
+    if not _transition_request(db, request_id, models.RequestStatus.ACCEPTED, models.RequestStatus.COMPLETED):
+        db.rollback()
+        raise ValueError(f"Delivery cannot be confirmed. Current status: {current_status.value}")
     
+    # As conversas da cópia mudam de owner: guarda as mensagens por ler de
+    # cada um para acertar unread_messages depois da transferência
+    participants = (previous_owner_id, db_request.requester_id)
+    in_copy = models.Request.copy_id == db_copy.id
+    unread_before = [_unread_messages_where(db, user_id, in_copy) for user_id in participants]
+
+    # MUDANÇA IMPORTANTE: Transferir propriedade para o requester e voltar a
+    # estar disponível para o novo owner (só se a cópia ainda estiver RESERVED)
+    transferred = db.query(models.Copy).filter(
+        models.Copy.id == db_copy.id,
+        models.Copy.status == models.CopyStatus.RESERVED,
+        models.Copy.owner_id == previous_owner_id,
+    ).update({
+        models.Copy.owner_id: db_request.requester_id,
+        models.Copy.status: models.CopyStatus.AVAILABLE,
+    }, synchronize_session=False)
+    if not transferred:
+        db.rollback()
+        raise ValueError("Copy is not reserved for this request")
+    
+    # Regista a transferência no ledger (histórico completo de owners)
+    db.add(models.CopyTransfer(
+        copy_id=db_copy.id,
+        request_id=request_id,
+        from_user_id=previous_owner_id,
+        to_user_id=db_request.requester_id,
+    ))
+    # Os outros pedidos PENDING desta cópia passam a ser incoming do novo owner
+    pending = db.query(func.count(models.Request.id)).filter(
+        models.Request.copy_id == db_copy.id,
+        models.Request.status == models.RequestStatus.PENDING,
+    ).scalar()
+    # /sync: os pedidos desta cópia passam a ser do novo owner (updated_at) e
+    # deixam de ser do owner anterior (tombstones só para ele)
+    copy_requests = [
+        row.id for row in db.query(models.Request.id).filter(
+            models.Request.copy_id == db_copy.id,
+            models.Request.requester_id != previous_owner_id,
+        )
+    ]
+    db.query(models.Request).filter(
+        models.Request.copy_id == db_copy.id, models.Request.id != request_id,
+    ).update({models.Request.updated_at: func.now()}, synchronize_session=False)
+    db.add_all([
+        models.Tombstone(entity="requests", entity_id=copy_request_id, owner_id=previous_owner_id)
+        for copy_request_id in copy_requests
+    ])
+    unread_delta = [
+        _unread_messages_where(db, user_id, in_copy) - before
+        for user_id, before in zip(participants, unread_before)
+    ]
+    _bump_dashboard(
+        db, previous_owner_id,
+        reserved_copies=-1, pending_incoming=-pending, unread_messages=unread_delta[0],
+    )
+    _bump_dashboard(
+        db, db_request.requester_id,
+        available_copies=1, pending_incoming=pending, unread_messages=unread_delta[1],
+    )
+    _notify(
+        db, previous_owner_id, "Entrega confirmada: {title}",
+        "{requester} confirmou a entrega de \"{title}\".", db_copy, db_request.requester_id,
+    )
     db.commit()
+    outbox.wake()
+    cache.invalidate(
+        "catalogue", "copies",
+        cache.owner_tag(previous_owner_id), cache.owner_tag(db_request.requester_id),
+    )
     db.refresh(db_request)
     return db_request
 
+# Transfers (ledger)
+def get_copy_provenance(db: Session, copy_id: int):
+    """Full ownership chain of a copy, oldest transfer first."""
+    FromUser = aliased(models.User)
+    ToUser = aliased(models.User)
+    return db.query(
+        models.CopyTransfer.id,
+        models.CopyTransfer.request_id,
+        models.CopyTransfer.from_user_id,
+        FromUser.name.label("from_user_name"),
+        models.CopyTransfer.to_user_id,
+        ToUser.name.label("to_user_name"),
+        models.CopyTransfer.created_at,
+    ).outerjoin(FromUser, models.CopyTransfer.from_user_id == FromUser.id) \
+     .outerjoin(ToUser, models.CopyTransfer.to_user_id == ToUser.id) \
+     .filter(models.CopyTransfer.copy_id == copy_id) \
+     .order_by(models.CopyTransfer.id).all()
+
+def _user_transfers_query(db: Session, user_id: int, direction: str = None):
+    FromUser = aliased(models.User)
+    ToUser = aliased(models.User)
+    query = db.query(
+        models.CopyTransfer.id,
+        models.CopyTransfer.copy_id,
+        models.CopyTransfer.request_id,
+        models.Book.title.label("book_title"),
+        models.Book.author.label("book_author"),
+        models.Book.isbn.label("book_isbn"),
+        models.CopyTransfer.from_user_id,
+        FromUser.name.label("from_user_name"),
+        models.CopyTransfer.to_user_id,
+        ToUser.name.label("to_user_name"),
+        models.CopyTransfer.created_at,
+    ).join(models.Copy, models.CopyTransfer.copy_id == models.Copy.id) \
+     .join(models.Book, models.Copy.book_id == models.Book.id) \
+     .outerjoin(FromUser, models.CopyTransfer.from_user_id == FromUser.id) \
+     .outerjoin(ToUser, models.CopyTransfer.to_user_id == ToUser.id)
+    if direction == "given":
+        query = query.filter(models.CopyTransfer.from_user_id == user_id)
+    elif direction == "received":
+        query = query.filter(models.CopyTransfer.to_user_id == user_id)
+    else:
+        query = query.filter(or_(
+            models.CopyTransfer.from_user_id == user_id,
+            models.CopyTransfer.to_user_id == user_id,
+        ))
+    return query
+
+def get_user_transfers(
+    db: Session,
+    user_id: int,
+    direction: str = None,
+    after: int = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    """Transfers given (from_user_id) and/or received (to_user_id) by user_id."""
+    query = _user_transfers_query(db, user_id, direction)
+    return _keyset(query, models.CopyTransfer.id, after, limit).all()
+
+def get_recent_transfers(db: Session, user_id: int, limit: int = 5):
+    """Most recent transfers (given or received) of user_id, newest first."""
+    query = _user_transfers_query(db, user_id)
+    return query.order_by(models.CopyTransfer.id.desc()).limit(limit).all()
+
 def delete_request(db: Session, request_id: int):
     """Cancela/remove um request"""
     db_request = db.query(models.Request).filter(models.Request.id == request_id).first()
     if not db_request:
         return False
+    # Um request COMPLETED está no ledger de transferências (copy_transfers), que é append-only
+    if db_request.status == models.RequestStatus.COMPLETED:
+        raise ValueError("Completed requests cannot be cancelled")
+    
+    # Um request aceite tinha reservado a cópia: volta a ficar disponível
+    released = False
+    if db_request.status == models.RequestStatus.ACCEPTED:
+        released = db.query(models.Copy).filter(
+            models.Copy.id == db_request.copy_id,
+            models.Copy.status == models.CopyStatus.RESERVED,
+        ).update({models.Copy.status: models.CopyStatus.AVAILABLE}, synchronize_session=False) == 1
+    
+    owner_id = db.query(models.Copy.owner_id).filter(models.Copy.id == db_request.copy_id).scalar()
+    status = db_request.status
+    # As mensagens da conversa deixam de contar como por ler
+    in_request = models.Request.id == db_request.id
+    requester_unread = _unread_messages_where(db, db_request.requester_id, in_request)
+    owner_unread = _unread_messages_where(db, owner_id, in_request)
     
+    # Tombstone para o /sync: os clientes removem o request da cache local
+    db.add(models.Tombstone(
+        entity="requests", entity_id=db_request.id,
+        requester_id=db_request.requester_id, owner_id=owner_id,
+    ))
     db.delete(db_request)
+    if status == models.RequestStatus.PENDING:
+        _bump_dashboard(db, owner_id, pending_incoming=-1, unread_messages=-owner_unread)
+    elif released:
+        _bump_dashboard(db, owner_id, available_copies=1, reserved_copies=-1, unread_messages=-owner_unread)
+    else:
+        _bump_dashboard(db, owner_id, unread_messages=-owner_unread)
+    _bump_dashboard(db, db_request.requester_id, unread_messages=-requester_unread)
     db.commit()
+    if released:
+        cache.invalidate("catalogue", "copies", cache.owner_tag(owner_id))
     return True
 
+# Dashboard
+# user_dashboards é um read model: as mutações acima aplicam deltas na mesma
+# transação (UPDATE ... SET col = col + delta), depois de terem feito as suas
+# alterações. Se a linha ainda não existe é criada nessa altura, já calculada
+# de raiz (o que inclui as alterações da própria transação). O rebuild bloqueia
+# a linha (FOR UPDATE) antes de contar, por isso um delta concorrente é
+# aplicado antes da contagem (e visto por ela) ou depois do rebuild.
+_COPY_STATUS_COLUMNS = {
+    models.CopyStatus.AVAILABLE: "available_copies",
+    models.CopyStatus.REQUESTED: "requested_copies",
+    models.CopyStatus.RESERVED: "reserved_copies",
+    models.CopyStatus.BORROWED: "borrowed_copies",
+}
+
+def _apply_dashboard_deltas(db: Session, user_id: int, deltas: dict) -> bool:
+    columns = {
+        getattr(models.UserDashboard, name): getattr(models.UserDashboard, name) + delta
+        for name, delta in deltas.items()
+    }
+    columns[models.UserDashboard.updated_at] = func.now()
+    return db.query(models.UserDashboard).filter(models.UserDashboard.user_id == user_id) \
+        .update(columns, synchronize_session=False) == 1
+
+def _bump_dashboard(db: Session, user_id: int, **deltas):
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if user_id is None or not deltas:
+        return
+    if _apply_dashboard_deltas(db, user_id, deltas):
+        return
+    # Sem linha: cria-a com as contagens atuais, que depois do flush já incluem
+    # esta alteração. Se outra transação a criou entretanto, essa não viu as
+    # nossas alterações e o delta tem de ser aplicado.
+    db.flush()
+    if not _insert_dashboard(db, user_id, _dashboard_counts(db, user_id, 0)):
+        _apply_dashboard_deltas(db, user_id, deltas)
+
+def _bump_copy_status(db: Session, user_id: int, status, delta: int):
+    _bump_dashboard(db, user_id, **{_COPY_STATUS_COLUMNS[models.CopyStatus(status)]: delta})
+
+def _unread_messages_query(db: Session, user_id: int, last_read_message_id: int):
+    return db.query(func.count(models.Message.id)) \
+        .join(models.Request, models.Message.request_id == models.Request.id) \
+        .join(models.Copy, models.Request.copy_id == models.Copy.id) \
+        .filter(
+            or_(models.Request.requester_id == user_id, models.Copy.owner_id == user_id),
+            models.Message.sender_id != user_id,
+            models.Message.id > last_read_message_id,
+        )
+
+def _unread_messages_where(db: Session, user_id: int, *criteria) -> int:
+    """Mensagens por ler do user, contadas como no rebuild, só nos requests filtrados.
+
+    Serve para acertar unread_messages quando uma mutação muda quem participa
+    numa conversa (transferência da cópia, request apagado).
+    """
+    last_read_message_id = db.query(models.UserDashboard.last_read_message_id) \
+        .filter(models.UserDashboard.user_id == user_id).scalar() or 0
+    return _unread_messages_query(db, user_id, last_read_message_id).filter(*criteria).scalar()
+
+def _dashboard_counts(db: Session, user_id: int, last_read_message_id: int) -> dict:
+    """Contadores do dashboard calculados de raiz (copies, requests e messages)."""
+    counts = dict(
+        db.query(models.Copy.status, func.count(models.Copy.id))
+        .filter(models.Copy.owner_id == user_id)
+        .group_by(models.Copy.status).all()
+    )
+    values = {column: counts.get(status, 0) for status, column in _COPY_STATUS_COLUMNS.items()}
+    values["pending_incoming"] = db.query(func.count(models.Request.id)) \
+        .join(models.Copy, models.Request.copy_id == models.Copy.id) \
+        .filter(models.Copy.owner_id == user_id, models.Request.status == models.RequestStatus.PENDING) \
+        .scalar()
+    values["unread_messages"] = _unread_messages_query(db, user_id, last_read_message_id).scalar()
+    return values
+
+def _insert_dashboard(db: Session, user_id: int, values: dict) -> bool:
+    """INSERT ... ON CONFLICT DO NOTHING; False se a linha já existia."""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    statement = upsert(models.UserDashboard).values(user_id=user_id, last_read_message_id=0, **values) \
+        .on_conflict_do_nothing(index_elements=["user_id"])
+    return db.execute(statement).rowcount == 1
+
+def rebuild_dashboard(db: Session, user_id: int):
+    """Recalcula o dashboard de raiz (a partir de copies, requests e messages)."""
+    query = db.query(models.UserDashboard).filter(models.UserDashboard.user_id == user_id)
+    db_dashboard = query.with_for_update().first()
+    if db_dashboard is None:
+        # Se outro pedido a criou entretanto, fica a dele (também calculada de raiz)
+        _insert_dashboard(db, user_id, _dashboard_counts(db, user_id, 0))
+        db.commit()
+        return query.first()
+    for column, value in _dashboard_counts(db, user_id, db_dashboard.last_read_message_id or 0).items():
+        setattr(db_dashboard, column, value)
+    db.commit()
+    db.refresh(db_dashboard)
+    return db_dashboard
+
+def get_dashboard(db: Session, user_id: int, refresh: bool = False):
+    db_dashboard = db.query(models.UserDashboard).filter(models.UserDashboard.user_id == user_id).first()
+    if db_dashboard is None or refresh:
+        db_dashboard = rebuild_dashboard(db, user_id)
+    return db_dashboard
+
+def mark_messages_read(db: Session, user_id: int):
+    """Marca como lidas todas as mensagens recebidas até agora."""
+    db_dashboard = get_dashboard(db, user_id)
+    # Última mensagem das conversas deste user (como requester ou como owner)
+    last_id = db.query(func.max(models.Message.id)) \
+        .join(models.Request, models.Message.request_id == models.Request.id) \
+        .join(models.Copy, models.Request.copy_id == models.Copy.id) \
+        .filter(or_(models.Request.requester_id == user_id, models.Copy.owner_id == user_id)) \
+        .scalar() or 0
+    db.query(models.UserDashboard).filter(models.UserDashboard.user_id == user_id).update({
+        models.UserDashboard.last_read_message_id: last_id,
+        models.UserDashboard.unread_messages: _unread_messages_query(db, user_id, last_id).scalar_subquery(),
+        models.UserDashboard.updated_at: func.now(),
+    }, synchronize_session=False)
+    db.commit()
+    db.refresh(db_dashboard)
+    return db_dashboard
+
 # Messages
 def create_message(db: Session, message: schemas.MessageCreate):
+    """Grava a mensagem e devolve-a como dict (mesmo formato de get_messages_by_request)."""
     db_message = models.Message(**message.dict())
     db.add(db_message)
+    # A mensagem fica por ler do lado da outra parte da conversa
+    participants = db.query(models.Request.requester_id, models.Copy.owner_id) \
+        .join(models.Copy, models.Request.copy_id == models.Copy.id) \
+        .filter(models.Request.id == db_message.request_id).first()
+    if participants:
+        for user_id in set(participants) - {db_message.sender_id}:
+            _bump_dashboard(db, user_id, unread_messages=1)
     db.commit()
     db.refresh(db_message)
-    return db_message
+    # Só o nome do sender (carregar a relação traria a linha User inteira)
+    sender_name = db.query(models.User.name).filter(models.User.id == db_message.sender_id).scalar()
+    payload = {
+        "id": db_message.id,
+        "request_id": db_message.request_id,
+        "sender_id": db_message.sender_id,
+        "content": db_message.content,
+        "created_at": db_message.created_at,
+        "sender_name": sender_name,
+    }
+    # Entrega em tempo real aos clientes ligados a esta conversa
+    pubsub.broker.publish(pubsub.request_topic(db_message.request_id), payload)
+    return payload
+
+def get_messages_by_request(db: Session, request_id: int, since_id: int = None, since: datetime = None):
+    """Messages of a conversation, oldest first, with the sender name joined.
 
-def get_messages_by_request(db: Session, request_id: int):
-    return db.query(models.Message).filter(models.Message.request_id == request_id).order_by(models.Message.created_at.asc()).all()
+    since_id/since return only the messages newer than what the client already
+    has; with the (request_id, id) index this is a single ordered range scan.
+    """
+    query = db.query(
+        models.Message.id,
+        models.Message.request_id,
+        models.Message.sender_id,
+        models.Message.content,
+        models.Message.created_at,
+        models.User.name.label("sender_name"),
+    ).outerjoin(models.User, models.Message.sender_id == models.User.id) \
+     .filter(models.Message.request_id == request_id)
+    if since_id is not None:
+        query = query.filter(models.Message.id > since_id)
+    if since is not None:
+        query = query.filter(models.Message.created_at > since)
+    return query.order_by(models.Message.id.asc()).all()
 
 def get_message(db: Session, message_id: int):
     return db.query(models.Message).filter(models.Message.id == message_id).first()
+
+# Recommendations
+def get_recommendations(
+    db: Session,
+    user_id: int,
+    municipio: str = None,
+    lat: float = None,
+    lon: float = None,
+    radius_km: float = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    """Available copies of the books precomputed for user_id (app/recommendations.py),
+    best score first, in municipio or within radius_km of (lat, lon).
+
+    Only the user's rows of user_recommendations are read (by the (user_id, score)
+    index), so the cost does not depend on the size of the catalogue.
+    """
+    recommendation = models.UserRecommendation
+    query = db.query(
+        *_nearby_columns(),
+        recommendation.score,
+        recommendation.genre_score,
+        recommendation.cotransfer_score,
+    ).join(models.Book, models.Copy.book_id == models.Book.id) \
+     .join(recommendation, and_(
+        recommendation.book_id == models.Copy.book_id,
+        recommendation.user_id == user_id,
+     )).filter(
+        models.Copy.status == models.CopyStatus.AVAILABLE,
+        models.Copy.owner_id != user_id,
+     )
+    if lat is None or lon is None:
+        if municipio:
+            query = query.filter(models.Copy.location == municipio)
+        rows = query.order_by(recommendation.score.desc(), models.Copy.id).limit(limit).all()
+        return [dict(row._mapping) for row in rows]
+
+    results = []
+    for row in _geohash_filter(query, lat, lon, radius_km).all():
+        distance = geo.haversine_km(lat, lon, row.latitude, row.longitude)
+        if distance <= radius_km:
+            results.append(dict(row._mapping, distance_km=round(distance, 3)))
+    results.sort(key=lambda item: (-item["score"], item["copy_id"]))
+    return results[:limit]
+
+# Sync
+# O token de sincronização é o instante (relógio da base de dados, em
+# microssegundos desde a epoch) em que a sincronização anterior começou. Uma
+# transação que ainda não tinha feito commit nessa altura pode gravar um
+# updated_at anterior ao token, por isso cada sync volta a ler os últimos
+# SYNC_OVERLAP_SECONDS: o cliente aplica as alterações por id (upsert), logo
+# receber uma linha duas vezes não tem efeito.
+#
+# As listas (e os tombstones) são paginadas por keyset com after/limit, com ou
+# sem token, cada uma pelo seu id; o cursor seguinte é o menor último id das
+# listas que encheram a página, por isso nenhuma linha fica de fora (algumas
+# das outras listas podem repetir-se). As páginas seguintes repetem o mesmo
+# since e o token a guardar é o da primeira página.
+SYNC_OVERLAP_SECONDS = float(os.getenv("SYNC_OVERLAP_SECONDS", "10"))
+
+def sync_token(moment: datetime) -> int:
+    if moment.tzinfo is None:
+        # SQLite devolve o CURRENT_TIMESTAMP sem fuso (é UTC)
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1_000_000)
+
+def parse_sync_token(token: int) -> datetime:
+    return datetime.fromtimestamp(token / 1_000_000, timezone.utc)
+
+def get_changes(
+    db: Session,
+    since: int = None,
+    user_id: int = None,
+    after: int = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    """Books, copies and (for user_id) requests created or changed since the token,
+    plus the ids of the user's requests deleted since then. since=None is a
+    snapshot. Every list is paginated with after/limit (changes["cursor"] is
+    the next page).
+    """
+    token = sync_token(db.query(func.now()).scalar())
+    cutoff = None
+    if since is not None:
+        cutoff = parse_sync_token(since) - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+
+    books = db.query(
+        models.Book.id, models.Book.title, models.Book.author, models.Book.isbn, models.Book.cover_url,
+    )
+    copies = _copy_rows_query(db)
+    if cutoff is not None:
+        books = books.filter(models.Book.updated_at >= cutoff)
+        copies = copies.filter(models.Copy.updated_at >= cutoff)
+    changes = {
+        "token": token,
+        "books": _keyset(books, models.Book.id, after, limit).all(),
+        "copies": _keyset(copies, models.Copy.id, after, limit).all(),
+        "requests": [],
+        "deleted_requests": [],
+        "cursor": None,
+    }
+    pages = [
+        (changes["books"][-1].id if changes["books"] else None, len(changes["books"])),
+        (changes["copies"][-1].copy_id if changes["copies"] else None, len(changes["copies"])),
+    ]
+
+    # Requests só do próprio user (como requester ou como owner da cópia)
+    if user_id is not None:
+        requests = _request_rows_query(db).filter(
+            or_(models.Request.requester_id == user_id, models.Copy.owner_id == user_id)
+        )
+        if cutoff is not None:
+            requests = requests.filter(models.Request.updated_at >= cutoff)
+            tombstones = _keyset(db.query(models.Tombstone.id, models.Tombstone.entity_id).filter(
+                models.Tombstone.entity == "requests",
+                models.Tombstone.deleted_at >= cutoff,
+                or_(models.Tombstone.requester_id == user_id, models.Tombstone.owner_id == user_id),
+            ), models.Tombstone.id, after, limit).all()
+            changes["deleted_requests"] = [row.entity_id for row in tombstones]
+            pages.append((tombstones[-1].id if tombstones else None, len(tombstones)))
+        changes["requests"] = _keyset(requests, models.Request.id, after, limit).all()
+        pages.append((changes["requests"][-1].request_id if changes["requests"] else None, len(changes["requests"])))
+
+    cursors = [next_cursor(last_id, count, limit) for last_id, count in pages]
+    cursors = [cursor for cursor in cursors if cursor is not None]
+    changes["cursor"] = min(cursors) if cursors else None
+    return changes
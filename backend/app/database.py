@@ -1,11 +1,127 @@
+import itertools
+
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 
+from app import pool_metrics
+
 # Busca a URL do banco de dados da variável de ambiente, com um valor padrão
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://noshelf_user:Carminauriel1984/@localhost/noshelf")
 
-engine = create_engine(DATABASE_URL)
+# Configuração do pool de ligações
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # segundos; -1 desativa
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1").lower() in ("1", "true", "yes")
+
+def _pool_options(url: str, poolclass) -> dict:
+    # SQLite: em memória fica com o pool do dialeto; em ficheiro mantém os
+    # tamanhos por omissão mas com o pool instrumentado
+    if url.startswith("sqlite"):
+        if ":memory:" in url or url.rstrip("/").endswith(":"):
+            return {"pool_pre_ping": DB_POOL_PRE_PING}
+        return {"poolclass": poolclass, "pool_timeout": DB_POOL_TIMEOUT, "pool_pre_ping": DB_POOL_PRE_PING}
+    return {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+engine = create_engine(DATABASE_URL, **_pool_options(DATABASE_URL, pool_metrics.InstrumentedQueuePool))
+pool_stats = pool_metrics.instrument(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+# Réplicas de leitura (REPLICA_DATABASE_URLS, separadas por vírgulas): os
+# endpoints de leitura usam-nas em round-robin, as mutações usam sempre o
+# primário (ver app/replicas.py para o read-your-writes)
+REPLICA_DATABASE_URLS = [url.strip() for url in os.getenv("REPLICA_DATABASE_URLS", "").split(",") if url.strip()]
+
+replica_engines = [
+    create_engine(url, **_pool_options(url, pool_metrics.InstrumentedQueuePool))
+    for url in REPLICA_DATABASE_URLS
+]
+replica_pool_stats = [pool_metrics.instrument(replica) for replica in replica_engines]
+ReplicaSessionLocals = [
+    sessionmaker(autocommit=False, autoflush=False, bind=replica, info={"replica": True})
+    for replica in replica_engines
+]
+_next_replica = itertools.count()
+
+def read_session_factory(primary: bool = False):
+    """Session factory para leituras: a próxima réplica, ou o primário se não há
+    réplicas ou se primary=True."""
+    if primary or not ReplicaSessionLocals:
+        return SessionLocal
+    return ReplicaSessionLocals[next(_next_replica) % len(ReplicaSessionLocals)]
+
+# Pesquisa por proximidade com PostGIS (só em Postgres com a extensão instalada);
+# sem ela é usado o índice geohash
+USE_POSTGIS = os.getenv("USE_POSTGIS", "0").lower() in ("1", "true", "yes")
+
+# Camada async opcional (USE_ASYNC_DB=1): os endpoints de leitura passam a usar
+# AsyncSession, com asyncpg em Postgres ou aiosqlite para testes locais; as
+# mutações ficam nas rotas sync (ver app/async_routes.py)
+ASYNC_ENABLED = os.getenv("USE_ASYNC_DB", "0").lower() in ("1", "true", "yes")
+
+def _async_url(url: str) -> str:
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", _async_url(DATABASE_URL))
+
+async_engine = None
+async_pool_stats = None
+AsyncSessionLocal = None
+async_replica_engines = []
+async_replica_pool_stats = []
+AsyncReplicaSessionLocals = []
+if ASYNC_ENABLED:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        **_pool_options(ASYNC_DATABASE_URL, pool_metrics.InstrumentedAsyncAdaptedQueuePool),
+    )
+    async_pool_stats = pool_metrics.instrument(async_engine.sync_engine)
+    # expire_on_commit=False: os objetos devolvidos continuam legíveis depois do
+    # commit sem novo acesso (lazy) à base de dados fora do event loop
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+    for url in map(_async_url, REPLICA_DATABASE_URLS):
+        replica = create_async_engine(url, **_pool_options(url, pool_metrics.InstrumentedAsyncAdaptedQueuePool))
+        async_replica_engines.append(replica)
+        async_replica_pool_stats.append(pool_metrics.instrument(replica.sync_engine))
+        AsyncReplicaSessionLocals.append(async_sessionmaker(
+            bind=replica, autoflush=False, expire_on_commit=False, info={"replica": True},
+        ))
+
+def is_replica(db) -> bool:
+    """True se a Session (sync, ou a de uma AsyncSession.run_sync) lê de uma réplica."""
+    return db.info.get("replica", False)
+
+def async_read_session_factory(primary: bool = False):
+    """Como read_session_factory, para a camada async."""
+    if primary or not AsyncReplicaSessionLocals:
+        return AsyncSessionLocal
+    return AsyncReplicaSessionLocals[next(_next_replica) % len(AsyncReplicaSessionLocals)]
+
+
+def get_pool_status() -> dict:
+    status = {"sync": pool_metrics.snapshot(engine, pool_stats)}
+    for index, (replica, stats) in enumerate(zip(replica_engines, replica_pool_stats)):
+        status[f"replica-{index}"] = pool_metrics.snapshot(replica, stats)
+    if async_engine is not None:
+        status["async"] = pool_metrics.snapshot(async_engine.sync_engine, async_pool_stats)
+    for index, (replica, stats) in enumerate(zip(async_replica_engines, async_replica_pool_stats)):
+        status[f"async-replica-{index}"] = pool_metrics.snapshot(replica.sync_engine, stats)
+    return status
@@ -0,0 +1,156 @@
+"""Exportação em streaming (NDJSON ou CSV) para os jobs de análise.
+
+As linhas são lidas com yield_per (cursor do lado do servidor em Postgres) e
+escritas em blocos à medida que chegam, sem materializar a tabela nem criar
+modelos Pydantic por linha. Cada exportação abre a sua própria sessão, que
+fica aberta enquanto a resposta é enviada.
+
+Com user_id a exportação só tem as linhas desse user: as suas cópias, os
+requests e conversas em que participa (como requester ou owner da cópia) e as
+transferências de/para ele. Sem user_id (só admins, ver GET /export) exporta
+tudo.
+"""
+import csv
+import io
+import json
+import os
+from datetime import date, datetime
+from enum import Enum
+
+from sqlalchemy import or_, select
+
+from app import models
+from app.database import SessionLocal
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _copies(user_id: int = None):
+    query = select(
+        models.Copy.id,
+        models.Copy.book_id,
+        models.Book.title,
+        models.Book.author,
+        models.Book.isbn,
+        models.Copy.owner_id,
+        models.Copy.original_owner_id,
+        models.Copy.condition,
+        models.Copy.status,
+        models.Copy.location,
+        models.Copy.latitude,
+        models.Copy.longitude,
+        models.Copy.created_at,
+    ).join(models.Book, models.Copy.book_id == models.Book.id).order_by(models.Copy.id)
+    if user_id is not None:
+        query = query.where(models.Copy.owner_id == user_id)
+    return query
+
+
+def _participant(user_id: int):
+    return or_(models.Request.requester_id == user_id, models.Copy.owner_id == user_id)
+
+
+def _requests(user_id: int = None):
+    query = select(
+        models.Request.id,
+        models.Request.copy_id,
+        models.Copy.book_id,
+        models.Copy.owner_id,
+        models.Request.requester_id,
+        models.Request.status,
+        models.Request.message,
+        models.Request.created_at,
+        models.Request.updated_at,
+    ).join(models.Copy, models.Request.copy_id == models.Copy.id).order_by(models.Request.id)
+    if user_id is not None:
+        query = query.where(_participant(user_id))
+    return query
+
+
+def _messages(user_id: int = None):
+    query = select(
+        models.Message.id,
+        models.Message.request_id,
+        models.Message.sender_id,
+        models.Message.content,
+        models.Message.created_at,
+    ).order_by(models.Message.id)
+    if user_id is not None:
+        query = query.join(models.Request, models.Message.request_id == models.Request.id) \
+            .join(models.Copy, models.Request.copy_id == models.Copy.id) \
+            .where(_participant(user_id))
+    return query
+
+
+def _transfers(user_id: int = None):
+    # Ledger de transferências (todas as passagens, não só original vs atual)
+    query = select(
+        models.CopyTransfer.id,
+        models.CopyTransfer.copy_id,
+        models.Copy.book_id,
+        models.Book.title,
+        models.Book.isbn,
+        models.CopyTransfer.request_id,
+        models.CopyTransfer.from_user_id,
+        models.CopyTransfer.to_user_id,
+        models.Copy.original_owner_id,
+        models.CopyTransfer.created_at,
+    ).join(models.Copy, models.CopyTransfer.copy_id == models.Copy.id) \
+     .join(models.Book, models.Copy.book_id == models.Book.id) \
+     .order_by(models.CopyTransfer.id)
+    if user_id is not None:
+        query = query.where(or_(
+            models.CopyTransfer.from_user_id == user_id, models.CopyTransfer.to_user_id == user_id,
+        ))
+    return query
+
+
+DATASETS = {
+    "copies": _copies,
+    "requests": _requests,
+    "messages": _messages,
+    "transfers": _transfers,
+}
+
+
+def _value(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _ndjson(columns, batch):
+    return "".join(
+        json.dumps({column: _value(value) for column, value in zip(columns, row)}, ensure_ascii=False) + "\n"
+        for row in batch
+    )
+
+
+def _csv(batch, header=None):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header is not None:
+        writer.writerow(header)
+    writer.writerows([_value(value) for value in row] for row in batch)
+    return buffer.getvalue()
+
+
+def stream(dataset: str, fmt: str, user_id: int = None):
+    """Gerador de blocos de texto com o dataset no formato pedido (só do user_id, se dado)."""
+    db = SessionLocal()
+    try:
+        result = db.execute(DATASETS[dataset](user_id).execution_options(yield_per=EXPORT_BATCH_SIZE))
+        columns = list(result.keys())
+        if fmt == "csv":
+            yield _csv([], header=columns)
+        for batch in result.partitions():
+            yield _ndjson(columns, batch) if fmt == "ndjson" else _csv(batch)
+    finally:
+        db.close()
@@ -0,0 +1,114 @@
+"""Geohash e distâncias para a pesquisa de livros por proximidade.
+
+Cada cópia com coordenadas guarda o seu geohash (GEOHASH_PRECISION caracteres).
+Para procurar num raio, calcula-se o conjunto de células geohash que cobre o
+retângulo à volta do círculo; cada célula é um intervalo contíguo no índice
+da coluna geohash, por isso a query só lê as cópias dessas células em vez de
+percorrer a tabela inteira. A distância exata é depois filtrada em Python.
+"""
+import math
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+# Número máximo de células por pesquisa (escolhe a precisão mais fina que cabe)
+MAX_CELLS = 16
+
+
+def encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bit = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if lon >= mid:
+                value = (value << 1) | 1
+                lon_range[0] = mid
+            else:
+                value <<= 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if lat >= mid:
+                value = (value << 1) | 1
+                lat_range[0] = mid
+            else:
+                value <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(BASE32[value])
+            bit = 0
+            value = 0
+    return "".join(chars)
+
+
+def cell_size(precision: int):
+    """(altura em graus de latitude, largura em graus de longitude) de uma célula."""
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat: float, lon: float, radius_km: float):
+    """(min_lat, max_lat, min_lon, max_lon) que contém o círculo."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat = max(-90.0, lat - dlat)
+    max_lat = min(90.0, lat + dlat)
+    if max_lat >= 90.0 or min_lat <= -90.0:
+        return min_lat, max_lat, -180.0, 180.0
+    # Maior diferença de longitude dentro do círculo: é atingida perto da borda
+    # do lado do polo, não na latitude do centro, por isso não basta usar
+    # radius / cos(lat). sin(dlon) = sin(raio angular) / cos(lat).
+    ratio = math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat))
+    if ratio >= 1.0:
+        return min_lat, max_lat, -180.0, 180.0
+    dlon = math.degrees(math.asin(ratio))
+    return min_lat, max_lat, lon - dlon, lon + dlon
+
+
+def covering_cells(lat: float, lon: float, radius_km: float):
+    """Prefixos geohash que cobrem o círculo, ou None se for preciso ler tudo."""
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_h, lon_w = cell_size(precision)
+        rows = math.floor(max_lat / lat_h) - math.floor(min_lat / lat_h) + 1
+        cols = math.floor(max_lon / lon_w) - math.floor(min_lon / lon_w) + 1
+        if rows * cols > MAX_CELLS:
+            continue
+        cells = set()
+        for i in range(rows):
+            cell_lat = min(max_lat, min_lat + i * lat_h)
+            for j in range(cols):
+                cell_lon = min(max_lon, min_lon + j * lon_w)
+                # Longitudes fora de [-180, 180) dão a volta ao antimeridiano
+                wrapped_lon = (cell_lon + 180.0) % 360.0 - 180.0
+                cells.add(encode(cell_lat, wrapped_lon, precision))
+        return sorted(cells)
+    return None
+
+
+def prefix_range(prefix: str):
+    """Intervalo [low, high) de geohashes que começam por prefix (high pode ser None)."""
+    chars = list(prefix)
+    while chars:
+        index = BASE32.index(chars[-1])
+        if index + 1 < len(BASE32):
+            chars[-1] = BASE32[index + 1]
+            return prefix, "".join(chars)
+        chars.pop()
+    return prefix, None
@@ -0,0 +1,167 @@
+"""Logging estruturado (JSON) com correlation id por pedido, amostragem e
+escrita não bloqueante.
+
+Os handlers só colocam o record numa fila (QueueHandler); a formatação e a
+escrita para stdout são feitas numa thread à parte (QueueListener), por isso
+um log dentro de um pedido nunca espera pelo stdout. Se a fila encher os
+records são descartados e contados em `dropped`.
+
+Configuração (variáveis de ambiente):
+    LOG_LEVEL        nível do root logger (INFO)
+    LOG_LEVELS       níveis por módulo, ex. "app.crud=DEBUG,sqlalchemy.engine=WARNING"
+    LOG_FORMAT       json ou text (json)
+    LOG_SAMPLE_RATE  fração dos pedidos cujos logs abaixo de WARNING são emitidos (1.0)
+    LOG_QUEUE_SIZE   tamanho máximo da fila (10000)
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+import uuid
+import zlib
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Id do pedido HTTP em curso (propaga para a threadpool dos endpoints sync)
+correlation_id: ContextVar = ContextVar("correlation_id", default=None)
+
+# Atributos que todos os LogRecord têm; o resto veio de extra={...}
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+logger = logging.getLogger("app.access")
+
+
+class CorrelationIdFilter(logging.Filter):
+    """Acrescenta record.request_id a partir do contexto do pedido."""
+
+    def filter(self, record):
+        record.request_id = correlation_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Deixa passar só uma fração dos pedidos para os níveis abaixo de WARNING.
+
+    A decisão é feita pelo request_id, por isso um pedido amostrado tem os
+    logs todos e os outros não têm nenhum. WARNING e acima passam sempre.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if self.rate >= 1 or record.levelno >= logging.WARNING:
+            return True
+        request_id = getattr(record, "request_id", None)
+        if request_id is None:
+            return True
+        return zlib.crc32(request_id.encode()) % 10000 < self.rate * 10000
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por record, com os campos passados em extra={...}."""
+
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            data["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que descarta em vez de bloquear quando a fila está cheia."""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+_listener = None
+
+
+def _parse_levels(spec: str) -> dict:
+    levels = {}
+    for item in spec.split(","):
+        name, _, level = item.strip().partition("=")
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """Configura o root logger (idempotente)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+        ))
+
+    handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(CorrelationIdFilter())
+    handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(handler)
+    for name, level in _parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(handler.queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+async def correlation_middleware(request, call_next):
+    """Atribui um id a cada pedido (ou usa o X-Request-ID recebido) e regista o acesso."""
+    request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+    token = correlation_id.set(request_id)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+        response.headers[REQUEST_ID_HEADER] = request_id
+        logger.info("request", extra={
+            "method": request.method,
+            "path": request.url.path,
+            "status": response.status_code,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+        })
+        return response
+    except Exception:
+        logger.exception("request failed", extra={"method": request.method, "path": request.url.path})
+        raise
+    finally:
+        correlation_id.reset(token)
@@ -1,29 +1,50 @@
-from fastapi import FastAPI, Depends, Query, Request
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Depends, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from itsdangerous import URLSafeTimedSerializer
 from fastapi import HTTPException
+from typing import Literal, Optional
+from datetime import datetime
 
 from sqlalchemy.orm import Session
-from app import models, schemas, crud
-from app.database import engine, SessionLocal
+from app import models, schemas, crud, pubsub, bulk_import, export, logging_config, metrics, security, auth, outbox, serialization, compression, replicas, read_views
+from app.database import engine, SessionLocal, ASYNC_ENABLED, REPLICA_DATABASE_URLS, get_pool_status, read_session_factory
+from app.pagination import PageLimit, cursor_headers, page_cursor
+
+logging_config.setup_logging()
+logger = logging.getLogger(__name__)
 
 # Cria as tabelas
 models.Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="NoShelf Backend MVP")
-
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Worker da outbox de emails (só com MAIL_ENABLED; ver app/outbox.py)
+    if outbox.MAIL_ENABLED:
+        outbox.worker.start()
+    yield
+    await outbox.worker.stop()
+
+app = FastAPI(title="NoShelf Backend MVP", lifespan=lifespan)
+if compression.COMPRESSION_ENABLED:
+    # gzip/brotli acima de COMPRESSION_MIN_SIZE (ver app/compression.py)
+    app.add_middleware(compression.CompressionMiddleware)
+if metrics.METRICS_ENABLED:
+    app.middleware("http")(metrics.metrics_middleware)
+if REPLICA_DATABASE_URLS:
+    app.middleware("http")(replicas.read_your_writes_middleware)
+app.middleware("http")(logging_config.correlation_middleware)
+
+if ASYNC_ENABLED:
+    # Registado antes das rotas sync para que as versões async tenham prioridade
+    from app.async_routes import router as async_router
+    app.include_router(async_router)
 
-# Configuração do email
-conf = ConnectionConfig(
-    MAIL_USERNAME="seu_email@gmail.com",
-    MAIL_PASSWORD="sua_senha",
-    MAIL_FROM="seu_email@gmail.com",
-    MAIL_PORT=587,
-    MAIL_SERVER="smtp.gmail.com",
-    MAIL_STARTTLS=True,  # Substitui MAIL_TLS
-    MAIL_SSL_TLS=False,  # Substitui MAIL_SSL
-    USE_CREDENTIALS=True
-)
 
 serializer = URLSafeTimedSerializer("SECRET_KEY")
 
@@ -45,43 +66,101 @@ def get_db():
     finally:
         db.close()
 
+# Dependency para os endpoints só de leitura: uma réplica, ou o primário se
+# não houver réplicas ou se o cliente escreveu há pouco (ver app/replicas.py)
+def get_read_db(request: Request):
+    db = read_session_factory(replicas.wants_primary(request))()
+    try:
+        yield db
+    finally:
+        db.close()
+
 # Root
 @app.get("/")
 def read_root():
     return {"message": "NoShelf backend running"}
 
+@app.get("/health/db-pool")
+def db_pool_status():
+    """Estado e métricas do pool de ligações à base de dados."""
+    return get_pool_status()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Métricas no formato de texto do Prometheus."""
+    return PlainTextResponse(
+        metrics.registry.render(get_pool_status()),
+        media_type="text/plain; version=0.0.4",
+    )
+
 # Users
 @app.post("/users", response_model=schemas.User)
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     return crud.create_user(db=db, user=user)
 
 @app.get("/users", response_model=list[schemas.User])
-def list_users(db: Session = Depends(get_db)):
-    return crud.get_users(db=db)
+def list_users(
+    response: Response,
+    city: Optional[str] = None,
+    after: Optional[int] = None,
+    limit: int = PageLimit,
+    db: Session = Depends(get_read_db),
+):
+    users = crud.get_users(db=db, city=city, after=after, limit=limit)
+    page_cursor(response, users, limit)
+    return users
+
+# O hashing das passwords corre no pool do módulo security (async), por isso
+# register/login são async e o acesso à DB vai para a threadpool
+PASSWORD_BUSY = HTTPException(status_code=503, detail="Too many logins, try again", headers={"Retry-After": "1"})
 
 # Registration endpoint
-@app.post("/register", response_model=schemas.User)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+@app.post("/register", response_model=schemas.LoginResponse)
+async def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     # Check if user already exists
-    existing_user = crud.get_user_by_email(db, user.email)
+    existing_user = await run_in_threadpool(crud.get_user_by_email, db, user.email)
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    return crud.create_user(db=db, user=user)
+    try:
+        password_hash = await security.hash_password_async(user.password)
+    except security.PasswordBusy:
+        raise PASSWORD_BUSY
+    db_user = await run_in_threadpool(crud.create_user, db, user, password_hash)
+    user_data = schemas.User.model_validate(db_user, from_attributes=True)
+    return schemas.LoginResponse(**user_data.model_dump(), access_token=auth.issue_token(db_user))
 
 # Login endpoint
-@app.post("/login", response_model=schemas.User)
-def login_user(user: schemas.UserLogin, db: Session = Depends(get_db)):
+@app.post("/login", response_model=schemas.LoginResponse)
+async def login_user(user: schemas.UserLogin, db: Session = Depends(get_db)):
     # Check if user exists
-    existing_user = crud.get_user_by_email(db, user.email)
+    existing_user = await run_in_threadpool(crud.get_user_by_email, db, user.email)
     if not existing_user:
         raise HTTPException(status_code=400, detail="Invalid credentials")
     
-    # In a real app, you would verify the password hash here
-    # For now, we'll do a simple password comparison
-    if existing_user.password != user.password:
-        raise HTTPException(status_code=400, detail="Invalid credentials")
+    try:
+        valid = await security.verify_password_async(user.password, existing_user.password)
+        if not valid:
+            raise HTTPException(status_code=400, detail="Invalid credentials")
+        # Resposta construída antes do rehash: o commit do update_password expira
+        # existing_user e lê-lo depois faria um SELECT no event loop
+        user_data = schemas.User.model_validate(existing_user, from_attributes=True)
+        access_token = auth.issue_token(existing_user)
+        # Parâmetros do hash mudaram (ou password legada em texto simples): grava de novo
+        if security.needs_rehash(existing_user.password):
+            password_hash = await security.hash_password_async(user.password)
+            await run_in_threadpool(crud.update_password, db, existing_user.id, password_hash)
+            logger.info("password rehashed", extra={"user_id": existing_user.id})
+    except security.PasswordBusy:
+        raise PASSWORD_BUSY
     
-    return existing_user
+    # Token de acesso: os endpoints autenticados validam-no sem ler a tabela users
+    auth.user_cache.set(user_data.id, user_data)
+    return schemas.LoginResponse(**user_data.model_dump(), access_token=access_token)
+
+@app.get("/me", response_model=schemas.User)
+def read_me(user: schemas.User = Depends(auth.get_current_user)):
+    """User autenticado (Authorization: Bearer <access_token> do /login)."""
+    return user
 
 # Books
 # @app.post("/books", response_model=schemas.Book)
@@ -89,64 +168,43 @@ def login_user(user: schemas.UserLogin, db: Session = Depends(get_db)):
 #     return crud.create_book(db=db, book=book)
 
 @app.get("/books", response_model=dict)
-def list_books_grouped_by_municipio(db: Session = Depends(get_db)):
-    books = crud.get_books(db=db)
-    grouped_books = {}
-
-    for book in books:
-        for copy in book.copies:  # Acesse as cópias relacionadas ao livro
-            municipio = copy.location  # Use o campo location da cópia
-            if municipio not in grouped_books:
-                grouped_books[municipio] = []
-            grouped_books[municipio].append({
-                "id": book.id,
-                "title": book.title,
-                "author": book.author,
-                "isbn": book.isbn,
-                "cover_url": book.cover_url,
-                "condition": copy.condition,
-                "status": copy.status,
-                "owner_id": copy.owner_id,
-                "copy_id": copy.id,  # Added the missing copy_id field
-            })
-
-    return grouped_books
+def list_books_grouped_by_municipio(
+    request: Request,
+    municipio: Optional[str] = None,
+    status: Optional[schemas.CopyStatus] = None,
+    author: Optional[str] = None,
+    owner_id: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = PageLimit,
+    db: Session = Depends(get_read_db),
+):
+    return read_views.catalogue(
+        db, request, municipio=municipio, status=status, author=author,
+        owner_id=owner_id, after=after, limit=limit,
+    )
 
 @app.get("/users/{user_id}/books")
-def get_user_books(user_id: int, db: Session = Depends(get_db)):
-    print(f"Fetching books for user_id: {user_id}")
-    copies = crud.get_copies_by_owner(db, user_id)
-    print(f"Found {len(copies)} copies for user {user_id}")
-    books = []
-    for copy in copies:
-        print(f"Processing copy: book_id={copy.book_id}, owner_id={copy.owner_id}")
-        book = crud.get_book(db, copy.book_id)
-        if book:
-            # Add owner info to the book response
-            book_data = {
-                "id": book.id,
-                "title": book.title,
-                "author": book.author,
-                "isbn": book.isbn,
-                "cover_url": book.cover_url,
-                "owner_id": copy.owner_id,
-                "copy_id": copy.id,
-                "condition": copy.condition,
-                "status": copy.status
-            }
-            books.append(book_data)
-            print(f"Added book: {book.title}")
-        else:
-            print(f"Book not found for book_id: {copy.book_id}")
-    print(f"Returning {len(books)} books")
-    return books
+def get_user_books(
+    user_id: int,
+    request: Request,
+    status: Optional[schemas.CopyStatus] = None,
+    after: Optional[int] = None,
+    limit: int = PageLimit,
+    db: Session = Depends(get_read_db),
+):
+    return read_views.owner_books(db, request, user_id, status=status, after=after, limit=limit)
 
 @app.get("/users/{user_id}/transferred-books")
-def get_transferred_books(user_id: int, db: Session = Depends(get_db)):
+def get_transferred_books(
+    user_id: int,
+    response: Response,
+    after: Optional[int] = None,
+    limit: int = PageLimit,
+    db: Session = Depends(get_read_db),
+):
     """Get books that this user originally owned but transferred to others."""
-    print(f"Fetching transferred books for user_id: {user_id}")
-
-    copies = crud.get_transferred_copies(db, original_owner_id=user_id)
+    copies = crud.get_transferred_copies(db, original_owner_id=user_id, after=after, limit=limit)
+    page_cursor(response, copies, limit)
     result = []
     for copy in copies:
         book = copy.book
@@ -165,59 +223,168 @@ def get_transferred_books(user_id: int, db: Session = Depends(get_db)):
 
     return result
 
+@app.get("/users/{user_id}/transfers")
+def get_user_transfers(
+    user_id: int,
+    response: Response,
+    direction: Optional[Literal["given", "received"]] = None,
+    after: Optional[int] = None,
+    limit: int = PageLimit,
+    db: Session = Depends(get_read_db),
+):
+    """Histórico de transferências do user: dadas, recebidas ou ambas."""
+    rows = crud.get_user_transfers(db, user_id, direction=direction, after=after, limit=limit)
+    page_cursor(response, rows, limit)
+    return [dict(row._mapping) for row in rows]
+
+@app.get("/users/{user_id}/dashboard")
+def get_user_dashboard(user_id: int, refresh: bool = False, db: Session = Depends(get_db)):
+    """Resumo do ecrã inicial: cópias por status, pedidos pendentes, mensagens por ler e últimas transferências.
+
+    Lê o read model user_dashboards (uma linha por user); refresh=true recalcula-o de raiz.
+    """
+    if auth.load_user(user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    dashboard = crud.get_dashboard(db, user_id, refresh=refresh)
+    transfers = crud.get_recent_transfers(db, user_id)
+    return _dashboard_response(dashboard, transfers)
+
+@app.post("/users/{user_id}/dashboard/read-messages")
+def mark_dashboard_messages_read(user_id: int, db: Session = Depends(get_db)):
+    """Marca as mensagens recebidas como lidas (unread_messages volta a 0)."""
+    if auth.load_user(user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    dashboard = crud.mark_messages_read(db, user_id)
+    return _dashboard_response(dashboard, crud.get_recent_transfers(db, user_id))
+
+def _dashboard_response(dashboard, transfers):
+    return {
+        "user_id": dashboard.user_id,
+        "copies": {
+            "AVAILABLE": dashboard.available_copies,
+            "REQUESTED": dashboard.requested_copies,
+            "RESERVED": dashboard.reserved_copies,
+            "BORROWED": dashboard.borrowed_copies,
+        },
+        "pending_incoming": dashboard.pending_incoming,
+        "unread_messages": dashboard.unread_messages,
+        "recent_transfers": [dict(transfer._mapping) for transfer in transfers],
+        "updated_at": dashboard.updated_at,
+    }
+
+# Sync
+@app.get("/sync")
+def sync(
+    since: Optional[int] = None,
+    user_id: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = PageLimit,
+    db: Session = Depends(get_db),
+):
+    """Sincronização incremental da app: só o que mudou desde o token `since`.
+
+    Devolve os livros e cópias criados ou alterados, os requests do user_id
+    (como requester ou owner), os ids dos requests que o user deixou de ver e o
+    `token` a usar no próximo pedido. O cliente aplica primeiro os removidos e
+    depois os upserts. Sem `since` devolve um snapshot. Com ou sem `since` a
+    resposta é paginada (X-Next-Cursor -> after, com o mesmo `since`); o token a
+    guardar é o da primeira página.
+    """
+    changes = crud.get_changes(db, since=since, user_id=user_id, after=after, limit=limit)
+    return serialization.ORJSONResponse({
+        "token": changes["token"],
+        "books": [dict(row._mapping) for row in changes["books"]],
+        "copies": [serialization.copy_from_row(row) for row in changes["copies"]],
+        "requests": [serialization.request_from_row(row) for row in changes["requests"]],
+        "deleted": {"requests": changes["deleted_requests"]},
+    }, headers=cursor_headers(changes["cursor"]))
+
 # Copies
+@app.get("/copies/{copy_id}/provenance")
+def get_copy_provenance(copy_id: int, db: Session = Depends(get_read_db)):
+    """Cadeia completa de owners de uma cópia, do original ao atual."""
+    copy = db.query(models.Copy.id, models.Copy.original_owner_id, models.Copy.owner_id) \
+        .filter(models.Copy.id == copy_id).first()
+    if not copy:
+        raise HTTPException(status_code=404, detail="Copy not found")
+    transfers = crud.get_copy_provenance(db, copy_id)
+    return {
+        "copy_id": copy.id,
+        "original_owner_id": copy.original_owner_id,
+        "current_owner_id": copy.owner_id,
+        "transfers": [dict(transfer._mapping) for transfer in transfers],
+    }
+
 @app.post("/copies", response_model=schemas.Copy)
 def create_copy(copy: schemas.CopyCreate, db: Session = Depends(get_db)):
     return crud.create_copy(db=db, copy=copy)
 
 @app.get("/copies", response_model=list[schemas.Copy])
-def list_copies(db: Session = Depends(get_db)):
-    return crud.get_copies(db=db)
+def list_copies(
+    request: Request,
+    status: Optional[schemas.CopyStatus] = None,
+    location: Optional[str] = None,
+    owner_id: Optional[int] = None,
+    author: Optional[str] = None,
+    after: Optional[int] = None,
+    limit: int = PageLimit,
+    db: Session = Depends(get_read_db),
+):
+    return read_views.copies(
+        db, request, status=status, location=location, owner_id=owner_id,
+        author=author, after=after, limit=limit,
+    )
 
 # Requests
 @app.post("/requests", response_model=schemas.Request)
 def create_request(request: schemas.RequestCreate, db: Session = Depends(get_db)):
-    return crud.create_request(db=db, request=request)
+    try:
+        result = crud.create_request(db=db, request=request)
+    except ValueError as e:
+        logger.warning("request not created", extra={
+            "copy_id": request.copy_id, "requester_id": request.requester_id, "error": str(e),
+        })
+        raise HTTPException(status_code=422, detail=str(e))
+    logger.info("request created", extra={
+        "db_request_id": result.id, "copy_id": request.copy_id, "requester_id": request.requester_id,
+    })
+    return result
 
 @app.get("/requests", response_model=list[schemas.Request])
-def list_requests(db: Session = Depends(get_db)):
-    return crud.get_requests(db=db)
+def list_requests(
+    status: Optional[schemas.RequestStatus] = None,
+    requester_id: Optional[int] = None,
+    copy_id: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = PageLimit,
+    db: Session = Depends(get_read_db),
+):
+    return read_views.requests(
+        db, status=status, requester_id=requester_id, copy_id=copy_id, after=after, limit=limit,
+    )
 
 @app.get("/users/{user_id}/incoming-requests")
-def get_incoming_requests(user_id: int, db: Session = Depends(get_db)):
-    print(f"Fetching incoming requests for user_id: {user_id}")
-    # Get all copies owned by this user
-    user_copies = crud.get_copies_by_owner(db, user_id)
-    copy_ids = [copy.id for copy in user_copies]
-    
-    # Get all requests for these copies
-    incoming_requests = []
-    for copy_id in copy_ids:
-        requests = db.query(models.Request).filter(models.Request.copy_id == copy_id).all()
-        for request in requests:
-            request_data = {
-                "id": request.id,
-                "copy_id": request.copy_id,
-                "requester_id": request.requester_id,
-                "requester_name": request.requester.name,
-                "requester_email": request.requester.email,
-                "message": request.message,
-                "status": request.status,
-                "created_at": request.created_at,
-                "book_title": request.copy.book.title,
-                "book_author": request.copy.book.author,
-                "book_isbn": request.copy.book.isbn,
-            }
-            incoming_requests.append(request_data)
-    
-    print(f"Found {len(incoming_requests)} incoming requests")
-    return incoming_requests
+def get_incoming_requests(
+    user_id: int,
+    status: Optional[schemas.RequestStatus] = None,
+    after: Optional[int] = None,
+    limit: int = PageLimit,
+    db: Session = Depends(get_read_db),
+):
+    return read_views.incoming_requests(db, user_id, status=status, after=after, limit=limit)
 
 @app.get("/users/{user_id}/outgoing-requests")
-def get_outgoing_requests(user_id: int, db: Session = Depends(get_db)):
-    print(f"Fetching outgoing requests for user_id: {user_id}")
-    # Get all requests made by this user
-    requests = db.query(models.Request).filter(models.Request.requester_id == user_id).all()
+def get_outgoing_requests(
+    user_id: int,
+    response: Response,
+    status: Optional[schemas.RequestStatus] = None,
+    after: Optional[int] = None,
+    limit: int = PageLimit,
+    db: Session = Depends(get_read_db),
+):
+    # Get the requests made by this user (copy, book and owner in the same query)
+    requests = crud.get_outgoing_requests(db, user_id, status=status, after=after, limit=limit)
+    page_cursor(response, requests, limit)
     
     outgoing_requests = []
     for request in requests:
@@ -237,7 +404,7 @@ def get_outgoing_requests(user_id: int, db: Session = Depends(get_db)):
         }
         outgoing_requests.append(request_data)
     
-    print(f"Found {len(outgoing_requests)} outgoing requests")
+    logger.debug("outgoing requests loaded", extra={"user_id": user_id, "count": len(outgoing_requests)})
     return outgoing_requests
 
 @app.post("/location")
@@ -246,40 +413,76 @@ def save_location(location: schemas.LocationCreate, db: Session = Depends(get_db
 
 
 
+@app.get("/books/search")
+def search_books(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_read_db),
+):
+    """Pesquisa por título, autor ou ISBN (prefixos), ordenada por relevância."""
+    return crud.search_books(db, q, limit=limit)
+
+@app.get("/users/{user_id}/recommendations")
+def get_user_recommendations(
+    user_id: int,
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: float = Query(10, gt=0),
+    limit: int = Query(20, ge=1, le=crud.MAX_PAGE_SIZE),
+    db: Session = Depends(get_read_db),
+):
+    """Cópias disponíveis recomendadas ao user (géneros e co-transferências).
+
+    Com lat/lon: num raio de radius_km; sem elas, no município (city) do user.
+    Os scores são calculados em batch por `python -m app.recommendations`.
+    """
+    user = auth.load_user(user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return crud.get_recommendations(
+        db, user_id, municipio=user.city, lat=lat, lon=lon, radius_km=radius_km, limit=limit,
+    )
+
 @app.get("/books/nearby")
-def get_books_nearby(lat: float, lon: float, radius_km: int, db: Session = Depends(get_db)):
-    # Query para buscar livros dentro do raio
-    pass
+def get_books_nearby(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(..., gt=0),
+    status: Optional[schemas.CopyStatus] = None,
+    limit: int = PageLimit,
+    db: Session = Depends(get_read_db),
+):
+    """Cópias num raio de radius_km, da mais próxima para a mais distante."""
+    return crud.get_copies_nearby(db, lat, lon, radius_km, status=status, limit=limit)
 
 @app.post("/books")
 def add_book(request: Request, book: schemas.BookCreate, db: Session = Depends(get_db)):
-    print("=== ADD BOOK ENDPOINT CALLED ===")
-    print(f"Query params: {request.query_params}")
-
     # Get owner_id and municipality from query parameters
     owner_id = request.query_params.get("owner_id")
     municipio = request.query_params.get("municipio")
 
     if not owner_id:
-        print("ERROR: No owner_id in query parameters")
         raise HTTPException(status_code=400, detail="owner_id is required")
 
     if not municipio:
-        print("ERROR: No municipio in query parameters")
         raise HTTPException(status_code=400, detail="municipio is required")
 
     try:
         owner_id = int(owner_id)
-        print(f"Adding book with owner_id: {owner_id} and municipio: {municipio}")
     except ValueError:
-        print(f"ERROR: Invalid owner_id: {owner_id}")
         raise HTTPException(status_code=400, detail="owner_id must be an integer")
 
-    print(f"Book data: {book.dict()}")
+    # Coordenadas opcionais (latitude/longitude) para a pesquisa por proximidade
+    try:
+        latitude = request.query_params.get("latitude")
+        longitude = request.query_params.get("longitude")
+        latitude = float(latitude) if latitude is not None else None
+        longitude = float(longitude) if longitude is not None else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="latitude and longitude must be numbers")
 
-    # Create the book
-    created_book = crud.create_book(db, book)
-    print(f"Book created with ID: {created_book.id}")
+    # Create the book (or reuse it if the ISBN is already in the catalogue)
+    created_book = crud.get_book_by_isbn(db, book.isbn) or crud.create_book(db, book)
 
     # Create a copy associated with the owner and municipality
     copy_data = schemas.CopyCreate(
@@ -287,38 +490,75 @@ def add_book(request: Request, book: schemas.BookCreate, db: Session = Depends(g
         owner_id=owner_id,
         condition="OK",  # BookCondition: OK, USED, WORN
         status="AVAILABLE",  # CopyStatus: AVAILABLE, REQUESTED, BORROWED
-        location=municipio  # Use municipio as location
+        location=municipio,  # Use municipio as location
+        latitude=latitude,
+        longitude=longitude,
     )
-    print(f"Creating copy with data: {copy_data.dict()}")
     created_copy = crud.create_copy(db, copy_data)
-    print(f"Copy created with ID: {created_copy.id}")
+    logger.info("book added", extra={
+        "owner_id": owner_id, "municipio": municipio,
+        "book_id": created_book.id, "copy_id": created_copy.id,
+    })
 
     return created_book
 
-@app.post("/requests")
-def create_request(request: schemas.RequestCreate, db: Session = Depends(get_db)):
-    print(f"=== CREATE REQUEST ENDPOINT CALLED ===")
-    print(f"Request data: {request.dict()}")
+@app.post("/books/import")
+async def import_books(request: Request, owner_id: int, municipio: Optional[str] = None, db: Session = Depends(get_db)):
+    """Importação em massa de livros, cada um com uma cópia do owner.
+
+    O corpo pode ser um array JSON, NDJSON ou CSV (Content-Type
+    application/x-ndjson ou text/csv). Livros com um ISBN que já existe são
+    reutilizados. municipio é a localização por omissão das cópias; cada linha
+    pode trazer a sua (location). Devolve o resultado de cada linha.
+    """
+    if await run_in_threadpool(auth.load_user, owner_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    results = []
     try:
-        result = crud.create_request(db, request)
-        print(f"Request created successfully: {result}")
-        return result
-    except Exception as e:
-        print(f"Error creating request: {e}")
-        raise HTTPException(status_code=422, detail=str(e))
+        async for chunk in bulk_import.iter_chunks(bulk_import.iter_rows(request)):
+            results.extend(await run_in_threadpool(crud.import_books, db, chunk, owner_id, municipio))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    imported = sum(1 for result in results if result.status == "ok")
+    return {"imported": imported, "errors": len(results) - imported, "results": results}
 
 @app.delete("/requests/{request_id}")
 def cancel_request(request_id: int, db: Session = Depends(get_db)):
     """Cancela um request pendente"""
-    success = crud.delete_request(db, request_id)
+    try:
+        success = crud.delete_request(db, request_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     if not success:
         raise HTTPException(status_code=404, detail="Request not found")
     return {"message": "Request cancelled successfully"}
 
+# Exportação (NDJSON/CSV em streaming)
+@app.get("/export/{dataset}")
+def export_dataset(dataset: str, format: str = "ndjson", principal: auth.Principal = Depends(auth.get_principal)):
+    """Exporta copies, requests, messages ou transfers sem carregar tudo em memória.
+
+    Um admin (AUTH_ADMIN_EMAILS) exporta todas as linhas; os outros users só as
+    suas (cópias, requests e conversas em que participam, transferências).
+    """
+    if dataset not in export.DATASETS:
+        raise HTTPException(status_code=404, detail="Unknown dataset")
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    user_id = None if auth.is_admin(principal) else principal.id
+    return StreamingResponse(
+        export.stream(dataset, format, user_id=user_id),
+        media_type=export.FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{dataset}.{format}"'},
+    )
+
 @app.put("/requests/{request_id}/accept")
 def accept_request(request_id: int, db: Session = Depends(get_db)):
     """Owner aceita um request - muda status para ACCEPTED e copy para RESERVED"""
-    request = crud.accept_request(db, request_id)
+    try:
+        request = crud.accept_request(db, request_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     if not request:
         raise HTTPException(status_code=404, detail="Request not found")
     return {"message": "Request accepted successfully", "status": request.status}
@@ -326,13 +566,16 @@ def accept_request(request_id: int, db: Session = Depends(get_db)):
 @app.put("/requests/{request_id}/confirm-delivery")
 def confirm_delivery(request_id: int, db: Session = Depends(get_db)):
     """Receiver confirma a entrega - muda status para COMPLETED"""
-    request = crud.confirm_delivery(db, request_id)
+    try:
+        request = crud.confirm_delivery(db, request_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     if not request:
         raise HTTPException(status_code=404, detail="Request not found")
     return {"message": "Delivery confirmed successfully", "status": request.status}
 
 # Chat/Messages
-@app.post("/requests/{request_id}/messages")
+@app.post("/requests/{request_id}/messages", response_model=schemas.Message)
 def create_message(request_id: int, content: str, sender_id: int, db: Session = Depends(get_db)):
     message_data = schemas.MessageCreate(
         request_id=request_id,
@@ -342,18 +585,38 @@ def create_message(request_id: int, content: str, sender_id: int, db: Session =
     return crud.create_message(db, message_data)
 
 @app.get("/requests/{request_id}/messages")
-def get_messages(request_id: int, db: Session = Depends(get_db)):
-    messages = crud.get_messages_by_request(db, request_id)
-    # Add sender name to each message
-    messages_with_sender = []
-    for message in messages:
-        message_dict = {
-            "id": message.id,
-            "request_id": message.request_id,
-            "sender_id": message.sender_id,
-            "content": message.content,
-            "created_at": message.created_at,
-            "sender_name": message.sender.name
-        }
-        messages_with_sender.append(message_dict)
-    return messages_with_sender
\ No newline at end of file
+def get_messages(
+    request_id: int,
+    since_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    db: Session = Depends(get_read_db),
+):
+    """Mensagens da conversa; com since_id/since só devolve as mais recentes."""
+    messages = crud.get_messages_by_request(db, request_id, since_id=since_id, since=since)
+    return [dict(message._mapping) for message in messages]
+
+@app.websocket("/requests/{request_id}/ws")
+async def messages_socket(websocket: WebSocket, request_id: int):
+    """Envia as mensagens novas da conversa assim que são criadas.
+
+    O cliente deve abrir o socket e só depois ler o histórico com
+    GET /requests/{request_id}/messages, descartando ids repetidos.
+    """
+    await websocket.accept()
+    subscription = pubsub.broker.subscribe(pubsub.request_topic(request_id))
+
+    async def forward():
+        while True:
+            message = await subscription.get()
+            await websocket.send_json(jsonable_encoder(message))
+
+    forward_task = asyncio.create_task(forward())
+    try:
+        while True:
+            # O cliente não envia nada de útil; só esperamos pelo disconnect
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        forward_task.cancel()
+        pubsub.broker.unsubscribe(subscription)
@@ -0,0 +1,187 @@
+"""Métricas HTTP e de base de dados no formato de texto do Prometheus.
+
+Por rota (o template, ex. /users/{user_id}/books, para não explodir a
+cardinalidade) regista:
+    http_requests_total                 contador por método, rota e status
+    http_request_duration_seconds       histograma de latência
+    http_requests_in_flight             pedidos a decorrer
+    http_request_db_queries             histograma de queries por pedido
+    http_request_db_seconds             histograma do tempo em queries por pedido
+
+As queries são contadas com eventos do SQLAlchemy (before/after_cursor_execute)
+e atribuídas ao pedido em curso por um ContextVar, por isso um padrão N+1
+aparece como um número alto de queries por pedido. O endpoint /metrics junta
+ainda as métricas do pool de ligações (pool_metrics).
+"""
+import bisect
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class _RequestDb:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# Contadores de DB do pedido HTTP em curso (partilhado com a threadpool)
+_current: ContextVar = ContextVar("metrics_request_db", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.requests = {}         # (method, route, status) -> count
+        self.latency = {}          # (method, route) -> Histogram
+        self.db_queries = {}       # (method, route) -> Histogram
+        self.db_seconds = {}       # (method, route) -> Histogram
+        self.queries_total = 0
+        self.query_seconds_total = 0.0
+
+    def _histogram(self, table: dict, key, buckets) -> Histogram:
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = Histogram(buckets)
+        return histogram
+
+    def start(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def finish(self, method: str, route: str, status: int, seconds: float, db: _RequestDb):
+        key = (method, route)
+        with self._lock:
+            self.in_flight -= 1
+            self.requests[(method, route, status)] = self.requests.get((method, route, status), 0) + 1
+            self._histogram(self.latency, key, LATENCY_BUCKETS).observe(seconds)
+            self._histogram(self.db_queries, key, QUERY_COUNT_BUCKETS).observe(db.queries)
+            self._histogram(self.db_seconds, key, LATENCY_BUCKETS).observe(db.seconds)
+
+    def record_query(self, seconds: float):
+        with self._lock:
+            self.queries_total += 1
+            self.query_seconds_total += seconds
+
+    def render(self, pool_status: dict = None) -> str:
+        lines = []
+        with self._lock:
+            _header(lines, "http_requests_total", "counter", "HTTP requests by method, route and status.")
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{_labels(method=method, route=route, status=status)} {count}')
+            _header(lines, "http_requests_in_flight", "gauge", "HTTP requests currently being served.")
+            lines.append(f"http_requests_in_flight {self.in_flight}")
+            _render_histograms(lines, "http_request_duration_seconds", "Request latency in seconds.", self.latency)
+            _render_histograms(lines, "http_request_db_queries", "Database queries per request.", self.db_queries)
+            _render_histograms(lines, "http_request_db_seconds", "Time spent in database queries per request.", self.db_seconds)
+            _header(lines, "db_queries_total", "counter", "Database queries executed (all requests and background work).")
+            lines.append(f"db_queries_total {self.queries_total}")
+            _header(lines, "db_query_seconds_total", "counter", "Time spent in database queries.")
+            lines.append(f"db_query_seconds_total {self.query_seconds_total:.6f}")
+        if pool_status:
+            _render_pool(lines, pool_status)
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _header(lines: list, name: str, kind: str, help_text: str):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def _render_histograms(lines: list, name: str, help_text: str, table: dict):
+    _header(lines, name, "histogram", help_text)
+    for (method, route), histogram in sorted(table.items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(method=method, route=route, le=bound)} {cumulative}")
+        lines.append(f'{name}_bucket{_labels(method=method, route=route, le="+Inf")} {histogram.count}')
+        lines.append(f"{name}_sum{_labels(method=method, route=route)} {histogram.sum:.6f}")
+        lines.append(f"{name}_count{_labels(method=method, route=route)} {histogram.count}")
+
+
+def _render_pool(lines: list, pool_status: dict):
+    for engine_name, status in pool_status.items():
+        for key, value in sorted(status.items()):
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            lines.append(f"db_pool_{key}{_labels(engine=engine_name)} {value}")
+
+
+registry = Registry()
+
+
+# SQLAlchemy: todas as engines (sync e a sync_engine das async)
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_query_start")
+    if not starts:
+        return
+    seconds = time.perf_counter() - starts.pop()
+    registry.record_query(seconds)
+    db = _current.get()
+    if db is not None:
+        db.queries += 1
+        db.seconds += seconds
+
+
+async def metrics_middleware(request, call_next):
+    db = _RequestDb()
+    token = _current.set(db)
+    registry.start()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        registry.finish(
+            request.method,
+            getattr(route, "path", UNMATCHED_ROUTE),
+            status,
+            time.perf_counter() - start,
+            db,
+        )
+        _current.reset(token)
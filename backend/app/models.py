@@ -1,6 +1,6 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, Enum, DateTime
+from sqlalchemy import Column, String, Integer, Float, ForeignKey, Enum, DateTime, Index
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 from app.database import Base
 import enum
 
@@ -46,20 +46,28 @@ class Book(Base):
     author = Column(String)
     isbn = Column(String, unique=True)
     cover_url = Column(String)
+    # Sincronização incremental (/sync): alterado em cada escrita
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
 
     copies = relationship("Copy", back_populates="book")
 
 class Copy(Base):
     __tablename__ = "copies"
     id = Column(Integer, primary_key=True, index=True)
-    book_id = Column(Integer, ForeignKey("books.id"))
-    owner_id = Column(Integer, ForeignKey("users.id"))
+    book_id = Column(Integer, ForeignKey("books.id"), index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
     # original_owner_id stores who first owned this copy (helps track transfers)
     original_owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     condition = Column(Enum(BookCondition), default=BookCondition.OK)
     status = Column(Enum(CopyStatus), default=CopyStatus.AVAILABLE)
-    location = Column(String)
+    location = Column(String, index=True)
+    # Coordenadas opcionais para a pesquisa por proximidade; geohash é derivado
+    # delas (app/geo.py) e indexado para pesquisas por intervalo de células
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geohash = Column(String(12), nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
 
     book = relationship("Book", back_populates="copies")
     # Explicitly declare foreign_keys to avoid AmbiguousForeignKeysError when
@@ -70,13 +78,24 @@ class Copy(Base):
 
 class Request(Base):
     __tablename__ = "requests"
+    # Incoming requests are looked up by copy and filtered by status
+    __table_args__ = (
+        Index("ix_requests_copy_id_status", "copy_id", "status"),
+        # No máximo um request ativo (PENDING/ACCEPTED) por requester e cópia
+        Index(
+            "ix_requests_one_active_per_requester", "copy_id", "requester_id",
+            unique=True,
+            postgresql_where=text("status IN ('PENDING', 'ACCEPTED')"),
+            sqlite_where=text("status IN ('PENDING', 'ACCEPTED')"),
+        ),
+    )
     id = Column(Integer, primary_key=True, index=True)
     copy_id = Column(Integer, ForeignKey("copies.id"))
     requester_id = Column(Integer, ForeignKey("users.id"))
     status = Column(Enum(RequestStatus), default=RequestStatus.PENDING)
     message = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), index=True)
 
     copy = relationship("Copy", back_populates="requests")  # Ensure back_populates matches Copy
     requester = relationship("User", back_populates="requests")
@@ -84,6 +103,10 @@ class Request(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    # Conversas são lidas por request e por ordem de id (since_id)
+    __table_args__ = (
+        Index("ix_messages_request_id_id", "request_id", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     request_id = Column(Integer, ForeignKey("requests.id"))
     sender_id = Column(Integer, ForeignKey("users.id"))
@@ -93,6 +116,88 @@ class Message(Base):
     request = relationship("Request", back_populates="messages")
     sender = relationship("User")
 
+class CopyTransfer(Base):
+    """Ledger append-only das transferências de propriedade (uma linha por entrega)."""
+    __tablename__ = "copy_transfers"
+    __table_args__ = (
+        Index("ix_copy_transfers_copy_id_id", "copy_id", "id"),
+        Index("ix_copy_transfers_from_user_id_id", "from_user_id", "id"),
+        Index("ix_copy_transfers_to_user_id_id", "to_user_id", "id"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    copy_id = Column(Integer, ForeignKey("copies.id"), nullable=False)
+    request_id = Column(Integer, ForeignKey("requests.id"), nullable=True)
+    from_user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    to_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    copy = relationship("Copy")
+    from_user = relationship("User", foreign_keys=[from_user_id])
+    to_user = relationship("User", foreign_keys=[to_user_id])
+
+class UserDashboard(Base):
+    """Resumo por user para o ecrã inicial, mantido incrementalmente pelo crud."""
+    __tablename__ = "user_dashboards"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    available_copies = Column(Integer, nullable=False, default=0)
+    requested_copies = Column(Integer, nullable=False, default=0)
+    reserved_copies = Column(Integer, nullable=False, default=0)
+    borrowed_copies = Column(Integer, nullable=False, default=0)
+    pending_incoming = Column(Integer, nullable=False, default=0)
+    unread_messages = Column(Integer, nullable=False, default=0)
+    last_read_message_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class UserRecommendation(Base):
+    """Livros recomendados por user, calculados em batch (app/recommendations.py)."""
+    __tablename__ = "user_recommendations"
+    __table_args__ = (
+        Index("ix_user_recommendations_user_id_score", "user_id", "score"),
+    )
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    book_id = Column(Integer, ForeignKey("books.id"), primary_key=True)
+    score = Column(Float, nullable=False)
+    genre_score = Column(Float, nullable=False, default=0.0)
+    cotransfer_score = Column(Float, nullable=False, default=0.0)
+    computed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class Tombstone(Base):
+    """Registo das remoções, para o /sync as propagar aos clientes."""
+    __tablename__ = "tombstones"
+    __table_args__ = (
+        Index("ix_tombstones_entity_deleted_at", "entity", "deleted_at"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    entity = Column(String, nullable=False)  # ex. "requests"
+    entity_id = Column(Integer, nullable=False)
+    # Users que devem receber a remoção (requester e/ou owner da cópia)
+    requester_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class OutboxStatus(str, enum.Enum):
+    PENDING = "PENDING"
+    SENT = "SENT"
+    FAILED = "FAILED"
+
+class OutboxJob(Base):
+    """Emails por enviar (outbox): gravados na mesma transação que a mutação."""
+    __tablename__ = "outbox_jobs"
+    __table_args__ = (
+        Index("ix_outbox_jobs_status_next_attempt_at", "status", "next_attempt_at"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False, default="email")
+    recipient = Column(String, nullable=False, index=True)
+    subject = Column(String, nullable=False)
+    body = Column(String, nullable=False)
+    status = Column(Enum(OutboxStatus), nullable=False, default=OutboxStatus.PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
 class Location(Base):
     __tablename__ = "locations"
     id = Column(Integer, primary_key=True, index=True)
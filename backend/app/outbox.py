@@ -0,0 +1,244 @@
+"""Fila de emails em background (outbox persistente + worker async).
+
+As mutações do crud chamam enqueue_email() antes do commit, por isso o email
+fica gravado em outbox_jobs na mesma transação que a alteração que o originou
+e sobrevive a um restart. O worker (start/stop no lifespan da app) corre no
+event loop:
+
+1. reclama um lote de jobs PENDING com next_attempt_at <= agora, adiando-os
+   OUTBOX_LEASE_SECONDS (se o processo morrer a meio, voltam a ser enviados
+   depois do lease; no Postgres usa FOR UPDATE SKIP LOCKED)
+2. agrupa os jobs por destinatário e envia um só email por destinatário
+   (depois de uma mutação espera OUTBOX_BATCH_WINDOW_SECONDS para agrupar)
+3. envia no máximo OUTBOX_CONCURRENCY emails em simultâneo
+4. em caso de erro reagenda com backoff exponencial (com jitter) até
+   OUTBOX_MAX_ATTEMPTS tentativas; depois fica FAILED
+
+O envio está desligado por omissão (MAIL_ENABLED=false): os jobs ficam na
+outbox até haver um servidor configurado. Para testar localmente com o
+aiosmtpd como servidor SMTP de teste:
+
+    python -m aiosmtpd -n -l localhost:8025
+    MAIL_ENABLED=true MAIL_SERVER=localhost MAIL_PORT=8025 MAIL_STARTTLS=false \\
+        MAIL_USE_CREDENTIALS=false uvicorn app.main:app
+"""
+import asyncio
+import logging
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi_mail import ConnectionConfig, FastMail, MessageSchema
+from pydantic import ValidationError
+
+from app import models
+from app.database import SessionLocal
+
+MAIL_ENABLED = os.getenv("MAIL_ENABLED", "false").lower() in ("1", "true", "yes")
+
+OUTBOX_CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "4"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+# Depois de acordado o worker espera esta janela para juntar vários emails do
+# mesmo destinatário num só
+OUTBOX_BATCH_WINDOW_SECONDS = float(os.getenv("OUTBOX_BATCH_WINDOW_SECONDS", "2"))
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", "30"))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv("OUTBOX_BACKOFF_MAX_SECONDS", "3600"))
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+# Configuração do email
+conf = ConnectionConfig(
+    MAIL_USERNAME=os.getenv("MAIL_USERNAME", "seu_email@gmail.com"),
+    MAIL_PASSWORD=os.getenv("MAIL_PASSWORD", "sua_senha"),
+    MAIL_FROM=os.getenv("MAIL_FROM", "seu_email@gmail.com"),
+    MAIL_PORT=int(os.getenv("MAIL_PORT", "587")),
+    MAIL_SERVER=os.getenv("MAIL_SERVER", "smtp.gmail.com"),
+    MAIL_STARTTLS=_env_flag("MAIL_STARTTLS", "true"),
+    MAIL_SSL_TLS=_env_flag("MAIL_SSL_TLS", "false"),
+    USE_CREDENTIALS=_env_flag("MAIL_USE_CREDENTIALS", "true"),
+    VALIDATE_CERTS=_env_flag("MAIL_VALIDATE_CERTS", "true"),
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def enqueue_email(db, recipient: str, subject: str, body: str):
+    """Grava um email na outbox (não faz commit: fica na transação do chamador)."""
+    if not recipient:
+        return None
+    job = models.OutboxJob(
+        kind="email",
+        recipient=recipient,
+        subject=subject,
+        body=body,
+        status=models.OutboxStatus.PENDING,
+        attempts=0,
+        next_attempt_at=_now(),
+    )
+    db.add(job)
+    return job
+
+
+def backoff_seconds(attempts: int) -> float:
+    delay = min(OUTBOX_BACKOFF_SECONDS * 2 ** max(attempts - 1, 0), OUTBOX_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_batch(limit: int = OUTBOX_BATCH_SIZE) -> dict:
+    """Reclama jobs prontos a enviar e devolve-os agrupados por destinatário."""
+    db = SessionLocal()
+    try:
+        now = _now()
+        query = db.query(models.OutboxJob).filter(
+            models.OutboxJob.status == models.OutboxStatus.PENDING,
+            models.OutboxJob.next_attempt_at <= now,
+        ).order_by(models.OutboxJob.id).limit(limit)
+        if db.bind.dialect.name == "postgresql":
+            query = query.with_for_update(skip_locked=True)
+        jobs = query.all()
+        lease_until = now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+        batches = {}
+        for job in jobs:
+            job.attempts += 1
+            job.next_attempt_at = lease_until
+            batches.setdefault(job.recipient, []).append(
+                {"id": job.id, "subject": job.subject, "body": job.body, "attempts": job.attempts}
+            )
+        db.commit()
+        return batches
+    finally:
+        db.close()
+
+
+def mark_sent(job_ids: list):
+    db = SessionLocal()
+    try:
+        db.query(models.OutboxJob).filter(models.OutboxJob.id.in_(job_ids)).update({
+            models.OutboxJob.status: models.OutboxStatus.SENT,
+            models.OutboxJob.sent_at: _now(),
+            models.OutboxJob.last_error: None,
+        }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def mark_failed(jobs: list, error: str, permanent: bool = False):
+    """Reagenda cada job com backoff, ou marca FAILED se esgotou as tentativas
+    (ou se o erro é permanente, ex. um endereço inválido)."""
+    db = SessionLocal()
+    try:
+        for job in jobs:
+            values = {models.OutboxJob.last_error: error[:1000]}
+            if permanent or job["attempts"] >= OUTBOX_MAX_ATTEMPTS:
+                values[models.OutboxJob.status] = models.OutboxStatus.FAILED
+            else:
+                values[models.OutboxJob.next_attempt_at] = _now() + timedelta(seconds=backoff_seconds(job["attempts"]))
+            db.query(models.OutboxJob).filter(models.OutboxJob.id == job["id"]).update(values, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def build_message(recipient: str, jobs: list) -> MessageSchema:
+    """Um email por destinatário; vários jobs juntam-se num resumo."""
+    if len(jobs) == 1:
+        subject, body = jobs[0]["subject"], jobs[0]["body"]
+    else:
+        subject = f"NoShelf: {len(jobs)} novas notificações"
+        body = "\n\n".join(f"{job['subject']}\n{job['body']}" for job in jobs)
+    return MessageSchema(subject=subject, recipients=[recipient], body=body, subtype="plain")
+
+
+class Worker:
+    def __init__(self, mailer=None, concurrency: int = OUTBOX_CONCURRENCY):
+        self.mailer = mailer or FastMail(conf)
+        self.concurrency = concurrency
+        self._semaphore = None
+        self._wakeup = None
+        self._loop = None
+        self._task = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Acorda o worker (pode ser chamado de qualquer thread)."""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        while True:
+            try:
+                sent = await self.run_once()
+            except Exception:
+                logger.exception("outbox iteration failed")
+                sent = 0
+            if sent:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_POLL_SECONDS)
+                await asyncio.sleep(OUTBOX_BATCH_WINDOW_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def run_once(self) -> int:
+        """Envia um lote; devolve quantos jobs foram processados."""
+        batches = await run_in_threadpool(claim_batch)
+        if not batches:
+            return 0
+        if self._semaphore is None:
+            # Sem start() (ex. testes): criado no event loop que está a correr
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._send(recipient, jobs) for recipient, jobs in batches.items()))
+        return sum(len(jobs) for jobs in batches.values())
+
+    async def _send(self, recipient: str, jobs: list):
+        try:
+            message = build_message(recipient, jobs)
+        except ValidationError as e:
+            logger.warning("email not sent", extra={"recipient": recipient, "jobs": len(jobs), "error": str(e)})
+            await run_in_threadpool(mark_failed, jobs, str(e), True)
+            return
+        async with self._semaphore:
+            try:
+                await self.mailer.send_message(message)
+            except Exception as e:
+                logger.warning("email not sent", extra={"recipient": recipient, "jobs": len(jobs), "error": str(e)})
+                await run_in_threadpool(mark_failed, jobs, str(e))
+                return
+        await run_in_threadpool(mark_sent, [job["id"] for job in jobs])
+        logger.info("email sent", extra={"recipient": recipient, "jobs": len(jobs)})
+
+
+worker = Worker()
+
+
+def wake():
+    """Chamado depois do commit de uma mutação que gravou emails na outbox."""
+    if MAIL_ENABLED:
+        worker.wake()
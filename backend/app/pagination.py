@@ -0,0 +1,17 @@
+from fastapi import Query, Response
+from app import crud
+
+# Paginação: o cursor da próxima página vai no header X-Next-Cursor
+PageLimit = Query(crud.DEFAULT_PAGE_SIZE, ge=1, le=crud.MAX_PAGE_SIZE)
+
+def set_next_cursor(response: Response, cursor):
+    if cursor is not None:
+        response.headers["X-Next-Cursor"] = str(cursor)
+
+def page_cursor(response: Response, items: list, limit: int):
+    last_id = items[-1].id if items else None
+    set_next_cursor(response, crud.next_cursor(last_id, len(items), limit))
+
+def cursor_headers(cursor) -> dict:
+    """Headers de paginação para respostas construídas à mão (ex.: em cache)."""
+    return {"X-Next-Cursor": str(cursor)} if cursor is not None else {}
@@ -0,0 +1,114 @@
+"""Instrumentação do pool de ligações do SQLAlchemy.
+
+Conta checkouts, checkins, ligações novas, invalidações, eventos de overflow e
+timeouts, e mede quanto tempo cada pedido esperou por uma ligação livre. Os
+valores são expostos por ``snapshot()`` (endpoint /health/db-pool).
+"""
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+
+class PoolStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.wait_count += 1
+            self.wait_seconds_total += seconds
+            if seconds > self.wait_seconds_max:
+                self.wait_seconds_max = seconds
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "overflow_events": self.overflow_events,
+                "timeouts": self.timeouts,
+                "wait_count": self.wait_count,
+                "wait_seconds_total": round(self.wait_seconds_total, 6),
+                "wait_seconds_avg": round(self.wait_seconds_total / self.wait_count, 6) if self.wait_count else 0.0,
+                "wait_seconds_max": round(self.wait_seconds_max, 6),
+            }
+
+
+class _InstrumentedPoolMixin:
+    """Mede o tempo de espera por uma ligação e deteta overflow/timeouts."""
+
+    stats: PoolStats = None
+
+    def _do_get(self):
+        overflow_before = self.overflow()
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.incr("timeouts")
+            self.stats.record_wait(time.perf_counter() - start)
+            raise
+        self.stats.record_wait(time.perf_counter() - start)
+        if self.overflow() > max(overflow_before, 0):
+            self.stats.incr("overflow_events")
+        return conn
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncAdaptedQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrument(engine) -> PoolStats:
+    """Liga os contadores de eventos ao pool do engine e devolve as estatísticas."""
+    pool = engine.pool
+    stats = getattr(pool, "stats", None) or PoolStats()
+    pool.stats = stats
+
+    event.listen(pool, "checkout", lambda *args: stats.incr("checkouts"))
+    event.listen(pool, "checkin", lambda *args: stats.incr("checkins"))
+    event.listen(pool, "connect", lambda *args: stats.incr("connects"))
+    event.listen(pool, "invalidate", lambda *args: stats.incr("invalidations"))
+    event.listen(pool, "soft_invalidate", lambda *args: stats.incr("invalidations"))
+    return stats
+
+
+def snapshot(engine, stats: PoolStats) -> dict:
+    """Estado atual do pool (ligações em uso, overflow) mais os contadores."""
+    pool = engine.pool
+    data = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        data.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "timeout": pool.timeout(),
+        })
+    data.update(stats.as_dict())
+    return data
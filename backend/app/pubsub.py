@@ -0,0 +1,73 @@
+"""Pub/sub em memória para entregar mensagens de chat em tempo real.
+
+crud.create_message publica cada mensagem nova no tópico da conversa e os
+WebSockets abertos para essa conversa recebem-na sem fazer polling. O fan-out
+é local ao processo: com vários workers cada um só entrega as mensagens
+criadas por si. Os clientes recuperam o resto com o GET das mensagens
+(since_id) depois de enviar e num polling lento enquanto o socket está aberto
+(app/request-chat.tsx), por isso com vários workers uma mensagem de outro
+worker chega com esse atraso e não em tempo real.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+# Mensagens em espera por subscritor; um cliente lento perde as mais antigas
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class Subscription:
+    def __init__(self, topic: str, loop: asyncio.AbstractEventLoop):
+        self.topic = topic
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def _put(self, payload):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(payload)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, topic: str) -> Subscription:
+        """Cria uma subscrição; tem de ser chamado dentro do event loop."""
+        subscription = Subscription(topic, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscriptions.get(subscription.topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[subscription.topic]
+
+    def publish(self, topic: str, payload):
+        """Entrega payload a todos os subscritores do tópico.
+
+        Pode ser chamado a partir de qualquer thread (os handlers sync correm no
+        threadpool); a entrega é agendada no event loop de cada subscritor.
+        """
+        with self._lock:
+            subscribers = list(self._subscriptions.get(topic, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, payload)
+            except RuntimeError:
+                # Event loop já fechado
+                self.unsubscribe(subscription)
+
+
+broker = Broker()
+
+def request_topic(request_id: int) -> str:
+    return f"request:{request_id}"
@@ -0,0 +1,128 @@
+"""Corpo dos endpoints de leitura partilhados pelas rotas sync e async.
+
+Cada função recebe uma Session sync e devolve a Response: main.py chama-as
+diretamente e async_routes.py através de AsyncSession.run_sync, por isso as
+duas versões das rotas não divergem. Nas rotas em cache a query está num
+load_* separado: as rotas async chamam-no com run_sync e fazem o lookup/store
+da cache fora do event loop (o backend redis é bloqueante).
+
+As leituras servidas por uma réplica não são guardadas na cache: a réplica
+pode ainda não ter a escrita que deu origem à versão atual das tags.
+"""
+import logging
+
+from fastapi import Request, Response
+from sqlalchemy.orm import Session
+
+from app import crud, cache, schemas, serialization
+from app.database import is_replica
+from app.pagination import cursor_headers
+
+logger = logging.getLogger(__name__)
+
+
+def _page(items: list, last_id, count: int, limit: int) -> Response:
+    return serialization.ORJSONResponse(
+        items, headers=cursor_headers(crud.next_cursor(last_id, count, limit)),
+    )
+
+
+def cached(db: Session, request: Request, tags: list, load, **params) -> Response:
+    """Resposta em cache para o pedido, ou load(db, **params) -> (conteúdo, headers) guardado."""
+    entry = cache.lookup(request, tags)
+    if entry is None:
+        content, headers = load(db, **params)
+        entry = cache.store(request, tags, content, headers, cacheable=not is_replica(db))
+    return cache.respond(request, entry)
+
+
+def load_catalogue(
+    db: Session,
+    municipio: str = None,
+    status: schemas.CopyStatus = None,
+    author: str = None,
+    owner_id: int = None,
+    after: int = None,
+    limit: int = crud.DEFAULT_PAGE_SIZE,
+):
+    grouped, cursor = crud.get_catalogue(
+        db=db, municipio=municipio, status=status, author=author,
+        owner_id=owner_id, after=after, limit=limit,
+    )
+    return grouped, cursor_headers(cursor)
+
+
+def catalogue(db: Session, request: Request, **params) -> Response:
+    return cached(db, request, ["catalogue"], load_catalogue, **params)
+
+
+def load_owner_books(
+    db: Session,
+    user_id: int,
+    status: schemas.CopyStatus = None,
+    after: int = None,
+    limit: int = crud.DEFAULT_PAGE_SIZE,
+):
+    rows = crud.get_owner_books(db, user_id, status=status, after=after, limit=limit)
+    last_id = rows[-1].copy_id if rows else None
+    books = [dict(row._mapping) for row in rows]
+    logger.debug("owner books loaded", extra={"user_id": user_id, "count": len(books)})
+    return books, cursor_headers(crud.next_cursor(last_id, len(rows), limit))
+
+
+def owner_books(db: Session, request: Request, user_id: int, **params) -> Response:
+    return cached(db, request, [cache.owner_tag(user_id)], load_owner_books, user_id=user_id, **params)
+
+
+def load_copies(
+    db: Session,
+    status: schemas.CopyStatus = None,
+    location: str = None,
+    owner_id: int = None,
+    author: str = None,
+    after: int = None,
+    limit: int = crud.DEFAULT_PAGE_SIZE,
+):
+    rows = crud.get_copy_rows(
+        db=db, status=status, location=location, owner_id=owner_id,
+        author=author, after=after, limit=limit,
+    )
+    last_id = rows[-1].copy_id if rows else None
+    return (
+        [serialization.copy_from_row(row) for row in rows],
+        cursor_headers(crud.next_cursor(last_id, len(rows), limit)),
+    )
+
+
+def copies(db: Session, request: Request, **params) -> Response:
+    return cached(db, request, ["copies"], load_copies, **params)
+
+
+def requests(
+    db: Session,
+    status: schemas.RequestStatus = None,
+    requester_id: int = None,
+    copy_id: int = None,
+    after: int = None,
+    limit: int = crud.DEFAULT_PAGE_SIZE,
+) -> Response:
+    rows = crud.get_request_rows(
+        db=db, status=status, requester_id=requester_id, copy_id=copy_id,
+        after=after, limit=limit,
+    )
+    last_id = rows[-1].request_id if rows else None
+    return _page([serialization.request_from_row(row) for row in rows], last_id, len(rows), limit)
+
+
+def incoming_requests(
+    db: Session,
+    user_id: int,
+    status: schemas.RequestStatus = None,
+    after: int = None,
+    limit: int = crud.DEFAULT_PAGE_SIZE,
+) -> Response:
+    # Requests for copies owned by this user, with requester and book in one query
+    rows = crud.get_incoming_requests(db, user_id, status=status, after=after, limit=limit)
+    incoming = [dict(row._mapping) for row in rows]
+    logger.debug("incoming requests loaded", extra={"user_id": user_id, "count": len(incoming)})
+    return _page(incoming, rows[-1].id if rows else None, len(rows), limit)
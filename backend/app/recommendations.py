@@ -0,0 +1,204 @@
+"""Recomendações de livros por user, calculadas em batch com NumPy e SciPy.
+
+Dois sinais, combinados num score por (user, livro):
+
+1. géneros: os livros não têm género, por isso o perfil de um livro é a soma
+   dos User.genres de quem o teve (owner atual, owner original e quem o
+   recebeu numa transferência); o sinal é o cosseno entre os géneros do user
+   e esse perfil
+2. co-transferências ("quem recebeu X também recebeu Y"): com R a matriz
+   users x livros recebidos, o sinal de um user é (R_u . R^T) . R, ou seja,
+   os livros recebidos pelos users que receberam os mesmos livros que ele,
+   normalizado para [0, 1]
+
+score = RECOMMENDATIONS_GENRE_WEIGHT * géneros + RECOMMENDATIONS_COTRANSFER_WEIGHT * co-transferências
+
+Só são candidatos os livros com cópias AVAILABLE que o user nunca teve. Os
+RECOMMENDATIONS_PER_USER melhores ficam em user_recommendations; o endpoint
+/users/{id}/recommendations só junta essas linhas (índice (user_id, score))
+com as cópias disponíveis perto do user, sem calcular nada por pedido.
+
+R é esparsa (scipy.sparse, uma entrada por transferência recebida) e os users
+são processados em blocos de RECOMMENDATIONS_CHUNK_SIZE: as únicas matrizes
+densas são as de géneros e as de cada bloco, com chunk x candidatos entradas
+(float32).
+
+Correr periodicamente (ex. cron), a partir de backend/:
+    python -m app.recommendations
+"""
+import logging
+import os
+import time
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import insert
+
+from app import models
+from app.database import SessionLocal, engine
+
+RECOMMENDATIONS_PER_USER = int(os.getenv("RECOMMENDATIONS_PER_USER", "200"))
+RECOMMENDATIONS_CHUNK_SIZE = int(os.getenv("RECOMMENDATIONS_CHUNK_SIZE", "1000"))
+RECOMMENDATIONS_GENRE_WEIGHT = float(os.getenv("RECOMMENDATIONS_GENRE_WEIGHT", "1.0"))
+RECOMMENDATIONS_COTRANSFER_WEIGHT = float(os.getenv("RECOMMENDATIONS_COTRANSFER_WEIGHT", "1.0"))
+
+logger = logging.getLogger(__name__)
+
+
+def parse_genres(value) -> list:
+    """User.genres é uma string separada por vírgulas ("fiction,sci-fi")."""
+    return [genre.strip().lower() for genre in (value or "").split(",") if genre.strip()]
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def load(db):
+    """Lê da base de dados só o necessário: users, posses, transferências e candidatos."""
+    users = db.query(models.User.id, models.User.genres).order_by(models.User.id).all()
+    holdings = set(db.query(models.Copy.owner_id, models.Copy.book_id).all())
+    holdings.update(
+        db.query(models.Copy.original_owner_id, models.Copy.book_id)
+        .filter(models.Copy.original_owner_id.isnot(None)).all()
+    )
+    received = set(
+        db.query(models.CopyTransfer.to_user_id, models.Copy.book_id)
+        .join(models.Copy, models.CopyTransfer.copy_id == models.Copy.id).all()
+    )
+    holdings.update(received)
+    candidates = [
+        row.book_id for row in db.query(models.Copy.book_id)
+        .filter(models.Copy.status == models.CopyStatus.AVAILABLE).distinct()
+    ]
+    return users, holdings, received, candidates
+
+
+def compute(users, holdings, received, candidates, per_user: int = RECOMMENDATIONS_PER_USER,
+            chunk_size: int = RECOMMENDATIONS_CHUNK_SIZE):
+    """Gera (user_id, book_id, score, genre_score, cotransfer_score), os per_user
+    melhores livros de cada user."""
+    if not users or not candidates:
+        return
+    user_ids = np.array([user_id for user_id, _ in users])
+    user_index = {user_id: i for i, user_id in enumerate(user_ids.tolist())}
+    book_ids = sorted({book_id for _, book_id in holdings} | set(candidates))
+    book_index = {book_id: i for i, book_id in enumerate(book_ids)}
+    holdings = [(user_index[u], book_index[b]) for u, b in holdings if u in user_index]
+    received = [(user_index[u], book_index[b]) for u, b in received if u in user_index]
+
+    # Géneros: users x géneros (0/1) e perfil dos livros = soma dos géneros de quem os teve
+    user_genres = [parse_genres(genres) for _, genres in users]
+    vocabulary = {genre: i for i, genre in enumerate(sorted({g for genres in user_genres for g in genres}))}
+    ug = np.zeros((len(users), len(vocabulary)), dtype=np.float32)
+    for i, genres in enumerate(user_genres):
+        ug[i, [vocabulary[genre] for genre in genres]] = 1.0
+    bg = np.zeros((len(book_ids), len(vocabulary)), dtype=np.float32)
+    if holdings:
+        hu, hb = np.array(holdings).T
+        np.add.at(bg, hb, ug[hu])
+    ug = _normalize_rows(ug)
+
+    candidate_books = np.array(sorted(book_index[book_id] for book_id in set(candidates)))
+    candidate_pos = np.full(len(book_ids), -1)
+    candidate_pos[candidate_books] = np.arange(len(candidate_books))
+    candidate_genres = _normalize_rows(bg[candidate_books])
+
+    # Co-transferências: users x livros recebidos (só os livros que já foram transferidos)
+    received_books = sorted({b for _, b in received})
+    received_col = {b: i for i, b in enumerate(received_books)}
+    if received:
+        ru, rb = np.array([(u, received_col[b]) for u, b in received]).T
+    else:
+        ru = rb = np.array([], dtype=int)
+    r = sparse.csr_matrix(
+        (np.ones(len(ru), dtype=np.float32), (ru, rb)), shape=(len(users), len(received_books)),
+    )
+    # Colunas de r que são candidatos, e a posição de cada uma entre os candidatos
+    shared = [(received_col[b], candidate_pos[b]) for b in received_books if candidate_pos[b] >= 0]
+    r_cols = np.array([col for col, _ in shared], dtype=int)
+    r_pos = np.array([pos for _, pos in shared], dtype=int)
+    r_shared = r[:, r_cols]
+
+    held_by_user = {}
+    for u, b in holdings:
+        if candidate_pos[b] >= 0:
+            held_by_user.setdefault(u, []).append(candidate_pos[b])
+
+    k = min(per_user, len(candidate_books))
+    for start in range(0, len(users), chunk_size):
+        stop = min(start + chunk_size, len(users))
+        rows = np.arange(stop - start)
+
+        genre = ug[start:stop] @ candidate_genres.T
+        cotransfer = np.zeros_like(genre)
+        if len(shared):
+            chunk = r[start:stop]
+            similar = chunk @ r.T  # livros recebidos em comum com cada user (esparsa)
+            # Sem o próprio user: R_u . R_u é o número de livros que ele recebeu
+            own = np.asarray(chunk.sum(axis=1), dtype=np.float32)
+            cotransfer[:, r_pos] = (similar @ r_shared).toarray() - own * r_shared[start:stop].toarray()
+            peak = cotransfer.max(axis=1, keepdims=True)
+            cotransfer = np.divide(cotransfer, peak, out=np.zeros_like(cotransfer), where=peak > 0)
+
+        score = RECOMMENDATIONS_GENRE_WEIGHT * genre + RECOMMENDATIONS_COTRANSFER_WEIGHT * cotransfer
+        for u in range(start, stop):
+            if u in held_by_user:
+                score[u - start, held_by_user[u]] = -np.inf
+
+        top = np.argpartition(-score, k - 1, axis=1)[:, :k]
+        for row, columns in zip(rows, top):
+            for column in columns:
+                value = score[row, column]
+                if value > 0:
+                    yield (
+                        int(user_ids[start + row]), book_ids[candidate_books[column]], float(value),
+                        float(genre[row, column]), float(cotransfer[row, column]),
+                    )
+
+
+def store(db, recommendations, batch_size: int = 1000) -> int:
+    """Substitui a tabela user_recommendations numa só transação."""
+    db.query(models.UserRecommendation).delete(synchronize_session=False)
+    count = 0
+    batch = []
+    for user_id, book_id, score, genre_score, cotransfer_score in recommendations:
+        batch.append({
+            "user_id": user_id, "book_id": book_id, "score": score,
+            "genre_score": genre_score, "cotransfer_score": cotransfer_score,
+        })
+        if len(batch) >= batch_size:
+            db.execute(insert(models.UserRecommendation), batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        db.execute(insert(models.UserRecommendation), batch)
+        count += len(batch)
+    db.commit()
+    return count
+
+
+def run() -> int:
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        users, holdings, received, candidates = load(db)
+        count = store(db, compute(users, holdings, received, candidates))
+        logger.info("recommendations computed", extra={
+            "users": len(users),
+            "candidates": len(candidates),
+            "rows": count,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+        })
+        return count
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    from app import logging_config
+
+    logging_config.setup_logging()
+    models.Base.metadata.create_all(bind=engine)
+    run()
@@ -0,0 +1,64 @@
+"""Encaminhamento das leituras para réplicas, com read-your-writes.
+
+Com REPLICA_DATABASE_URLS definido, os endpoints de leitura (catálogo, listas,
+mensagens) usam get_read_db, que escolhe uma réplica em round-robin; as
+mutações continuam em get_db (primário). Como as réplicas podem estar
+atrasadas, um cliente que acabou de escrever deve ler do primário:
+
+- depois de uma mutação bem sucedida (POST/PUT/PATCH/DELETE) o middleware
+  devolve o instante da escrita no cookie noshelf_last_write e no header
+  X-Last-Write
+- durante READ_YOUR_WRITES_SECONDS, os pedidos que tragam esse cookie (ou o
+  header, para clientes sem cookies) leem do primário
+
+As respostas em cache (app/cache.py) são partilhadas entre clientes, por isso
+só as leituras do primário são guardadas (database.is_replica); uma réplica
+atrasada nunca fica em cache com a versão nova das tags. O /sync lê sempre do
+primário: o token é o now() da base de dados, que numa réplica não corresponde
+à posição de replay.
+
+O routing é testado em test_replicas.py. Para o ver à mão com duas bases
+SQLite (sem replicação):
+
+    DATABASE_URL=sqlite:///./primary.db REPLICA_DATABASE_URLS=sqlite:///./replica.db \\
+        uvicorn app.main:app
+"""
+import os
+import time
+
+from app.database import REPLICA_DATABASE_URLS
+
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+LAST_WRITE_COOKIE = "noshelf_last_write"
+LAST_WRITE_HEADER = "X-Last-Write"
+
+_SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def wants_primary(request) -> bool:
+    """True se o cliente escreveu há menos de READ_YOUR_WRITES_SECONDS."""
+    value = request.headers.get(LAST_WRITE_HEADER) or request.cookies.get(LAST_WRITE_COOKIE)
+    if not value:
+        return False
+    try:
+        last_write = int(value)
+    except ValueError:
+        return False
+    return _now_ms() - last_write < READ_YOUR_WRITES_SECONDS * 1000
+
+
+async def read_your_writes_middleware(request, call_next):
+    response = await call_next(request)
+    if REPLICA_DATABASE_URLS and request.method not in _SAFE_METHODS and response.status_code < 400:
+        last_write = str(_now_ms())
+        response.headers[LAST_WRITE_HEADER] = last_write
+        response.set_cookie(
+            LAST_WRITE_COOKIE, last_write,
+            max_age=max(int(READ_YOUR_WRITES_SECONDS), 1), httponly=True, samesite="lax",
+        )
+    return response
@@ -1,5 +1,5 @@
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 from typing import Optional
 from enum import Enum
@@ -41,6 +41,10 @@ class User(UserBase):
     class Config:
         orm_mode = True
 
+class LoginResponse(User):
+    access_token: str
+    token_type: str = "bearer"
+
 class BookBase(BaseModel):
     title: str
     author: str
@@ -55,10 +59,28 @@ class Book(BookBase):
     class Config:
         orm_mode = True
 
+class BookImportRow(BookBase):
+    # Uma linha da importação em massa: o livro e, opcionalmente, os dados da cópia
+    condition: BookCondition = BookCondition.OK
+    location: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+class BookImportResult(BaseModel):
+    row: int
+    status: str  # "ok" ou "error"
+    isbn: Optional[str] = None
+    book_id: Optional[int] = None
+    book_created: Optional[bool] = None
+    copy_id: Optional[int] = None
+    detail: Optional[str] = None
+
 class CopyBase(BaseModel):
     condition: BookCondition  # Should be BookCondition, not CopyStatus
     status: CopyStatus
     location: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 class CopyCreate(CopyBase):
     book_id: int
@@ -75,14 +97,15 @@ class Copy(CopyBase):
 
 class RequestBase(BaseModel):
     message: Optional[str] = None
-    status: Optional[RequestStatus] = RequestStatus.PENDING
 
+# Sem status: um request novo nasce sempre PENDING (ver crud.create_request)
 class RequestCreate(RequestBase):
     copy_id: int
     requester_id: int
 
 class Request(RequestBase):
     id: int
+    status: RequestStatus
     copy: Copy
     requester: User
     class Config:
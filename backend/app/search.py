@@ -0,0 +1,147 @@
+"""Índice invertido em memória para a pesquisa de livros (fallback sem Postgres).
+
+Em Postgres a pesquisa usa tsvector + índice GIN (crud.search_books). Noutros
+bancos (SQLite em desenvolvimento) este índice é construído a partir da tabela
+books na primeira pesquisa, atualizado por crud.create_book e reconstruído
+periodicamente (SEARCH_INDEX_TTL) para apanhar livros criados por outros
+workers.
+
+Cada termo da pesquisa é tratado como prefixo: o vocabulário está ordenado,
+por isso os termos com um dado prefixo são um intervalo encontrado com bisect.
+"""
+import bisect
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+
+from sqlalchemy.orm import Session
+from app import models
+
+SEARCH_INDEX_TTL = float(os.getenv("SEARCH_INDEX_TTL", "300"))
+
+# Peso de cada campo na pontuação
+TITLE_WEIGHT = 3.0
+AUTHOR_WEIGHT = 2.0
+ISBN_WEIGHT = 5.0
+# Um termo que só coincide como prefixo vale menos do que a palavra inteira
+PREFIX_FACTOR = 0.5
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_ISBN_RE = re.compile(r"[0-9][0-9\- ]*[0-9xX]")
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(text: str) -> list:
+    return _WORD_RE.findall(normalize(text))
+
+
+def isbn_token(isbn: str) -> str:
+    return "".join(ch for ch in (isbn or "") if ch.isalnum()).lower()
+
+
+def query_terms(query: str, fold_accents: bool = True) -> list:
+    """Termos da pesquisa; um ISBN com hífenes ou espaços conta como um só termo.
+
+    fold_accents=False mantém os acentos (a configuração 'simple' do Postgres
+    também não os remove do texto indexado).
+    """
+    if _ISBN_RE.fullmatch(query.strip()):
+        return [isbn_token(query)]
+    if not fold_accents:
+        return [word for word in re.findall(r"\w+", query.lower()) if word != "_"]
+    return tokenize(query)
+
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = defaultdict(dict)  # token -> {book_id: peso}
+        self._vocabulary = []  # tokens ordenados, para pesquisa por prefixo
+        self._books = {}  # book_id -> dados devolvidos na pesquisa
+        self._built_at = None
+
+    def _add_token(self, token: str, book_id: int, weight: float):
+        postings = self._postings[token]
+        if not postings:
+            bisect.insort(self._vocabulary, token)
+        postings[book_id] = postings.get(book_id, 0.0) + weight
+
+    def _add(self, book):
+        self._books[book.id] = {
+            "id": book.id,
+            "title": book.title,
+            "author": book.author,
+            "isbn": book.isbn,
+            "cover_url": book.cover_url,
+        }
+        for token in tokenize(book.title):
+            self._add_token(token, book.id, TITLE_WEIGHT)
+        for token in tokenize(book.author):
+            self._add_token(token, book.id, AUTHOR_WEIGHT)
+        token = isbn_token(book.isbn)
+        if token:
+            self._add_token(token, book.id, ISBN_WEIGHT)
+
+    def add(self, book):
+        """Indexa um livro novo (só se o índice já estiver construído)."""
+        with self._lock:
+            if self._built_at is not None and book.id not in self._books:
+                self._add(book)
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def _ensure_built(self, db: Session):
+        if self._built_at is not None and time.monotonic() - self._built_at < SEARCH_INDEX_TTL:
+            return
+        rows = db.query(
+            models.Book.id, models.Book.title, models.Book.author,
+            models.Book.isbn, models.Book.cover_url,
+        ).all()
+        self._postings = defaultdict(dict)
+        self._vocabulary = []
+        self._books = {}
+        for row in rows:
+            self._add(row)
+        self._built_at = time.monotonic()
+
+    def _match_term(self, term: str) -> dict:
+        scores = {}
+        start = bisect.bisect_left(self._vocabulary, term)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(term):
+                break
+            factor = 1.0 if token == term else PREFIX_FACTOR
+            for book_id, weight in self._postings[token].items():
+                scores[book_id] = max(scores.get(book_id, 0.0), weight * factor)
+        return scores
+
+    def search(self, db: Session, query: str, limit: int = 20) -> list:
+        terms = query_terms(query)
+        if not terms:
+            return []
+        with self._lock:
+            self._ensure_built(db)
+            # Todos os termos têm de coincidir (AND); a pontuação é a soma
+            scores = None
+            for term in terms:
+                matched = self._match_term(term)
+                if scores is None:
+                    scores = matched
+                else:
+                    scores = {book_id: scores[book_id] + score for book_id, score in matched.items() if book_id in scores}
+                if not scores:
+                    return []
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            return [dict(self._books[book_id], rank=score) for book_id, score in ranked]
+
+
+index = SearchIndex()
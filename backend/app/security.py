@@ -0,0 +1,116 @@
+"""Hashing de passwords com scrypt (memory-hard, hashlib da stdlib).
+
+Formato guardado em users.password:
+    scrypt$<n>$<r>$<p>$<salt base64>$<hash base64>
+
+O custo é configurável por variáveis de ambiente (PASSWORD_SCRYPT_N, _R, _P).
+Quando os parâmetros mudam, needs_rehash() devolve True para os hashes antigos
+e o login volta a gravar a password com o custo novo. Passwords antigas ainda
+em texto simples são aceites e migradas da mesma forma no próximo login.
+
+As versões async correm num pool de threads próprio e limitado
+(PASSWORD_WORKERS), para não bloquear o event loop nem ocupar a threadpool
+dos endpoints; o scrypt do OpenSSL liberta o GIL, por isso escala com os
+cores. Acima de PASSWORD_MAX_PENDING operações em espera é lançado
+PasswordBusy (o endpoint responde 503) em vez de acumular uma fila infinita.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(os.cpu_count() or 2)))
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", str(PASSWORD_WORKERS * 32)))
+
+PREFIX = "scrypt"
+
+
+class PasswordBusy(Exception):
+    """Demasiadas operações de hashing em espera."""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode("utf-8"), salt=salt, n=n, r=r, p=p,
+        maxmem=2 * 128 * n * r * p + 1024 * 1024, dklen=HASH_BYTES,
+    )
+
+
+def hash_password(password: str) -> str:
+    salt = os.urandom(SALT_BYTES)
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"{PREFIX}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+def _parse(stored: str):
+    try:
+        prefix, n, r, p, salt, digest = stored.split("$")
+        if prefix != PREFIX:
+            return None
+        return int(n), int(r), int(p), base64.b64decode(salt), base64.b64decode(digest)
+    except ValueError:
+        return None
+
+
+def is_hashed(stored: str) -> bool:
+    return bool(stored) and _parse(stored) is not None
+
+
+def verify_password(password: str, stored: str) -> bool:
+    if not stored:
+        return False
+    parsed = _parse(stored)
+    if parsed is None:
+        if stored.startswith(PREFIX + "$"):
+            # Hash scrypt mal formado: falha, nunca é comparado como texto simples
+            return False
+        # Password legada em texto simples
+        return hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+    n, r, p, salt, digest = parsed
+    try:
+        return hmac.compare_digest(_scrypt(password, salt, n, r, p), digest)
+    except ValueError:
+        # Parâmetros inválidos (ex. n que não é potência de 2)
+        return False
+
+
+def needs_rehash(stored: str) -> bool:
+    parsed = _parse(stored) if stored else None
+    if parsed is None:
+        return True
+    n, r, p, salt, digest = parsed
+    return (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P) or len(digest) != HASH_BYTES
+
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="password")
+_pending = threading.BoundedSemaphore(PASSWORD_MAX_PENDING)
+
+
+async def _offload(fn, *args):
+    if not _pending.acquire(blocking=False):
+        raise PasswordBusy()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _pending.release()
+
+
+async def hash_password_async(password: str) -> str:
+    return await _offload(hash_password, password)
+
+
+async def verify_password_async(password: str, stored: str) -> bool:
+    return await _offload(verify_password, password, stored)
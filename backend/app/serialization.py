@@ -0,0 +1,69 @@
+"""Serialização rápida das listas: linhas projetadas -> dicts -> JSON (orjson).
+
+O caminho normal (response_model com schemas.Copy/schemas.Request) carrega os
+objetos ORM com as relações, valida cada um com o Pydantic (recursivamente,
+Book e User incluídos) e só depois o jsonable_encoder + json.dumps gera o
+JSON. Aqui as queries só leem as colunas necessárias (crud.get_copy_rows /
+get_request_rows), as linhas são moldadas em dicts com a mesma forma
+aninhada dos schemas e o orjson gera os bytes diretamente.
+"""
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+
+def _default(value):
+    # Tipos que o orjson não conhece (ex. modelos Pydantic)
+    return jsonable_encoder(value)
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class ORJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def _user(row, prefix: str) -> dict:
+    return {
+        "name": getattr(row, f"{prefix}_name"),
+        "email": getattr(row, f"{prefix}_email"),
+        "city": getattr(row, f"{prefix}_city"),
+        "country": getattr(row, f"{prefix}_country"),
+        "genres": getattr(row, f"{prefix}_genres"),
+        "id": getattr(row, f"{prefix}_id"),
+    }
+
+
+def copy_from_row(row) -> dict:
+    """Mesma forma que schemas.Copy, a partir de uma linha de crud.get_copy_rows."""
+    return {
+        "condition": row.copy_condition,
+        "status": row.copy_status,
+        "location": row.copy_location,
+        "latitude": row.copy_latitude,
+        "longitude": row.copy_longitude,
+        "id": row.copy_id,
+        "book": {
+            "title": row.book_title,
+            "author": row.book_author,
+            "isbn": row.book_isbn,
+            "cover_url": row.book_cover_url,
+            "id": row.book_id,
+        },
+        "owner": _user(row, "owner"),
+        "original_owner_id": row.copy_original_owner_id,
+    }
+
+
+def request_from_row(row) -> dict:
+    """Mesma forma que schemas.Request, a partir de uma linha de crud.get_request_rows."""
+    return {
+        "message": row.request_message,
+        "status": row.request_status,
+        "id": row.request_id,
+        "copy": copy_from_row(row),
+        "requester": _user(row, "requester"),
+    }
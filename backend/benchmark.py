@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Benchmark da API: cria um dataset sintético e mede cada endpoint em processo.
+
+1. Cria users, livros, cópias, requests, mensagens e transferências numa base
+   de dados própria (SQLite por omissão, ou um Postgres local com --database-url)
+2. Chama os endpoints através da app FastAPI (TestClient, sem servidor)
+3. Mostra por endpoint: pedidos/s, p50/p95/p99 (ms) e queries SQL por pedido,
+   e os logins/s por worker de hashing (cenário login, ver app/security.py)
+4. Com --serialization compara, para uma página de cópias e de requests, o
+   caminho ORM -> Pydantic -> json com o caminho projetado -> dict -> orjson
+
+O dataset é determinístico (--seed), por isso duas corridas no mesmo commit
+são comparáveis. Com --fail-p95-ms e/ou --fail-queries o script sai com
+código 1 se algum endpoint passar o limite (para correr antes do deploy).
+
+Uso (a partir de backend/):
+    python benchmark.py
+    python benchmark.py --users 500 --books 5000 --iterations 300 --fail-p95-ms 50
+    python benchmark.py --database-url postgresql://localhost/noshelf_bench --reset
+    python benchmark.py --only books,incoming-requests --json results.json
+    python benchmark.py --only login --concurrency 8 --iterations 500
+    python benchmark.py --only copies,requests --serialization
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MUNICIPALITIES = [
+    "Almada", "Amadora", "Barreiro", "Cascais", "Lisboa (capital)", "Loures",
+    "Odivelas", "Oeiras", "Seixal", "Setúbal", "Sintra",
+]
+AUTHORS = [
+    "Saramago", "Pessoa", "Eça de Queirós", "Crichton", "Le Guin", "Tolkien",
+    "Austen", "Orwell", "Atwood", "Murakami", "Borges", "Calvino",
+]
+WORDS = [
+    "lost", "world", "night", "river", "city", "garden", "memorial", "convent",
+    "blindness", "dream", "shadow", "ocean", "winter", "letters", "house", "war",
+]
+GENRES = ["fiction", "adventure", "history", "poetry", "science", "fantasy"]
+PASSWORD = "123456"
+
+# As coordenadas das cópias são espalhadas à volta de Lisboa
+LISBON = (38.72, -9.14)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark dos endpoints da API NoShelf")
+    parser.add_argument("--database-url", default="sqlite:///./benchmark.db",
+                        help="base de dados do benchmark (é recriada)")
+    parser.add_argument("--reset", action="store_true",
+                        help="obrigatório para recriar as tabelas numa base de dados que não seja SQLite")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--books", type=int, default=2000)
+    parser.add_argument("--copies-per-book", type=int, default=2, help="máximo de cópias por livro")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=200, help="pedidos medidos por endpoint")
+    parser.add_argument("--warmup", type=int, default=10, help="pedidos não medidos por endpoint")
+    parser.add_argument("--concurrency", type=int, default=1, help="pedidos em paralelo")
+    parser.add_argument("--cache", action="store_true", help="mantém a cache de respostas ligada")
+    parser.add_argument("--only", default="", help="lista de cenários separados por vírgulas")
+    parser.add_argument("--fail-p95-ms", type=float, default=None, help="falha se algum p95 passar este valor")
+    parser.add_argument("--fail-queries", type=float, default=None,
+                        help="falha se algum endpoint fizer mais queries por pedido do que isto")
+    parser.add_argument("--serialization", action="store_true",
+                        help="compara a serialização ORM/Pydantic com a projetada/orjson")
+    parser.add_argument("--page-size", type=int, default=500, help="tamanho da página no --serialization")
+    parser.add_argument("--json", dest="json_path", default=None, help="grava os resultados em JSON")
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    """Tem de correr antes de importar a app (a configuração é lida no import)."""
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("AUTH_ALLOW_RANDOM_SECRET", "1")
+    if not args.cache:
+        os.environ["CACHE_BACKEND"] = "none"
+
+
+def recreate_database(args):
+    from app import models
+    from app.database import engine
+
+    if args.database_url.startswith("sqlite"):
+        models.Base.metadata.drop_all(bind=engine)
+    elif args.reset:
+        models.Base.metadata.drop_all(bind=engine)
+    else:
+        sys.exit("Recusado: use --reset para recriar as tabelas em " + args.database_url)
+    models.Base.metadata.create_all(bind=engine)
+
+
+def _insert(db, model, rows):
+    from sqlalchemy import insert
+
+    if not rows:
+        return []
+    return db.execute(
+        insert(model).returning(model.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+
+
+def seed_dataset(args, rng):
+    """Preenche a base de dados e devolve os ids usados pelos cenários."""
+    from app import geo, models, security
+    from app.database import SessionLocal
+
+    # Um só hash para todos (o custo do scrypt tornaria o seed lento)
+    password_hash = security.hash_password(PASSWORD)
+    db = SessionLocal()
+    try:
+        user_rows = [{
+            "name": f"Bench User {i}",
+            "email": f"bench{i}@test.com",
+            "password": password_hash,
+            "city": rng.choice(MUNICIPALITIES),
+            "country": "Portugal",
+            "genres": ",".join(rng.sample(GENRES, 2)),
+        } for i in range(args.users)]
+        user_ids = _insert(db, models.User, user_rows)
+        user_city = {user_id: row["city"] for user_id, row in zip(user_ids, user_rows)}
+
+        book_ids = _insert(db, models.Book, [{
+            "title": " ".join(rng.sample(WORDS, 3)).title(),
+            "author": rng.choice(AUTHORS),
+            "isbn": f"bench-{i:08d}",
+        } for i in range(args.books)])
+
+        copy_rows = []
+        for book_id in book_ids:
+            for _ in range(rng.randint(1, args.copies_per_book)):
+                owner_id = rng.choice(user_ids)
+                latitude = LISBON[0] + rng.uniform(-0.3, 0.3)
+                longitude = LISBON[1] + rng.uniform(-0.3, 0.3)
+                copy_rows.append({
+                    "book_id": book_id,
+                    "owner_id": owner_id,
+                    "original_owner_id": owner_id,
+                    "condition": rng.choice(list(models.BookCondition)),
+                    "status": models.CopyStatus.AVAILABLE,
+                    "location": user_city[owner_id],
+                    "latitude": latitude,
+                    "longitude": longitude,
+                    "geohash": geo.encode(latitude, longitude),
+                })
+        copy_ids = _insert(db, models.Copy, copy_rows)
+        copy_owner = {copy_id: row["owner_id"] for copy_id, row in zip(copy_ids, copy_rows)}
+
+        # Requests: maioria PENDING, alguns COMPLETED (com a transferência no ledger)
+        request_rows, transfer_rows, seen = [], [], set()
+        for _ in range(args.requests):
+            copy_id = rng.choice(copy_ids)
+            requester_id = rng.choice(user_ids)
+            if requester_id == copy_owner[copy_id] or (copy_id, requester_id) in seen:
+                continue
+            seen.add((copy_id, requester_id))
+            status = models.RequestStatus.COMPLETED if rng.random() < 0.15 else models.RequestStatus.PENDING
+            request_rows.append({
+                "copy_id": copy_id,
+                "requester_id": requester_id,
+                "status": status,
+                "message": "benchmark",
+            })
+        request_ids = _insert(db, models.Request, request_rows)
+        for request_id, row in zip(request_ids, request_rows):
+            if row["status"] == models.RequestStatus.COMPLETED:
+                transfer_rows.append({
+                    "copy_id": row["copy_id"],
+                    "request_id": request_id,
+                    "from_user_id": copy_owner[row["copy_id"]],
+                    "to_user_id": row["requester_id"],
+                })
+        _insert(db, models.CopyTransfer, transfer_rows)
+
+        message_rows = []
+        for _ in range(args.messages if request_rows else 0):
+            index = rng.randrange(len(request_rows))
+            row = request_rows[index]
+            message_rows.append({
+                "request_id": request_ids[index],
+                "sender_id": rng.choice([row["requester_id"], copy_owner[row["copy_id"]]]),
+                "content": " ".join(rng.sample(WORDS, 5)),
+            })
+        _insert(db, models.Message, message_rows)
+        db.commit()
+    finally:
+        db.close()
+
+    return {"users": user_ids, "copies": copy_ids, "requests": request_ids, "books": len(book_ids)}
+
+
+def build_scenarios(ids, rng):
+    """Cada cenário devolve (método, url, kwargs) para um pedido."""
+    users, copies, requests = ids["users"], ids["copies"], ids["requests"] or [0]
+
+    def get(url):
+        return "GET", url, {}
+
+    return {
+        "books": lambda: get("/books"),
+        "books-municipio": lambda: get(f"/books?municipio={rng.choice(MUNICIPALITIES)}"),
+        "books-search": lambda: get(f"/books/search?q={rng.choice(WORDS)[:4]}"),
+        "books-nearby": lambda: get(
+            f"/books/nearby?lat={LISBON[0] + rng.uniform(-0.2, 0.2):.4f}"
+            f"&lon={LISBON[1] + rng.uniform(-0.2, 0.2):.4f}&radius_km=5"
+        ),
+        "user-books": lambda: get(f"/users/{rng.choice(users)}/books"),
+        "incoming-requests": lambda: get(f"/users/{rng.choice(users)}/incoming-requests"),
+        "outgoing-requests": lambda: get(f"/users/{rng.choice(users)}/outgoing-requests"),
+        "transferred-books": lambda: get(f"/users/{rng.choice(users)}/transferred-books"),
+        "user-transfers": lambda: get(f"/users/{rng.choice(users)}/transfers"),
+        "dashboard": lambda: get(f"/users/{rng.choice(users)}/dashboard"),
+        "copies": lambda: get("/copies"),
+        "copy-provenance": lambda: get(f"/copies/{rng.choice(copies)}/provenance"),
+        "requests": lambda: get("/requests"),
+        "messages": lambda: get(f"/requests/{rng.choice(requests)}/messages"),
+        "login": lambda: (
+            "POST",
+            "/login",
+            {"json": {"email": f"bench{rng.randrange(len(users))}@test.com", "password": PASSWORD}},
+        ),
+        "send-message": lambda: (
+            "POST",
+            f"/requests/{rng.choice(requests)}/messages",
+            {"params": {"content": "benchmark", "sender_id": rng.choice(users)}},
+        ),
+    }
+
+
+def percentile(samples, pct):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[pct - 1]
+
+
+def run_scenario(client, make_call, args):
+    from app import metrics
+
+    for _ in range(args.warmup):
+        method, url, kwargs = make_call()
+        client.request(method, url, **kwargs)
+
+    calls = [make_call() for _ in range(args.iterations)]
+
+    def timed(call):
+        method, url, kwargs = call
+        start = time.perf_counter()
+        response = client.request(method, url, **kwargs)
+        return time.perf_counter() - start, response.status_code
+
+    queries_before = metrics.registry.queries_total
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(timed, calls))
+    elapsed = time.perf_counter() - start
+    queries = metrics.registry.queries_total - queries_before
+
+    latencies = sorted(seconds * 1000 for seconds, _ in results)
+    errors = sum(1 for _, status in results if status >= 400)
+    return {
+        "requests": len(results),
+        "errors": errors,
+        "rps": round(len(results) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2),
+        "queries_per_request": round(queries / len(results), 2),
+    }
+
+
+def print_report(results):
+    header = f"{'endpoint':<20} {'n':>5} {'err':>4} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'queries':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        print(
+            f"{name:<20} {result['requests']:>5} {result['errors']:>4} {result['rps']:>8} "
+            f"{result['p50_ms']:>8} {result['p95_ms']:>8} {result['p99_ms']:>8} {result['max_ms']:>8} "
+            f"{result['queries_per_request']:>8}"
+        )
+
+
+def print_login_throughput(results, args):
+    from app import security
+
+    if "login" not in results:
+        return
+    # Os logins só escalam até ao número de workers de hashing (e de cores)
+    workers = min(args.concurrency, security.PASSWORD_WORKERS, os.cpu_count() or 1)
+    print(
+        f"\nlogin: {results['login']['rps']} logins/s com {workers} worker(s) de hashing "
+        f"-> {round(results['login']['rps'] / workers, 1)} logins/s por core "
+        f"(scrypt n={security.SCRYPT_N}, r={security.SCRYPT_R}, p={security.SCRYPT_P})"
+    )
+
+
+def compare_serialization(args):
+    """Tempo por página: caminho antigo (ORM + Pydantic + json) vs lean (projeção + orjson)."""
+    import json as stdlib_json
+    from fastapi.encoders import jsonable_encoder
+    from app import crud, schemas, serialization
+    from app.database import SessionLocal
+
+    def orm_copies(db):
+        copies = crud.get_copies(db, limit=args.page_size)
+        return stdlib_json.dumps(jsonable_encoder(
+            [schemas.Copy.model_validate(copy, from_attributes=True) for copy in copies]
+        )).encode()
+
+    def lean_copies(db):
+        rows = crud.get_copy_rows(db, limit=args.page_size)
+        return serialization.dumps([serialization.copy_from_row(row) for row in rows])
+
+    def orm_requests(db):
+        requests = crud.get_requests(db, limit=args.page_size)
+        return stdlib_json.dumps(jsonable_encoder(
+            [schemas.Request.model_validate(request, from_attributes=True) for request in requests]
+        )).encode()
+
+    def lean_requests(db):
+        rows = crud.get_request_rows(db, limit=args.page_size)
+        return serialization.dumps([serialization.request_from_row(row) for row in rows])
+
+    def timed(fn):
+        samples = []
+        for _ in range(max(args.iterations // 10, 5)):
+            db = SessionLocal()
+            try:
+                start = time.perf_counter()
+                fn(db)
+                samples.append((time.perf_counter() - start) * 1000)
+            finally:
+                db.close()
+        return statistics.median(samples)
+
+    print(f"\n=== SERIALIZAÇÃO (página de {args.page_size}, mediana em ms) ===")
+    results = {}
+    for name, old, lean in (("copies", orm_copies, lean_copies), ("requests", orm_requests, lean_requests)):
+        db = SessionLocal()
+        try:
+            same = stdlib_json.loads(old(db)) == stdlib_json.loads(lean(db))
+        finally:
+            db.close()
+        old_ms, lean_ms = timed(old), timed(lean)
+        results[name] = {"orm_ms": round(old_ms, 2), "lean_ms": round(lean_ms, 2), "same_output": same}
+        print(f"{name:<10} orm+pydantic {old_ms:>8.2f}   projeção+orjson {lean_ms:>8.2f}   "
+              f"{old_ms / lean_ms:>5.1f}x   {'output igual' if same else 'OUTPUT DIFERENTE'}")
+    return results
+
+
+def check_thresholds(results, args):
+    failures = []
+    for name, result in results.items():
+        if args.fail_p95_ms is not None and result["p95_ms"] > args.fail_p95_ms:
+            failures.append(f"{name}: p95 {result['p95_ms']} ms > {args.fail_p95_ms} ms")
+        if args.fail_queries is not None and result["queries_per_request"] > args.fail_queries:
+            failures.append(f"{name}: {result['queries_per_request']} queries/pedido > {args.fail_queries}")
+    return failures
+
+
+def main():
+    args = parse_args()
+    args.iterations = max(args.iterations, 1)
+    args.concurrency = max(args.concurrency, 1)
+    configure_environment(args)
+
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    rng = random.Random(args.seed)
+    print(f"=== DATASET ({args.database_url}) ===")
+    recreate_database(args)
+    start = time.perf_counter()
+    ids = seed_dataset(args, rng)
+    print(
+        f"✓ {len(ids['users'])} users, {ids['books']} livros, {len(ids['copies'])} cópias, "
+        f"{len(ids['requests'])} requests em {time.perf_counter() - start:.1f}s"
+    )
+
+    scenarios = build_scenarios(ids, rng)
+    only = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = set(only) - set(scenarios)
+    if unknown:
+        sys.exit(f"Cenários desconhecidos: {', '.join(sorted(unknown))} (disponíveis: {', '.join(scenarios)})")
+
+    print(f"\n=== ENDPOINTS ({args.iterations} pedidos, concorrência {args.concurrency}, tempos em ms) ===")
+    results = {}
+    with TestClient(app) as client:
+        for name, make_call in scenarios.items():
+            if only and name not in only:
+                continue
+            results[name] = run_scenario(client, make_call, args)
+    print_report(results)
+    print_login_throughput(results, args)
+    serialization_results = compare_serialization(args) if args.serialization else None
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"dataset": {key: len(value) if isinstance(value, list) else value
+                                   for key, value in ids.items()},
+                       "args": vars(args), "results": results,
+                       "serialization": serialization_results}, f, indent=2)
+
+    failures = check_thresholds(results, args)
+    for failure in failures:
+        print(f"✗ {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Fixtures dos testes em processo: a app FastAPI contra um SQLite temporário.
+
+A configuração da app é lida no import, por isso o ambiente é definido aqui,
+antes de qualquer teste importar app.main.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+_db_dir = tempfile.mkdtemp(prefix="noshelf-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ["AUTH_ALLOW_RANDOM_SECRET"] = "1"
+os.environ["CACHE_BACKEND"] = "none"
+os.environ["MAIL_ENABLED"] = "false"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "backend"))
+
+
+@pytest.fixture(scope="session", autouse=True)
+def sqlite_foreign_keys():
+    """Liga as foreign keys no SQLite (desligadas por omissão), como no Postgres."""
+    from sqlalchemy import event
+
+    from app.database import engine
+
+    @event.listens_for(engine, "connect")
+    def enable_foreign_keys(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+    engine.dispose()
+    yield
+
+
+@pytest.fixture
+def client():
+    """TestClient com as tabelas recriadas (cada teste começa com a base vazia)."""
+    from fastapi.testclient import TestClient
+
+    from app import models
+    from app.database import engine
+    from app.main import app
+
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def make_user(client):
+    """Regista um user e devolve a resposta do /register (com o id)."""
+    def make(index: int):
+        response = client.post("/register", json={
+            "name": f"User {index}",
+            "email": f"user{index}@test.com",
+            "password": "123456",
+            "city": "Almada",
+            "country": "Portugal",
+            "genres": "fiction",
+        })
+        assert response.status_code == 200, response.text
+        return response.json()
+    return make
+
+
+@pytest.fixture
+def make_copy(client):
+    """Cria um livro com uma cópia AVAILABLE do owner e devolve o copy_id."""
+    def make(owner_id: int, isbn: str, title: str = "Lost World"):
+        response = client.post(
+            f"/books?owner_id={owner_id}&municipio=Almada",
+            json={"title": title, "author": "Crichton", "isbn": isbn},
+        )
+        assert response.status_code == 200, response.text
+        books = client.get(f"/users/{owner_id}/books", params={"limit": 500}).json()
+        return next(book["copy_id"] for book in books if book["isbn"] == isbn)
+    return make
@@ -0,0 +1,14 @@
+import api from "@/hooks/use-api";
+
+// As listas da API são paginadas (keyset): segue o header x-next-cursor até à
+// última página e devolve todos os itens
+export async function fetchAllPages<T = any>(url: string, params: Record<string, any> = {}): Promise<T[]> {
+  const items: T[] = [];
+  let after: string | undefined;
+  do {
+    const response = await api.get(url, { params: { ...params, after } });
+    items.push(...response.data);
+    after = response.headers["x-next-cursor"];
+  } while (after);
+  return items;
+}
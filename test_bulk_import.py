@@ -0,0 +1,28 @@
+"""
+Linhas inválidas na importação em massa são erros dessa linha (nunca um 400
+do pedido inteiro): as outras linhas são importadas na mesma.
+"""
+
+
+def test_malformed_rows_are_reported_per_row(client, make_user):
+    owner = make_user(1)
+    rows = [
+        {"title": "Lost World", "author": "Crichton", "isbn": "9780000000001"},
+        {"title": "Numeric ISBN", "author": "Crichton", "isbn": 9780000000002},
+        "not an object",
+        {"title": "Off the map", "author": "Crichton", "isbn": "9780000000003", "latitude": 200, "longitude": 0},
+        {"title": "Jurassic Park", "author": "Crichton", "isbn": "9780000000004"},
+    ]
+    response = client.post("/books/import", params={"owner_id": owner["id"], "municipio": "Almada"}, json=rows)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["imported"] == 2
+    assert body["errors"] == 3
+    results = body["results"]
+    assert [result["status"] for result in results] == ["ok", "error", "error", "error", "ok"]
+    assert results[1]["isbn"] == "9780000000002"
+    assert results[2]["isbn"] is None
+    assert "latitude" in results[3]["detail"]
+
+    books = client.get(f"/users/{owner['id']}/books", params={"limit": 500}).json()
+    assert sorted(book["isbn"] for book in books) == ["9780000000001", "9780000000004"]
@@ -0,0 +1,30 @@
+"""
+Cache de respostas: as escritas invalidam as entradas das suas tags e uma
+leitura feita antes de uma invalidação não volta a guardar dados antigos.
+"""
+from app import cache
+
+
+def test_stale_store_after_invalidate_is_dropped():
+    backend = cache.MemoryCache()
+    entry = cache.CacheEntry(b"[]", cache.content_etag(b"[]"))
+    generation = backend.generation(["catalogue", "owner:1"])
+    backend.invalidate("owner:1")  # escrita concorrente depois da leitura
+    backend.set("/books?", entry, ["catalogue", "owner:1"], generation)
+    assert backend.get("/books?") is None
+
+    backend.set("/books?", entry, ["catalogue", "owner:1"], backend.generation(["catalogue", "owner:1"]))
+    assert backend.get("/books?") is entry
+
+
+def test_writes_invalidate_cached_catalogue(client, make_user, make_copy, monkeypatch):
+    monkeypatch.setattr(cache, "backend", cache.MemoryCache())
+    owner = make_user(1)
+    make_copy(owner["id"], "cache-1", title="First")
+    first = client.get("/books")
+    assert client.get("/books").headers["etag"] == first.headers["etag"]
+    assert "/books?" in cache.backend._entries
+
+    make_copy(owner["id"], "cache-2", title="Second")
+    assert "Second" in client.get("/books").text
+    assert "Second" in client.get(f"/users/{owner['id']}/books").text
@@ -0,0 +1,76 @@
+"""
+Teste de concorrência do ciclo de vida dos requests (em processo, sem servidor).
+
+1. Um owner adiciona um livro novo (cópia AVAILABLE)
+2. N requesters fazem request da mesma cópia ao mesmo tempo
+3. O mesmo requester repete o request -> 422 (já tem um request ativo)
+4. O owner aceita todos os requests ao mesmo tempo -> só 1 pode ser aceite (409 nos outros)
+5. O requester aceite confirma a entrega N vezes ao mesmo tempo -> só 1 passa (409 nas outras)
+6. A cópia tem de acabar AVAILABLE e com o requester aceite como owner
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+REQUESTERS = 6
+
+
+def run_concurrently(calls):
+    """Executa todas as chamadas ao mesmo tempo (barreira) e devolve as respostas."""
+    barrier = threading.Barrier(len(calls))
+
+    def call(fn):
+        barrier.wait()
+        return fn()
+
+    with ThreadPoolExecutor(max_workers=len(calls)) as executor:
+        return list(executor.map(call, calls))
+
+
+def test_concurrent_requests(client, make_user, make_copy):
+    owner = make_user(0)
+    requesters = [make_user(index) for index in range(1, REQUESTERS + 1)]
+    copy_id = make_copy(owner["id"], "stress-1")
+
+    # Requests concorrentes para a mesma cópia: todos são criados
+    responses = run_concurrently([
+        (lambda requester=requester: client.post("/requests", json={
+            "copy_id": copy_id,
+            "requester_id": requester["id"],
+            "message": "stress",
+        }))
+        for requester in requesters
+    ])
+    assert [response.status_code for response in responses] == [200] * REQUESTERS
+    request_ids = [response.json()["id"] for response in responses]
+
+    # Um segundo request ativo do mesmo requester é recusado
+    duplicate = client.post("/requests", json={"copy_id": copy_id, "requester_id": requesters[0]["id"]})
+    assert duplicate.status_code == 422
+
+    # Accepts concorrentes: só um pode ganhar
+    responses = run_concurrently([
+        (lambda request_id=request_id: client.put(f"/requests/{request_id}/accept"))
+        for request_id in request_ids
+    ])
+    codes = [response.status_code for response in responses]
+    assert codes.count(200) == 1
+    assert codes.count(409) == REQUESTERS - 1
+    accepted = request_ids[codes.index(200)]
+
+    # Confirmações concorrentes do mesmo request: só uma pode passar
+    responses = run_concurrently([
+        (lambda: client.put(f"/requests/{accepted}/confirm-delivery"))
+        for _ in requesters
+    ])
+    codes = [response.status_code for response in responses]
+    assert codes.count(200) == 1
+    assert codes.count(409) == REQUESTERS - 1
+
+    # Estado final: um só COMPLETED e a cópia transferida, de novo AVAILABLE
+    completed = client.get("/requests", params={"copy_id": copy_id, "status": "COMPLETED"}).json()
+    assert [request["id"] for request in completed] == [accepted]
+    new_owner_id = completed[0]["requester"]["id"]
+    books = client.get(f"/users/{new_owner_id}/books", params={"limit": 500}).json()
+    copy = next(book for book in books if book["copy_id"] == copy_id)
+    assert copy["status"] == "AVAILABLE"
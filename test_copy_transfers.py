@@ -0,0 +1,19 @@
+"""
+Um request COMPLETED tem uma linha no ledger copy_transfers: não pode ser
+cancelado (409) e a proveniência da cópia continua a apontar para ele.
+"""
+
+
+def test_completed_request_cannot_be_deleted(client, make_user, make_copy):
+    owner, requester = make_user(1), make_user(2)
+    copy_id = make_copy(owner["id"], "ledger-1")
+    request_id = client.post("/requests", json={"copy_id": copy_id, "requester_id": requester["id"]}).json()["id"]
+    assert client.put(f"/requests/{request_id}/accept").status_code == 200
+    assert client.put(f"/requests/{request_id}/confirm-delivery").status_code == 200
+
+    response = client.delete(f"/requests/{request_id}")
+    assert response.status_code == 409
+
+    provenance = client.get(f"/copies/{copy_id}/provenance").json()
+    assert provenance["current_owner_id"] == requester["id"]
+    assert [transfer["request_id"] for transfer in provenance["transfers"]] == [request_id]
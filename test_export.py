@@ -0,0 +1,32 @@
+"""
+/export precisa de um token: cada user só exporta as suas linhas e só um admin
+(AUTH_ADMIN_EMAILS) exporta tudo.
+"""
+import json
+
+
+def export_ids(client, dataset, user):
+    response = client.get(f"/export/{dataset}", headers={"Authorization": f"Bearer {user['access_token']}"})
+    assert response.status_code == 200, response.text
+    return [json.loads(line)["id"] for line in response.text.splitlines()]
+
+
+def test_export_is_scoped_to_the_caller(client, make_user, make_copy, monkeypatch):
+    from app import auth
+
+    owner, requester, outsider = make_user(1), make_user(2), make_user(3)
+    copy_id = make_copy(owner["id"], "export-1")
+    other_copy_id = make_copy(outsider["id"], "export-2")
+    request_id = client.post("/requests", json={"copy_id": copy_id, "requester_id": requester["id"]}).json()["id"]
+    message = client.post(f"/requests/{request_id}/messages", params={"content": "olá", "sender_id": requester["id"]})
+
+    assert client.get("/export/messages").status_code == 401
+    assert export_ids(client, "messages", requester) == [message.json()["id"]]
+    assert export_ids(client, "messages", owner) == [message.json()["id"]]
+    assert export_ids(client, "messages", outsider) == []
+    assert export_ids(client, "requests", outsider) == []
+    assert export_ids(client, "copies", owner) == [copy_id]
+
+    monkeypatch.setattr(auth, "AUTH_ADMIN_EMAILS", {outsider["email"]})
+    assert export_ids(client, "copies", outsider) == [copy_id, other_copy_id]
+    assert export_ids(client, "requests", outsider) == [request_id]
@@ -0,0 +1,34 @@
+"""
+A caixa de geo.bounding_box tem de conter o círculo inteiro, também em
+latitudes altas, onde a maior diferença de longitude fica do lado do polo.
+"""
+import math
+
+import pytest
+
+from app import geo
+
+
+def destination(lat, lon, bearing_deg, distance_km):
+    """Ponto a distance_km de (lat, lon) na direção bearing_deg (esfera)."""
+    delta = distance_km / geo.EARTH_RADIUS_KM
+    phi, lmb, theta = math.radians(lat), math.radians(lon), math.radians(bearing_deg)
+    phi2 = math.asin(math.sin(phi) * math.cos(delta) + math.cos(phi) * math.sin(delta) * math.cos(theta))
+    lmb2 = lmb + math.atan2(
+        math.sin(theta) * math.sin(delta) * math.cos(phi),
+        math.cos(delta) - math.sin(phi) * math.sin(phi2),
+    )
+    return math.degrees(phi2), math.degrees(lmb2)
+
+
+@pytest.mark.parametrize("lat, lon, radius_km", [
+    (38.72, -9.14, 50), (70.0, 20.0, 500), (80.0, -150.0, 800), (-75.0, 100.0, 1200), (60.0, 179.5, 300),
+])
+def test_bounding_box_contains_the_circle(lat, lon, radius_km):
+    min_lat, max_lat, min_lon, max_lon = geo.bounding_box(lat, lon, radius_km)
+    for bearing in range(360):
+        point_lat, point_lon = destination(lat, lon, bearing, radius_km * 0.999)
+        assert min_lat <= point_lat <= max_lat
+        # A caixa pode passar o antimeridiano: compara a longitude desenrolada
+        unwrapped = lon + (point_lon - lon + 180.0) % 360.0 - 180.0
+        assert min_lon <= unwrapped <= max_lon, (bearing, point_lat, point_lon)
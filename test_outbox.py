@@ -0,0 +1,105 @@
+"""
+Outbox de emails contra um servidor SMTP local (aiosmtpd):
+1. Um request novo grava o email do owner na outbox (PENDING)
+2. O worker envia-o ao servidor SMTP e marca-o SENT
+3. Com o servidor em baixo o job é reagendado com backoff e, esgotadas as
+   tentativas, fica FAILED
+"""
+import asyncio
+import socket
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("aiosmtpd")
+from aiosmtpd.controller import Controller
+from fastapi_mail import ConnectionConfig, FastMail
+
+from app import models, outbox
+from app.database import SessionLocal
+
+
+class Inbox:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def mailer(port: int) -> FastMail:
+    return FastMail(ConnectionConfig(
+        MAIL_USERNAME="", MAIL_PASSWORD="", MAIL_FROM="noshelf@test.com",
+        MAIL_SERVER="127.0.0.1", MAIL_PORT=port, MAIL_STARTTLS=False, MAIL_SSL_TLS=False,
+        USE_CREDENTIALS=False, VALIDATE_CERTS=False, TIMEOUT=5,
+    ))
+
+
+def jobs():
+    db = SessionLocal()
+    try:
+        return db.query(models.OutboxJob).order_by(models.OutboxJob.id).all()
+    finally:
+        db.close()
+
+
+def make_request(client, make_user, make_copy):
+    owner, requester = make_user(1), make_user(2)
+    copy_id = make_copy(owner["id"], "outbox-1")
+    response = client.post("/requests", json={"copy_id": copy_id, "requester_id": requester["id"]})
+    assert response.status_code == 200, response.text
+    return owner
+
+
+def test_worker_sends_pending_emails(client, make_user, make_copy):
+    owner = make_request(client, make_user, make_copy)
+    [job] = jobs()
+    assert job.status == models.OutboxStatus.PENDING
+    assert job.recipient == owner["email"]
+
+    inbox = Inbox()
+    port = free_port()
+    controller = Controller(inbox, hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        worker = outbox.Worker(mailer=mailer(port))
+        assert asyncio.run(worker.run_once()) == 1
+    finally:
+        controller.stop()
+
+    assert [envelope.rcpt_tos for envelope in inbox.messages] == [[owner["email"]]]
+    [job] = jobs()
+    assert job.status == models.OutboxStatus.SENT
+    assert job.sent_at is not None
+
+
+def test_failed_sends_back_off_then_fail(client, make_user, make_copy, monkeypatch):
+    monkeypatch.setattr(outbox, "OUTBOX_MAX_ATTEMPTS", 2)
+    make_request(client, make_user, make_copy)
+    worker = outbox.Worker(mailer=mailer(free_port()))  # nada à escuta nesta porta
+
+    assert asyncio.run(worker.run_once()) == 1
+    [job] = jobs()
+    assert job.status == models.OutboxStatus.PENDING
+    assert job.attempts == 1
+    assert job.last_error
+    # Reagendado para depois do backoff: ainda não é reclamado
+    assert asyncio.run(worker.run_once()) == 0
+
+    db = SessionLocal()
+    db.query(models.OutboxJob).update({
+        models.OutboxJob.next_attempt_at: job.next_attempt_at - timedelta(hours=2),
+    })
+    db.commit()
+    db.close()
+    assert asyncio.run(worker.run_once()) == 1
+    [job] = jobs()
+    assert job.status == models.OutboxStatus.FAILED
+    assert job.attempts == 2
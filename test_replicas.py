@@ -0,0 +1,97 @@
+"""
+Encaminhamento das leituras para uma réplica (um segundo ficheiro SQLite, com
+dados diferentes do primário para se ver quem respondeu):
+- sem escrita recente as leituras vão à réplica e não ficam em cache
+- com X-Last-Write (ou o cookie) recente vão ao primário
+- uma mutação devolve o header e o cookie de read-your-writes
+
+REPLICA_DATABASE_URLS é lido no import da app, por isso a réplica é ligada
+substituindo database.ReplicaSessionLocals (o que o import criaria com ela).
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+import pytest
+from fastapi import Response
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import cache, database, models, replicas
+
+
+@pytest.fixture
+def use_replica(client, monkeypatch):
+    """Liga a réplica (chamado depois de preparar os dados no primário)."""
+    engines = []
+
+    def enable():
+        engines.append(_replica_engine(monkeypatch))
+
+    yield enable
+    for engine in engines:
+        engine.dispose()
+
+
+def _replica_engine(monkeypatch):
+    path = os.path.join(tempfile.mkdtemp(prefix="noshelf-replica-"), "replica.db")
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    owner = models.User(name="Replica", email="replica@test.com", password="x", city="Almada", country="Portugal", genres="")
+    book = models.Book(title="Replica Book", author="Replica", isbn="replica-1")
+    session.add_all([owner, book])
+    session.flush()
+    session.add(models.Copy(
+        book_id=book.id, owner_id=owner.id, original_owner_id=owner.id,
+        condition=models.BookCondition.OK, status=models.CopyStatus.AVAILABLE, location="Almada",
+    ))
+    session.commit()
+    session.close()
+    monkeypatch.setattr(database, "ReplicaSessionLocals", [
+        sessionmaker(autocommit=False, autoflush=False, bind=engine, info={"replica": True}),
+    ])
+    monkeypatch.setattr(cache, "backend", cache.MemoryCache())
+    return engine
+
+
+def titles(response):
+    assert response.status_code == 200, response.text
+    return [copy["book"]["title"] for copy in response.json()]
+
+
+def test_reads_go_to_the_replica_unless_the_client_just_wrote(client, make_user, make_copy, use_replica):
+    owner = make_user(1)
+    make_copy(owner["id"], "primary-1", title="Primary Book")
+    use_replica()
+
+    assert titles(client.get("/copies")) == ["Replica Book"]
+    assert cache.backend._entries == {}  # leituras da réplica nunca ficam em cache
+
+    fresh = str(int(time.time() * 1000))
+    assert titles(client.get("/copies", headers={"X-Last-Write": fresh})) == ["Primary Book"]
+    assert titles(client.get("/copies", params={"limit": 10}, cookies={"noshelf_last_write": fresh})) == ["Primary Book"]
+    assert len(cache.backend._entries) == 2  # as do primário sim
+
+    stale = str(int(time.time() * 1000) - 60_000)
+    assert titles(client.get("/copies", params={"limit": 20}, headers={"X-Last-Write": stale})) == ["Replica Book"]
+    assert len(cache.backend._entries) == 2
+
+
+def test_mutations_set_the_last_write_marker(monkeypatch):
+    monkeypatch.setattr(replicas, "REPLICA_DATABASE_URLS", ["sqlite:///replica.db"])
+
+    class FakeRequest:
+        def __init__(self, method):
+            self.method = method
+
+    async def call_next(request):
+        return Response(status_code=200)
+
+    response = asyncio.run(replicas.read_your_writes_middleware(FakeRequest("POST"), call_next))
+    assert int(response.headers[replicas.LAST_WRITE_HEADER]) <= int(time.time() * 1000)
+    assert replicas.LAST_WRITE_COOKIE in response.headers["set-cookie"]
+
+    response = asyncio.run(replicas.read_your_writes_middleware(FakeRequest("GET"), call_next))
+    assert replicas.LAST_WRITE_HEADER not in response.headers
@@ -0,0 +1,35 @@
+"""
+O /sync incremental (com since) é paginado como o snapshot: seguindo o
+X-Next-Cursor com o mesmo since, o cliente recebe todas as alterações em
+páginas de no máximo `limit` linhas por lista.
+"""
+
+
+def test_incremental_sync_is_paginated(client, make_user, make_copy):
+    owner, requester = make_user(1), make_user(2)
+    token = client.get("/sync", params={"user_id": owner["id"]}).json()["token"]
+    copy_ids = [make_copy(owner["id"], f"sync-{index}", title=f"Sync {index}") for index in range(5)]
+    request_ids = [
+        client.post("/requests", json={"copy_id": copy_id, "requester_id": requester["id"]}).json()["id"]
+        for copy_id in copy_ids
+    ]
+
+    seen = {"books": set(), "copies": set(), "requests": set()}
+    params = {"user_id": owner["id"], "since": token, "limit": 2}
+    pages = 0
+    while True:
+        response = client.get("/sync", params=params)
+        assert response.status_code == 200, response.text
+        body = response.json()
+        pages += 1
+        for name in seen:
+            assert len(body[name]) <= 2
+            seen[name] |= {row["id"] for row in body[name]}
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["after"] = response.headers["X-Next-Cursor"]
+
+    assert pages == 3
+    assert seen["copies"] == set(copy_ids)
+    assert len(seen["books"]) == 5
+    assert seen["requests"] == set(request_ids)
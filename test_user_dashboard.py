@@ -0,0 +1,58 @@
+"""
+O read model user_dashboards (deltas aplicados por cada mutação) tem de ser
+igual ao dashboard recalculado de raiz (refresh=true).
+
+Fluxo:
+1. Owner tem uma cópia; dois requesters fazem request e trocam mensagens com ele
+2. O owner lê parte das mensagens, o request do segundo requester é cancelado
+3. O primeiro requester é aceite e confirma a entrega (a cópia muda de owner)
+"""
+
+
+def dashboard(client, user_id, refresh=False):
+    response = client.get(f"/users/{user_id}/dashboard", params={"refresh": refresh})
+    assert response.status_code == 200, response.text
+    body = response.json()
+    body.pop("updated_at")
+    return body
+
+
+def assert_matches_rebuild(client, *users):
+    for user in users:
+        incremental = dashboard(client, user["id"])
+        assert incremental == dashboard(client, user["id"], refresh=True), user["name"]
+
+
+def send(client, request_id, sender, content):
+    response = client.post(f"/requests/{request_id}/messages", params={"content": content, "sender_id": sender["id"]})
+    assert response.status_code == 200, response.text
+
+
+def test_dashboard_matches_rebuild_after_delivery(client, make_user, make_copy):
+    owner, first, second = make_user(1), make_user(2), make_user(3)
+    # Os dashboards já existem antes das mutações (os deltas são aplicados a estas linhas)
+    for user in (owner, first, second):
+        dashboard(client, user["id"])
+    copy_id = make_copy(owner["id"], "dashboard-1")
+
+    request_ids = []
+    for requester in (first, second):
+        response = client.post("/requests", json={"copy_id": copy_id, "requester_id": requester["id"]})
+        assert response.status_code == 200, response.text
+        request_ids.append(response.json()["id"])
+    send(client, request_ids[0], first, "ainda está disponível?")
+    send(client, request_ids[1], second, "também tenho interesse")
+    client.post(f"/users/{owner['id']}/dashboard/read-messages")
+    send(client, request_ids[0], owner, "sim")
+    send(client, request_ids[1], second, "posso ir buscar hoje")
+    send(client, request_ids[0], first, "combinado")
+    assert_matches_rebuild(client, owner, first, second)
+
+    assert client.delete(f"/requests/{request_ids[1]}").status_code == 200
+    assert_matches_rebuild(client, owner, first, second)
+
+    assert client.put(f"/requests/{request_ids[0]}/accept").status_code == 200
+    send(client, request_ids[0], owner, "estou à porta")
+    assert client.put(f"/requests/{request_ids[0]}/confirm-delivery").status_code == 200
+    assert_matches_rebuild(client, owner, first, second)
+    assert dashboard(client, owner["id"])["unread_messages"] == 0